@@ -0,0 +1,152 @@
+# `backup.py`
+#
+# Backups of the relational tables (the files in 'rdb_format', see `storage.py`), kept as a series of point-in-time generations.
+#
+# Each file is split into chunks at line boundaries chosen from the contents of the lines themselves
+# (a line ends a chunk when its checksum has the low CHUNK_BITS bits set to 0), so adding, changing or deleting
+# a row of a csv file only changes the chunk it is in. Each chunk is stored once, compressed, under the SHA-256 hash
+# of its contents ('chunks' folder), and each generation is just a list of chunk hashes for every file ('generations'
+# folder). A new backup therefore only stores the chunks which changed since the last backup.
+#
+# Only the last KEEP_GENERATIONS generations are kept; chunks which are no longer used by any generation are deleted.
+#
+# Backups can be listed/restored from the command line:
+#   python backup.py list
+#   python backup.py restore <generation> [file ...]
+
+# Libraries
+import os
+import sys
+import json
+import zlib
+import hashlib
+from datetime import datetime
+
+# Folder where backups are stored
+BACKUP_PATH = 'C:\\STMNU2\\data\\rdb_format\\BACKUP'
+# Folder where the files are restored to
+RDB_PATH = 'C:\\STMNU2\\data\\rdb_format'
+# Number of generations to keep
+KEEP_GENERATIONS = 30
+# A chunk ends after a row whose checksum has this many low bits set to 0 (i.e. on average every 2**8 = 256 rows)
+CHUNK_BITS = 8
+# Limits on the size of a chunk (in bytes)
+MIN_CHUNK_SIZE = 4*1024
+MAX_CHUNK_SIZE = 256*1024
+
+
+# Split `data` (contents of a file) into chunks. The boundaries only depend on the lines near them,
+# so the same lines give the same chunks no matter what was added or removed elsewhere in the file.
+def split_chunks(data):
+    mask = (1 << CHUNK_BITS) - 1
+    chunks = []
+    start = 0
+    position = 0
+    while position < len(data):
+        end = data.find(b'\n', position)
+        end = len(data) if end == -1 else end + 1
+        size = end - start
+        if (size >= MIN_CHUNK_SIZE and zlib.crc32(data[position:end]) & mask == 0) or size >= MAX_CHUNK_SIZE:
+            chunks.append(data[start:end])
+            start = end
+        position = end
+    if start < len(data):
+        chunks.append(data[start:])
+    return chunks
+
+
+# Path of the chunk with the hash `digest` (chunks are spread over sub-folders by the first two characters)
+def chunk_path(digest, backup_path=BACKUP_PATH):
+    return os.path.join(backup_path, 'chunks', digest[:2], digest)
+
+
+# Write `data` to `path` under a temporary name, then rename it into place
+def write_file(path, data):
+    with open(path + '.tmp', 'wb') as file:
+        file.write(data)
+    os.replace(path + '.tmp', path)
+
+
+# Store `chunk` (if it isn't already stored) and return its hash
+def store_chunk(chunk, backup_path=BACKUP_PATH):
+    digest = hashlib.sha256(chunk).hexdigest()
+    path = chunk_path(digest, backup_path)
+    if not os.path.isfile(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_file(path, zlib.compress(chunk))
+    return digest
+
+
+# Read the contents of the chunk with the hash `digest`
+def read_chunk(digest, backup_path=BACKUP_PATH):
+    with open(chunk_path(digest, backup_path), 'rb') as file:
+        return zlib.decompress(file.read())
+
+
+# Names of the saved generations, oldest first
+def list_generations(backup_path=BACKUP_PATH):
+    folder = os.path.join(backup_path, 'generations')
+    if not os.path.isdir(folder):
+        return []
+    return sorted(name[:-len('.json')] for name in os.listdir(folder) if name.endswith('.json'))
+
+
+# Read the list of chunks for each file in `generation`
+def read_generation(generation, backup_path=BACKUP_PATH):
+    with open(os.path.join(backup_path, 'generations', f'{generation}.json')) as file:
+        return json.load(file)['files']
+
+
+# Back up the files in `paths` (list of file paths) as a new generation, then remove the
+# generations (and chunks) past the retention limit. Returns the name of the new generation.
+def create(paths, backup_path=BACKUP_PATH, keep=KEEP_GENERATIONS):
+    files = {}
+    for path in paths:
+        with open(path, 'rb') as file:
+            files[os.path.basename(path)] = [store_chunk(chunk, backup_path) for chunk in split_chunks(file.read())]
+
+    # The generation file is written last, so a backup which is interrupted is never listed
+    generation = datetime.now().strftime('%Y%m%d-%H%M%S')
+    os.makedirs(os.path.join(backup_path, 'generations'), exist_ok=True)
+    write_file(os.path.join(backup_path, 'generations', f'{generation}.json'),
+               json.dumps({'created' : datetime.now().isoformat(), 'files' : files}).encode())
+
+    prune(keep, backup_path)
+    return generation
+
+
+# Delete all but the last `keep` generations, along with any chunks which are no longer used
+def prune(keep=KEEP_GENERATIONS, backup_path=BACKUP_PATH):
+    generations = list_generations(backup_path)
+    for generation in generations[:max(len(generations) - keep, 0)]:
+        os.remove(os.path.join(backup_path, 'generations', f'{generation}.json'))
+
+    used = {digest for generation in list_generations(backup_path)
+                   for chunks in read_generation(generation, backup_path).values() for digest in chunks}
+    chunks_folder = os.path.join(backup_path, 'chunks')
+    if not os.path.isdir(chunks_folder):
+        return
+    for folder in os.listdir(chunks_folder):
+        for digest in os.listdir(os.path.join(chunks_folder, folder)):
+            if digest not in used:
+                os.remove(os.path.join(chunks_folder, folder, digest))
+
+
+# Restore the files from `generation` into `rdb_path` (all files, unless `files` is given, i.e. ['student.csv'])
+def restore(generation, files=None, rdb_path=RDB_PATH, backup_path=BACKUP_PATH):
+    for name, chunks in read_generation(generation, backup_path).items():
+        if files and name not in files:
+            continue
+        data = b''.join(read_chunk(digest, backup_path) for digest in chunks)
+        write_file(os.path.join(rdb_path, name), data)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2 and sys.argv[1] == 'list':
+        for generation in list_generations():
+            print(generation)
+    elif len(sys.argv) >= 3 and sys.argv[1] == 'restore':
+        restore(sys.argv[2], files=sys.argv[3:])
+        print(f'Restored {sys.argv[2]} to {RDB_PATH}')
+    else:
+        print('Usage: python backup.py list | restore <generation> [file ...]')
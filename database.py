@@ -1,32 +1,141 @@
 import os
-import shutil
 import re
 import pandas as pd
 import functions as fn
+import snapshot
+import schema
+import journal
+import backup as bk
+import storage
+from search_index import NameIndex, FuzzyIndex
 import dbf
+from dbf_access import DBFTable, DBFWriter
 import calendar
+import threading
+import traceback
+from functools import partial, wraps
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
 # Global variables
 from globals import CURRENT_SESSION
 
+# Names of the tables in the relational database structure (each one is stored as `<name>.csv` in 'rdb_format')
+RDB_TABLES = ['guardian', 'student', 'payment', 'bill', 'classes', 'class_student', 'wait', 'trial', 'note', 'makeup']
+# Tables used by the Students screen, and the additional tables needed by the Classes screen
+# (on startup, `STMNU.load_database` loads the tables in this order on its background thread)
+STUDENT_SCREEN_TABLES = ['student', 'guardian', 'payment', 'bill', 'class_student', 'classes', 'note']
+CLASS_SCREEN_TABLES = ['wait', 'trial', 'makeup']
+# Primary key of the tables whose rows can be looked up directly by their ID (see `StudentDatabase.row_index`)
+INDEXED_TABLES = {'student' : 'STUDENT_ID', 'classes' : 'CLASS_ID', 'guardian' : 'GUARDIAN_ID', 'note' : 'NOTE_ID'}
+# Columns of the secondary indexes on each table, used to find all of the rows with the given values (see `StudentDatabase.rows`)
+GROUP_INDEXES = {'class_student' : [('CLASS_ID',), ('STUDENT_ID',)],
+                 'payment'       : [('STUDENT_ID', 'YEAR'), ('YEAR', 'MONTH')],
+                 'bill'          : [('STUDENT_ID',), ('STUDENT_ID', 'YEAR'), ('YEAR', 'MONTH')]}
+# Tables whose rows are part of the class rolls (see `StudentDatabase.class_roll`)
+CLASS_ROLL_TABLES = ['student', 'payment', 'bill', 'class_student']
+
+# Descriptor for the tables in `StudentDatabase`. Each table is only loaded (and formatted) the first
+# time it is used, so the program doesn't have to wait for tables which aren't needed yet.
+class LazyTable:
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, database, owner=None):
+        if database is None:
+            return self
+        if self.name not in database.__dict__:
+            database.materialize(self.name)
+        return database.__dict__[self.name]
+
+    # (Replacing a table, i.e. after dropping rows, also throws away its indexes, see `StudentDatabase.row_index`/`rows`)
+    def __set__(self, database, value):
+        database.__dict__[self.name] = value
+        database.row_indexes.pop(self.name, None)
+        database.group_indexes.pop(self.name, None)
+        if self.name == 'student':
+            database.name_index = None
+        if self.name in ('student', 'guardian'):
+            database.fuzzy_index = None
+
+# Next unused value for the ID column `col` of `df`
+def next_id(df, col):
+    return 1 if df[col].dropna().empty else int(df[col].max()) + 1
+
+# Decorator for the functions in `StudentDatabase` which modify the tables. The tables are changed straight away,
+# while the changes to the DBF files (see `queue_dbf_write`) are written in the background. All of the changes made
+# during one call (including the functions it calls, i.e. `move_student` -> `enroll_student`) are written to the
+# DBF files together in one pass per file (see `dbf_access.py`), then to the journal as a single record.
+def journaled(method):
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        # Nested call: the changes are part of the outer call's record
+        if self.journal_changes is not None:
+            return method(self, *args, **kwargs)
+        self.journal_changes, self.dbf_jobs = [], []
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            changes, self.journal_changes = self.journal_changes, None
+            jobs, self.dbf_jobs = self.dbf_jobs, None
+            if changes or jobs:
+                self.dbf_writer.submit(method.__name__, jobs, on_done=partial(self.append_journal, method.__name__, changes))
+    return wrapper
+
 class StudentDatabase:
-    def __init__(self, student_dbf_path, student_prev_year_dbf_path, clsbymon_dbf_path, do_not_load=[], update_active=False):
+    # Tables in the relational database structure
+    guardian      = LazyTable()
+    student       = LazyTable()
+    payment       = LazyTable()
+    bill          = LazyTable()
+    classes       = LazyTable()
+    class_student = LazyTable()
+    wait          = LazyTable()
+    trial         = LazyTable()
+    note          = LazyTable()
+    makeup        = LazyTable()
+
+    def __init__(self, student_dbf_path, student_prev_year_dbf_path, clsbymon_dbf_path, do_not_load=[], update_active=False,
+                 in_memory=False, export_csv=False, use_snapshot=False, parallel=False, checkpoint_minutes=None, storage='csv'):
         self.update_active = update_active
         self.do_not_load = do_not_load
+        # If `in_memory` is True, the DBF files are decoded straight into dataframes and transformed
+        # without writing/reading any intermediate .csv files. Set `export_csv` to True to still write
+        # the transformed tables out to 'rdb_format' (this is optional in memory mode)
+        self.in_memory = in_memory
+        self.export_csv = export_csv
+        # If `use_snapshot` is True, the tables are saved to a binary snapshot on exit and loaded from
+        # that snapshot on startup, as long as the DBF files have not changed in the meantime (see `snapshot.py`)
+        self.use_snapshot = use_snapshot
+        # If `parallel` is True (and `in_memory` is True), the DBF files are decoded at the same time in separate
+        # worker processes, and the payments for each year are reshaped in the workers as well
+        self.parallel = parallel
+        # How the tables are stored in 'rdb_format': 'csv' (one csv file per table) or 'sqlite' (see `storage.py`)
+        self.storage_kind = storage
+        # If given, the changed tables are saved in the background every `checkpoint_minutes` minutes
+        # while the program is open (see `checkpoint`), rather than only when the program is closed
+        self.checkpoint_minutes = checkpoint_minutes
+        self.checkpoint_thread = None
+        if use_snapshot and not snapshot.is_available():
+            print('`pyarrow` is not installed, snapshot cache is disabled.')
+            self.use_snapshot = False
+        # Paths to the original DBF files
+        self.dbf_paths = {'STUD00'   : student_dbf_path,
+                          'STUD99'   : student_prev_year_dbf_path,
+                          'clsbymon' : clsbymon_dbf_path}
+        # DBF tables, with their records looked up by STUDENTNO or CLASS_ID (see `dbf_access.py`)
         # DBF Table object for STUD00
-        self.student_dbf = dbf.Table(student_dbf_path)
-         # Add or modify 'ACTIVE' in DBF
-        with self.student_dbf:
-            if update_active:
+        self.student_dbf = DBFTable(student_dbf_path, 'STUDENTNO')
+         # Add 'ACTIVE' to DBF (if it doesn't exist). The values are filled in by `sync_active_dbf` after loading.
+        if update_active:
+            with self.student_dbf:
                 if 'ACTIVE' not in self.student_dbf.field_names:
                     self.student_dbf.add_fields('ACTIVE L')
-                for record in self.student_dbf:
-                    dbf.write(record, ACTIVE=False)
         # DBF Table object for STUD99 (student/payment records for previous year)
-        self.student_prev_year_dbf = dbf.Table(student_prev_year_dbf_path)
+        self.student_prev_year_dbf = DBFTable(student_prev_year_dbf_path, 'STUDENTNO')
         # DBF Table object for clsbymon.dbf
-        self.classes_dbf = dbf.Table(clsbymon_dbf_path)
+        self.classes_dbf = DBFTable(clsbymon_dbf_path, 'CLASS_ID')
          # Add 'CLASS_ID' to clsbymon DBF file (if it doesn't exist)
         with self.classes_dbf:
             if 'CLASS_ID' not in self.classes_dbf.field_names:
@@ -36,109 +145,493 @@ class StudentDatabase:
                     dbf.write(record, CLASS_ID=class_id)
                     class_id += 1
 
+        # DBF tables by the same names as `dbf_paths`
+        self.dbf_tables = {'STUD00'   : self.student_dbf,
+                           'STUD99'   : self.student_prev_year_dbf,
+                           'clsbymon' : self.classes_dbf}
+
+        # All changes to the DBF files are written by a background thread (see `queue_dbf_write`)
+        self.dbf_writer = DBFWriter(tuple(self.dbf_tables.values()))
+        self.dbf_jobs = None
+
+        # Index label of each row for the tables in `INDEXED_TABLES` (see `row_index`),
+        # and the secondary indexes for the tables in `GROUP_INDEXES` (see `rows`)
+        self.row_indexes = {}
+        self.group_indexes = {}
+        # Index of the student names for `search_student`/`search_family`, and the index of the student/guardian
+        # names for fuzzy searches, which is only built when it is first used (see `search_index.py`)
+        self.name_index = None
+        self.fuzzy_index = None
+        # Class roll of each class shown on the Classes screen (see `class_roll`)
+        self.class_rolls = {}
+
         # Variable to track whether the user has entered the payment password yet.
         # Once the user has entered the password once, they should not be asked again
         self.request_password = True
 
-    def load_data(self):
-        # Transform current versions of DBF files to CSV
-        fn.dbf_to_csv('STUD00.dbf')
-        fn.dbf_to_csv('STUD99.dbf')
-        fn.dbf_to_csv('clsbymon.dbf')
-        # Update files representing relational database structure
-        fn.transform_to_rdb(data_path='C:\\STMNU2\\data', save_to_path='C:\\STMNU2\\data\\rdb_format', write_to_csv=True,
-                            do_not_load=self.do_not_load, update_active=self.update_active)
-
-        # CSV paths
+    # Prepare the tables for use (see `materialize`). If given, `progress` is called with a description
+    # of each step and the fraction of the work which is complete (used by the loading screen)
+    def load_data(self, progress=None):
+        progress = progress or (lambda text, fraction: None)
+        # Storage for the tables in 'rdb_format' (see `storage.py`)
         rdb_folder_path = 'C:\\STMNU2\\data\\rdb_format'
-        filenames = [filename for filename in os.listdir('C:\\STMNU2\\data\\rdb_format') if filename != 'BACKUP']
-        self.csv_paths = {filename.split('.')[0] : os.path.join(rdb_folder_path,filename) for filename in filenames}
-        self.backup_paths = {filename.split('.')[0] : os.path.join(rdb_folder_path,'BACKUP',filename) for filename in filenames}
-
-        # Load student
-        self.student = pd.read_csv(self.csv_paths['student']).convert_dtypes()
-        # Drop the rows where name is completely missing
-        self.student = self.student.dropna(subset=['FNAME','LNAME']).reset_index(drop=True)
-        # Format dates
-        for col in ['BIRTHDAY', 'ENROLLDATE', 'REGFEEDATE']:
-            self.student[col] = pd.to_datetime(self.student[col], errors='coerce', format='mixed').dt.strftime('%m/%d/%Y')
-
-        self.student['ACTIVE'] = self.student['ACTIVE'].astype(bool)
-        if self.update_active:
-            with self.student_dbf:
-                for record in self.student_dbf:
-                    with record:
-                        studentno = record['STUDENTNO']
-                        if studentno in self.student['STUDENTNO'].values:
-                            record['ACTIVE'] = self.student.loc[self.student['STUDENTNO']==studentno,'ACTIVE'].values[0]
-                        else:
-                            record['ACTIVE'] = False
-
-        # Load payment
-        self.payment = pd.read_csv(self.csv_paths['payment'])
-        # Format dates
-        for col in ['DATE']:
-            self.payment[col] = pd.to_datetime(self.payment[col], errors='coerce', format='mixed').dt.strftime('%m/%d/%Y')
-
-        # Load bill
-        self.bill = pd.read_csv(self.csv_paths['bill'])
-
-        # Load classes
-        self.classes = pd.read_csv(self.csv_paths['classes'])
-
-        # Load class_student
-        self.class_student = pd.read_csv(self.csv_paths['class_student'])
-
-        # Load guardian
-        self.guardian = pd.read_csv(self.csv_paths['guardian'])
-
-        # Load note
-        self.note = pd.read_csv(self.csv_paths['note'])
-
-        # Load waitlist students
-        self.wait = pd.read_csv(self.csv_paths['wait'])
-
-        # Load trial students
-        self.trial = pd.read_csv(self.csv_paths['trial'])
-        for col in ['DATE']:
-            self.trial[col] = pd.to_datetime(self.trial[col], errors='coerce', format='mixed').dt.strftime('%m/%d/%Y')
-
-        # Load makeups
-        self.makeup = pd.read_csv(self.csv_paths['makeup'])
-        for col in ['DATE']:
-            self.makeup[col] = pd.to_datetime(self.makeup[col], errors='coerce', format='mixed').dt.strftime('%m/%d/%Y')
+        self.storage = storage.open_storage(self.storage_kind, rdb_folder_path)
+        # Folder for the backups of the stored tables (see `backup.py`)
+        self.backup_path = os.path.join(rdb_folder_path, 'BACKUP')
+
+        # Hashes of the DBF records that the tables were built from, and the payment year of STUD00/STUD99
+        # (saved with the snapshot, so that the next run can tell which records were changed by the old program)
+        self.record_hashes, self.payment_years = None, None
+        # Values of the DBF records written by this program since the last checkpoint (see `update_record_hashes`)
+        self.written_records = {name : {} for name in self.dbf_tables}
+        # When updating ACTIVE, the tables must always be rebuilt from the DBF files
+        use_snapshot = self.use_snapshot and not self.update_active
+        tables, clsbymon = None, None
+        # Whether the saved snapshot holds the same tables which are loaded now (see `save_data`)
+        self.snapshot_current = False
+
+        # Changes from the last session which were never saved, i.e. if the program crashed (see `journal.py`)
+        self.journal_path = os.path.join(rdb_folder_path, journal.JOURNAL_NAME)
+        self.journal_changes = None
+        # (The journal is written by the DBF writer thread, see `append_journal`)
+        self.journal_lock = threading.Lock()
+        records = journal.read(self.journal_path)
+        # If the DBF files have not changed since the last record in the journal, the tables are
+        # restored from the snapshot of the last session and then the journal is replayed (see below)
+        restore = (use_snapshot and len(records) > 0 and snapshot.read_manifest() is not None
+                   and records[-1].get('dbf') == journal.dbf_state(self.dbf_paths))
+
+        # Skip the DBF files entirely if the snapshot from the last run is still up to date
+        progress('Checking for changes...', 0.0)
+        if restore or (use_snapshot and snapshot.is_valid(self.dbf_paths)):
+            progress('Opening saved tables...', 0.5)
+            self.snapshot_current = True
+            tables = {table : partial(snapshot.load_table, table) for table in snapshot.read_manifest()['tables']}
+            self.record_hashes, self.payment_years = snapshot.load_hashes()
+            clsbymon = fn.dbf_to_dataframe(self.dbf_paths['clsbymon'])
+        elif self.in_memory:
+            with (ProcessPoolExecutor(max_workers=min(len(self.dbf_paths), os.cpu_count() or 1)) if self.parallel else nullcontext()) as pool:
+                # Decode DBF files directly into dataframes and hand them to the transform in memory
+                progress('Reading DBF files...', 0.1)
+                if pool is None:
+                    dbf_tables = {name : fn.dbf_to_dataframe(path) for name, path in self.dbf_paths.items()}
+                else:
+                    dbf_tables = dict(zip(self.dbf_paths.keys(), pool.map(fn.dbf_to_dataframe, self.dbf_paths.values())))
+                self.record_hashes = fn.record_hashes(dbf_tables)
+                self.payment_years = {name : fn.payment_year(fn.prepare_stud(dbf_tables[name])) for name in ('STUD00', 'STUD99')}
+                # If the DBF files were changed by the old program since the snapshot was saved,
+                # only re-create the records which actually changed
+                if use_snapshot and snapshot.read_manifest() is not None:
+                    old_hashes, old_payment_years = snapshot.load_hashes()
+                    if old_hashes is not None and old_payment_years == self.payment_years:
+                        progress('Updating changed records...', 0.4)
+                        tables = fn.patch_rdb(snapshot.load(), dbf_tables, old_hashes, self.record_hashes,
+                                              self.payment_years, do_not_load=self.do_not_load)
+                        clsbymon = dbf_tables['clsbymon']
+                # Otherwise, rebuild all of the tables
+                if tables is None:
+                    progress('Building tables...', 0.4)
+                    tables = fn.transform_to_rdb(data_path='C:\\STMNU2\\data', save_to_path=rdb_folder_path, write_to_csv=self.export_csv,
+                                                 do_not_load=self.do_not_load, update_active=self.update_active, dbf_tables=dbf_tables,
+                                                 executor=pool, storage=self.storage)
+        else:
+            # Transform current versions of DBF files to CSV
+            progress('Reading DBF files...', 0.1)
+            fn.dbf_to_csv('STUD00.dbf')
+            fn.dbf_to_csv('STUD99.dbf')
+            fn.dbf_to_csv('clsbymon.dbf')
+            # Update files representing relational database structure
+            progress('Building tables...', 0.4)
+            fn.transform_to_rdb(data_path='C:\\STMNU2\\data', save_to_path=rdb_folder_path, write_to_csv=True,
+                                do_not_load=self.do_not_load, update_active=self.update_active, storage=self.storage)
+            tables = {table : partial(self.storage.load, table) for table in RDB_TABLES if table != 'makeup'}
+
+        # The AVAILABLE count of each class is only changed in clsbymon.dbf when the class roll changes (see `enroll_student`),
+        # which can't always be told from the tables, so `classes` is re-created from clsbymon.dbf (a small file) instead
+        # of being kept from the last session
+        if clsbymon is not None:
+            tables['classes'] = fn.build_classes(clsbymon)
+
+        # Makeups only exist in the new program, so they are loaded from storage (unless they came from the snapshot)
+        if 'makeup' not in tables:
+            tables['makeup'] = partial(self.storage.load, 'makeup')
+
+        # The tables are not loaded/formatted until they are used (see `LazyTable` and `materialize`).
+        # Each entry in `table_sources` is either a dataframe or a function which loads the dataframe.
+        self.table_sources = tables
+        self.table_locks = {table : threading.Lock() for table in RDB_TABLES}
+        for table in RDB_TABLES:
+            self.__dict__.pop(table, None)
+        self.row_indexes = {}
+        self.group_indexes = {}
+        self.name_index = None
+        self.fuzzy_index = None
+        self.class_rolls = {}
+
+        # Number of changes made to each table, and the number of changes which have been saved to storage (see `log_change`).
+        # Tables which were rebuilt from the DBF files in memory have not been saved yet.
+        self.changes = {table : 0 for table in RDB_TABLES}
+        if self.in_memory and not self.snapshot_current:
+            self.changes.update({table : 1 for table in RDB_TABLES if table != 'makeup'})
+        elif clsbymon is not None:
+            self.changes['classes'] = 1
+        self.saved_changes = {table : 0 for table in RDB_TABLES}
+        # Keys of the rows changed in each table since it was last saved, so that only those rows have to be
+        # saved (None means the whole table has to be saved)
+        self.changed_keys = {table : [] if self.changes[table] == 0 else None for table in RDB_TABLES}
+
+        # Re-apply the changes from the last session which were never saved
+        if records:
+            progress('Restoring unsaved changes...', 0.7)
+            self.replay_journal(records)
 
+        if self.update_active:
+            progress('Updating active students...', 0.8)
+            self.sync_active_dbf()
+
+    # Copy the ACTIVE status of every student into the 'ACTIVE' field of STUD00.dbf.
+    # The ACTIVE value for each STUDENTNO is looked up once in a dictionary (students which are not
+    # in `student` are INACTIVE), and only the records whose value actually changes are written.
+    def sync_active_dbf(self):
+        student = self.student.drop_duplicates(subset='STUDENTNO')
+        active = dict(zip(student['STUDENTNO'].tolist(), student['ACTIVE'].astype(bool).tolist()))
+        with self.student_dbf:
+            for record in self.student_dbf:
+                new_value = active.get(record['STUDENTNO'], False)
+                if record['ACTIVE'] is not new_value:
+                    dbf.write(record, ACTIVE=new_value)
+
+    # Load `table` from its source (see `load_data`) and convert it to the format used by the program.
+    # This is called automatically the first time a table is used.
+    def materialize(self, table):
+        with self.table_locks[table]:
+            # Another thread may have loaded the table while we were waiting
+            if table in self.__dict__:
+                return
+            source = self.table_sources[table]
+            df = source() if callable(source) else source
+            # Make sure every column has the type listed in `schema.py` (no-op for tables read from csv/snapshot)
+            df = schema.apply(df, table)
+
+            # Drop the rows where name is completely missing
+            if table == 'student':
+                df = df.dropna(subset=['FNAME','LNAME']).reset_index(drop=True)
+
+            self.__dict__[table] = df
+            del self.table_sources[table]
+            # Build the name index along with the table (i.e. on the loading thread), so the first search doesn't wait for it
+            if table == 'student':
+                self.name_index = NameIndex(df)
+
+    # Index label of the row of `table` whose primary key (see `INDEXED_TABLES`) is `key`, or None if there is no such row.
+    # Each table keeps a dictionary of key -> index label, which is built the first time a row is looked up, updated
+    # when a row is appended (see `log_change`), and thrown away when the table is replaced (see `LazyTable`).
+    def row_index(self, table, key):
+        df = getattr(self, table)
+        col = INDEXED_TABLES[table]
+        row_index = self.row_indexes.get(table)
+        if row_index is None or row_index['length'] != len(df):
+            row_index = self.build_row_index(table)
+        label = row_index['labels'].get(key)
+        # Rebuild the index if the row no longer has this key (i.e. the table was changed in some other way)
+        if label is not None and (label not in df.index or df.at[label, col] != key):
+            label = self.build_row_index(table)['labels'].get(key)
+        return label
+
+    # Row of `table` whose primary key is `key`, as a Series (see `row_index`)
+    def row(self, table, key):
+        label = self.row_index(table, key)
+        return None if label is None else getattr(self, table).loc[label]
+
+    # (If a key appears more than once, the first row is used)
+    def build_row_index(self, table):
+        df = getattr(self, table)
+        keys, labels = df[INDEXED_TABLES[table]].tolist(), df.index.tolist()
+        self.row_indexes[table] = {'labels' : dict(zip(reversed(keys), reversed(labels))), 'length' : len(df)}
+        return self.row_indexes[table]
+
+    # Add the rows appended to `table` since its index was built (if rows were removed, the index is thrown away instead)
+    def update_row_index(self, table):
+        row_index = self.row_indexes.get(table)
+        df = getattr(self, table)
+        if row_index is None or row_index['length'] == len(df):
+            return
+        if row_index['length'] < len(df):
+            new_rows = df.iloc[row_index['length']:]
+            for key, label in zip(new_rows[INDEXED_TABLES[table]].tolist(), new_rows.index.tolist()):
+                row_index['labels'].setdefault(key, label)
+            row_index['length'] = len(df)
+        else:
+            del self.row_indexes[table]
+
+    # Rows of `table` where each column in `key` has the given value (i.e. `rows('payment', STUDENT_ID=1, YEAR=2024)`),
+    # in the same order as the table. If `key` includes the primary key of the table (see `INDEXED_TABLES`), the row
+    # is found through `row_index`; otherwise the rows are found through the secondary index in `GROUP_INDEXES` which
+    # covers the most columns of `key` (if any). Only those rows are checked against the rest of `key`.
+    def rows(self, table, **key):
+        df = getattr(self, table)
+        if INDEXED_TABLES.get(table) in key:
+            cols = (INDEXED_TABLES[table],)
+            label = self.row_index(table, key[cols[0]])
+            matches = df.loc[[] if label is None else [label]]
+        else:
+            cols = max((cols for cols in GROUP_INDEXES.get(table, []) if set(cols) <= set(key)), key=len, default=None)
+            if cols is None:
+                return df[journal.match(df, key)]
+            group_index = self.group_indexes.get(table, {}).get(cols)
+            if group_index is None or group_index['length'] != len(df):
+                group_index = self.build_group_index(table, cols)
+            matches = df.loc[group_index['labels'].get(tuple(key[col] for col in cols), [])]
+        other_cols = {col : value for col, value in key.items() if col not in cols}
+        return matches[journal.match(matches, other_cols)] if other_cols else matches
+
+    # Dictionary of (values of `cols`) -> list of the index labels of the rows with those values
+    def build_group_index(self, table, cols):
+        df = getattr(self, table)
+        labels = {}
+        for values, positions in df.groupby(list(cols), sort=False).indices.items():
+            labels[values if len(cols) > 1 else (values,)] = df.index[positions].tolist()
+        self.group_indexes.setdefault(table, {})[cols] = {'labels' : labels, 'length' : len(df)}
+        return self.group_indexes[table][cols]
+
+    # Add the rows appended to `table` since its secondary indexes were built (see `update_row_index`)
+    def update_group_indexes(self, table):
+        df = getattr(self, table)
+        for cols, group_index in list(self.group_indexes.get(table, {}).items()):
+            if group_index['length'] == len(df):
+                continue
+            if group_index['length'] < len(df):
+                new_rows = df.iloc[group_index['length']:]
+                for values, label in zip(zip(*[new_rows[col].tolist() for col in cols]), new_rows.index.tolist()):
+                    group_index['labels'].setdefault(values, []).append(label)
+                group_index['length'] = len(df)
+            else:
+                del self.group_indexes[table][cols]
+
+    # Class roll for `class_id` (shown by `ClassInfoFrame.update_labels`): a dictionary with
+    #   'students' : the active students in the class, with their payment for the current month ('PAY', 'DATE'),
+    #                whether they have paid ('PAID') or been billed ('BILLED') for it, and the students who have
+    #                paid/been billed first (then by last name)
+    #   'bills'    : list of the bills (MONTH, YEAR) owed by each student in the class who owes anything
+    # Each roll is built the first time the class is shown, and kept until one of its students (or their
+    # payments/bills/classes) changes (see `log_change`), so paging through the classes doesn't redo the merges.
+    def class_roll(self, class_id):
+        roll = self.class_rolls.get(class_id)
+        if roll is None:
+            roll = self.class_rolls[class_id] = self.build_class_roll(class_id)
+        return roll
+
+    def build_class_roll(self, class_id):
+        class_student = self.rows('class_student', CLASS_ID=class_id)
+        # (Each student only once, even if they are in `class_student` twice, same as merging with the whole table)
+        labels = dict.fromkeys(self.row_index('student', student_id) for student_id in class_student['STUDENT_ID'].tolist())
+        labels.pop(None, None)
+        students = self.student.loc[list(labels)]
+        roll_info = class_student.merge(students[students['ACTIVE']],
+                                        how='inner',
+                                        on='STUDENT_ID'
+                                ).merge(self.rows('payment', YEAR=CURRENT_SESSION.year, MONTH=CURRENT_SESSION.month),
+                                        how='left',
+                                        on='STUDENT_ID'
+                                ).loc[:,['PAY','DATE','STUDENT_ID','FAMILY_ID','FNAME','LNAME','BIRTHDAY']]
+        # Create 'PAID' which is true if student has a non-zero payment for the current month/year
+        roll_info['PAID'] = roll_info['PAY'] > 0
+
+        bills = {}
+        for student_id in roll_info['STUDENT_ID'].tolist():
+            student_bills = self.rows('bill', STUDENT_ID=student_id)
+            if not student_bills.empty:
+                bills[student_id] = list(zip(student_bills['MONTH'].tolist(), student_bills['YEAR'].tolist()))
+        # Create 'BILLED' which is true if student has been billed for the current month/year
+        # (since they have a bill record, someone has confirmed that the student
+        # is attending and plans to pay; therefore they will take up a spot in the class)
+        roll_info['BILLED'] = [(CURRENT_SESSION.month, CURRENT_SESSION.year) in bills.get(student_id, [])
+                               for student_id in roll_info['STUDENT_ID'].tolist()]
+
+        roll_info = roll_info.sort_values(by=['PAID','BILLED','LNAME'], ascending=[False,False,True]
+                            ).reset_index(drop=True)
+        return {'students' : roll_info, 'bills' : bills}
 
-    # Export all of the tables as csv files
+    # Throw away the class rolls which include the rows matching `key` (they are rebuilt when next shown)
+    def forget_class_rolls(self, key):
+        if 'CLASS_ID' in key:
+            class_ids = [key['CLASS_ID']]
+        else:
+            class_ids = self.rows('class_student', STUDENT_ID=key['STUDENT_ID'])['CLASS_ID'].tolist()
+        for class_id in class_ids:
+            self.class_rolls.pop(class_id, None)
+
+    # Record that the rows of `table` matching `key` (column=value) were modified or deleted, so that the
+    # change is written to the journal and the table is written out by the next `save_data`.
+    # Every function which modifies a table must call this (and be marked with `@journaled`).
+    def log_change(self, table, **key):
+        if table in INDEXED_TABLES:
+            self.update_row_index(table)
+        if table in GROUP_INDEXES:
+            self.update_group_indexes(table)
+        if table in CLASS_ROLL_TABLES:
+            self.forget_class_rolls(key)
+        self.changes[table] += 1
+        if self.changed_keys[table] is not None:
+            self.changed_keys[table].append(key)
+        if self.journal_changes is not None:
+            self.journal_changes.append(journal.change(table, self.rows(table, **key), key))
+
+    # Queue a function which reads/writes the DBF files (`self.student_dbf`, etc.) to run on the DBF writer thread
+    # once the current call finishes (see `journaled`). The function must not use the tables (`self.student`, etc.),
+    # since they may have changed again by the time it runs, so any values it needs are looked up beforehand.
+    def queue_dbf_write(self, job):
+        self.dbf_jobs.append(job)
+
+    # Add a record to the journal (called on the DBF writer thread, once the DBF files have been updated),
+    # and keep the values of the DBF records which were written (see `update_record_hashes`)
+    def append_journal(self, name, changes):
+        with self.journal_lock:
+            if changes:
+                journal.append(self.journal_path, name, changes, journal.dbf_state(self.dbf_paths))
+            for dbf_name, table in self.dbf_tables.items():
+                self.written_records[dbf_name].update(table.take_written())
+
+    # Hash the DBF records written by this program (`written_records`, dictionary of DBF name -> {key : values})
+    # again, so that the hashes saved with the snapshot match the DBF files it is saved against (otherwise, once the
+    # old program changes a DBF file, the next run would rebuild every record written here, see `fn.patch_rdb`)
+    def update_record_hashes(self, written_records):
+        if self.record_hashes is None:
+            return
+        record_hashes = dict(self.record_hashes)
+        for name, values in written_records.items():
+            if not values or name not in record_hashes:
+                continue
+            field_types = {spec.name : spec.type for spec in self.dbf_tables[name].fields.values()}
+            new_hashes = fn.hash_records(name, fn.format_dbf_columns(pd.DataFrame(list(values.values())), field_types))
+            # (Records which are not in the hashes yet were appended, so they go at the end, same as in the file)
+            hashes = record_hashes[name].copy()
+            known = new_hashes.index.isin(hashes.index)
+            hashes.loc[new_hashes.index[known]] = new_hashes.values[known]
+            record_hashes[name] = pd.concat([hashes, new_hashes[~known]])
+        self.record_hashes = record_hashes
+
+    # Apply the changes from the journal which were not saved before the program last closed (i.e. if it crashed)
+    def replay_journal(self, records):
+        self.class_rolls = {}
+        for record in records:
+            for change in record['changes']:
+                table = change['table']
+                # `classes` is always re-created from clsbymon.dbf, which already has every change in the journal
+                # (changes are only journaled once they are written to the DBF files, see `append_journal`)
+                if table == 'classes':
+                    continue
+                setattr(self, table, journal.apply(getattr(self, table), change))
+                self.changes[table] += 1
+                if self.changed_keys[table] is not None:
+                    self.changed_keys[table].append(change['key'])
+
+    # Copy the tables which need to be saved (see `write_checkpoint`). This runs on the main thread between
+    # changes, so the copies match each other and the journal, and can be written out on another thread
+    # while the program keeps changing the tables themselves.
+    def capture_checkpoint(self):
+        # Tables which were changed since they were last saved
+        changed_tables = [table for table in RDB_TABLES if self.changes[table] != self.saved_changes[table]]
+        # Only the changed tables are rewritten in the snapshot, unless the saved snapshot is from a different version of the tables
+        snapshot_tables = []
+        if self.use_snapshot and (changed_tables or not self.snapshot_current):
+            snapshot_tables = changed_tables if self.snapshot_current else RDB_TABLES
+        checkpoint = {'tables'   : {table : getattr(self, table).copy() for table in RDB_TABLES if table in changed_tables + snapshot_tables},
+                      'storage'  : changed_tables,
+                      'snapshot' : snapshot_tables,
+                      'changes'  : {table : self.changes[table] for table in changed_tables},
+                      'keys'     : {table : self.changed_keys[table] for table in changed_tables}}
+        self.changed_keys.update({table : [] for table in changed_tables})
+        # Changes made from now on go into a new journal (the old one is deleted once the checkpoint is written).
+        # The DBF records written so far are taken at the same time, so the hashes saved with the checkpoint
+        # only include changes which are in the copied tables.
+        with self.journal_lock:
+            journal.rotate(self.journal_path)
+            checkpoint['written_records'] = self.written_records
+            self.written_records = {name : {} for name in self.dbf_tables}
+        return checkpoint
+
+    # Save the tables copied by `capture_checkpoint`: the changed rows are saved to storage, and the binary
+    # snapshot is updated (keyed on the current versions of the DBF files). Every file is written to a temporary
+    # file and renamed into place, so a checkpoint which is interrupted never leaves a partially written table.
+    def write_checkpoint(self, checkpoint):
+        self.update_record_hashes(checkpoint['written_records'])
+        tables = checkpoint['tables']
+        for table in checkpoint['storage']:
+            self.storage.save(table, tables[table], keys=checkpoint['keys'][table])
+
+        if checkpoint['snapshot']:
+            snapshot.save({table : schema.to_storage(tables[table], table) for table in checkpoint['snapshot']}, self.dbf_paths,
+                          record_hashes=self.record_hashes, payment_years=self.payment_years,
+                          keep=[table for table in RDB_TABLES if table not in checkpoint['snapshot']])
+            self.snapshot_current = True
+
+        self.saved_changes.update(checkpoint['changes'])
+        # Everything in the old journal has now been saved
+        journal.clear_rotated(self.journal_path)
+
+    # Save the changed tables on a background thread (called on a timer while the program is open, see `STMNU.schedule_checkpoint`).
+    # Nothing happens if the last checkpoint is still being written.
+    def checkpoint(self):
+        if self.checkpoint_thread is not None and self.checkpoint_thread.is_alive():
+            return
+        self.checkpoint_thread = threading.Thread(target=self.run_checkpoint, args=(self.capture_checkpoint(),), daemon=True)
+        self.checkpoint_thread.start()
+
+    # Write a checkpoint (runs on the background thread). If it fails, the tables are still marked as changed
+    # (and saved in full next time) and the old journal is kept, so everything is saved by the next checkpoint.
+    def run_checkpoint(self, checkpoint):
+        try:
+            self.write_checkpoint(checkpoint)
+        except Exception:
+            self.changed_keys.update({table : None for table in checkpoint['storage']})
+            print('Error saving checkpoint:')
+            print(traceback.format_exc())
+
+    # Save the tables which were changed since they were last saved (called when the program is closed)
     def save_data(self, backup=False):
-        # Save out all changes made during current run of program
-        self.guardian.to_csv(self.csv_paths['guardian'],index=False)
-        self.student.to_csv(self.csv_paths['student'],index=False)
-        self.payment.to_csv(self.csv_paths['payment'],index=False)
-        self.bill.to_csv(self.csv_paths['bill'],index=False)
-        self.classes.to_csv(self.csv_paths['classes'],index=False)
-        self.class_student.to_csv(self.csv_paths['class_student'],index=False)
-        self.wait.to_csv(self.csv_paths['wait'],index=False)
-        self.trial.to_csv(self.csv_paths['trial'],index=False)
-        self.makeup.to_csv(self.csv_paths['makeup'],index=False)
-        self.note.to_csv(self.csv_paths['note'],index=False)
-
-        # If backup requested, copy the above files into the BACKUP folder
+        # Wait for the remaining changes to be written to the DBF files
+        self.dbf_writer.wait()
+        # Wait for the background checkpoint to finish (if one is being written), then save everything else
+        if self.checkpoint_thread is not None:
+            self.checkpoint_thread.join()
+        self.write_checkpoint(self.capture_checkpoint())
+
+        # If backup requested, save a new generation of the above files in the BACKUP folder
         if backup:
-            for table in self.csv_paths.keys():
-                shutil.copy(src=self.csv_paths[table], dst=self.backup_paths[table])
-
-
-    def search_student(self, query, show_inactive=False):
+            bk.create(self.storage.files(), backup_path=self.backup_path)
+
+
+    # Index of the student names (see `search_index.py`). It is rebuilt if `student` was replaced,
+    # or if rows were added without going through `create_student`.
+    def student_names(self):
+        if self.name_index is None or len(self.name_index) != len(self.student):
+            self.name_index = NameIndex(self.student)
+        return self.name_index
+
+    # Index of the student/guardian names for fuzzy searches (see `search_index.py`). Besides the cases in `student_names`,
+    # it is rebuilt if `guardian` was changed since it was built (student names are updated by `create_student`/`update_student_info`).
+    def student_fuzzy_names(self):
+        if (self.fuzzy_index is None or len(self.fuzzy_index) != len(self.student)
+            or self.fuzzy_index_changes != self.changes['guardian']):
+            self.fuzzy_index = FuzzyIndex(self.student, self.guardian)
+            self.fuzzy_index_changes = self.changes['guardian']
+        return self.fuzzy_index
+
+    # Search for students by first/last name. If `fuzzy` is True, the names don't have to match exactly
+    # (i.e. misspelled names are found), and the matches are sorted from the closest match to the furthest.
+    def search_student(self, query, show_inactive=False, fuzzy=False):
         # Force all uppercase
         for key in query.keys(): query[key] = query[key].upper()
         
-        # Perform search using name fields
-        matches = self.student[(((self.student['FNAME'].str.upper().str.startswith(query['First Name'], na=False)) | (len(query['First Name']) == 0))
-                            & ((self.student['LNAME'].str.upper().str.startswith(query['Last Name'], na=False)) | (len(query['Last Name']) == 0))
-                            & (self.student['ACTIVE'] | show_inactive))
-                            ].sort_values(by=['LNAME','FNAME'], key=lambda x: x.str.upper()
-                            ).loc[:, ['STUDENT_ID', 'FNAME','LNAME']
+        # Perform search using name fields (the name index returns the matches already sorted by last name, first name)
+        if fuzzy:
+            labels = self.student_fuzzy_names().search(last=query['Last Name'], first=query['First Name'])
+        else:
+            labels = self.student_names().search(last=query['Last Name'], first=query['First Name'])
+        matches = self.student.loc[labels]
+        matches = matches[matches['ACTIVE'] | show_inactive
+                            ].loc[:, ['STUDENT_ID', 'FNAME','LNAME']
                             ].fillna(''
                             ).reset_index(drop=True)
         
@@ -146,16 +639,21 @@ class StudentDatabase:
     
 
     # Create new student record in `student` and `STUD00`
+    @journaled
     def create_student(self, entry_boxes):
         # Extract all (non-blank) user entries
         new_student_info = {field : entry.get() for (field,entry) in entry_boxes.items() if entry.get()}
+        # Convert dates entered by the user to datetime
+        for field in ['ENROLLDATE', 'BIRTHDAY']:
+            if field in new_student_info.keys():
+                new_student_info[field] = fn.parse_date(new_student_info[field])
         new_family_id = self.student['FAMILY_ID'].max()+1
         # Add other fields in `student` table
-        new_student_info.update({'STUDENT_ID' : self.student.shape[0]+1,
+        new_student_info.update({'STUDENT_ID' : next_id(self.student, 'STUDENT_ID'),
                                  'ACTIVE'     : True,
                                  'FAMILY_ID'  : new_family_id,
                                  'STUDENTNO'  : self.student['STUDENTNO'].max()+1,
-                                 'ENROLLDATE' : datetime.today().strftime('%m/%d/%Y'),
+                                 'ENROLLDATE' : datetime.today().replace(hour=0, minute=0, second=0, microsecond=0),
                                  'REGFEE'     : 0,
                                  'MONTHLYFEE' : 0,
                                  'BALANCE'    : 0,
@@ -164,12 +662,15 @@ class StudentDatabase:
         
         ## Step 1: Create new record for this student in Pandas DataFrame
         self.student.loc[len(self.student)] = new_student_info
-        self.student.to_csv(self.csv_paths['student'], index=False)
+        self.log_change('student', STUDENT_ID=new_student_info['STUDENT_ID'])
+        for index in (self.name_index, self.fuzzy_index):
+            if index is not None:
+                index.set(self.student.index[-1], new_student_info.get('FNAME'), new_student_info.get('LNAME'))
 
         # Create guardian records (if provided)
         for guardian_type in ['MOM','DAD']:
             if f'{guardian_type}NAME' in new_student_info.keys():
-                guardian_info = {'GUARDIAN_ID' : self.guardian.shape[0]+1,
+                guardian_info = {'GUARDIAN_ID' : next_id(self.guardian, 'GUARDIAN_ID'),
                                 'FAMILY_ID'    : new_family_id,
                                 'RELATION'     : guardian_type,
                                 'FNAME'        : new_student_info[f'{guardian_type}NAME'],
@@ -177,33 +678,32 @@ class StudentDatabase:
                                 'CREA_TMS'     : datetime.now(),
                                 'UPDT_TMS'     : datetime.now()}
                 self.guardian.loc[len(self.guardian)] = guardian_info
+                self.log_change('guardian', FAMILY_ID=new_family_id, RELATION=guardian_type)
 
         ## Step 2: Create new record for this student in original database (DBF file)
-        # Special handling for dates
-        for field in ['ENROLLDATE', 'BIRTHDAY']:
-            if field in new_student_info.keys():
-                new_student_info[field] = datetime.strptime(new_student_info[field], "%m/%d/%Y")
-
         # For string fields, make sure they are in all-uppercase before updating DBF file
         for field, entry in entry_boxes.items():
             if entry.get() and entry.dtype == 'string':
                 new_student_info[field] = entry.get().upper()
 
         ## (Note: create this student in both current/previous year databases, in case user enters payments for last year)
-        for table_to_update in (self.student_dbf, self.student_prev_year_dbf):
-            with table_to_update:
-                # Drop any fields that appear in `new_student_info` which are not present in the DBF file
-                new_student_info = {field:value for field,value in new_student_info.items() if field in table_to_update.field_names}
-                # Append record to DBF table
-                table_to_update.append(new_student_info) 
+        def write_dbf():
+            for table_to_update in (self.student_dbf, self.student_prev_year_dbf):
+                with table_to_update:
+                    # Drop any fields that appear in `new_student_info` which are not present in the DBF file
+                    record_info = {field:value for field,value in new_student_info.items() if field in table_to_update.fields}
+                    # Append record to DBF table
+                    table_to_update.append(record_info)
+        self.queue_dbf_write(write_dbf)
 
 
+    @journaled
     def update_student_info(self, student_id, entry_boxes, edit_type, year=CURRENT_SESSION.year):
         # Get dataframe index associated with 'student_id'
-        student_idx = self.student[self.student['STUDENT_ID'] == student_id].index[0]
+        student_idx = self.row_index('student', student_id)
         # Student number associated with the edited student
-        studentno = self.student.iloc[student_idx]['STUDENTNO']
-        family_id = self.student.iloc[student_idx]['FAMILY_ID']
+        studentno = self.student.at[student_idx, 'STUDENTNO']
+        family_id = self.student.at[student_idx, 'FAMILY_ID']
 
         # Guardian index
         guardian_info = self.guardian.loc[self.guardian['FAMILY_ID'] == family_id]
@@ -217,6 +717,8 @@ class StudentDatabase:
                 new_student_info[field] = float(new_student_info[field])
             elif entry_boxes[field].dtype == 'int':
                 new_student_info[field] = int(float(new_student_info[field]))
+            elif entry_boxes[field].dtype == 'datetime.date':
+                new_student_info[field] = fn.parse_date(new_student_info[field])
             else:
                 new_student_info[field] = new_student_info[field].upper()
 
@@ -240,11 +742,13 @@ class StudentDatabase:
                         # If new value is blank, delete guardian record
                         if is_blank:
                             self.guardian = self.guardian.drop(guardian_record.index).reset_index(drop=True)
+                            self.log_change('guardian', FAMILY_ID=family_id, RELATION=relation)
                         # Otherwise, modify existing guardian record
                         else:
                             self.guardian.loc[
                                 ((self.guardian['FAMILY_ID'] == family_id)
                                 & (self.guardian['RELATION'] == relation)), 'FNAME'] = new_student_info[field]
+                            self.log_change('guardian', FAMILY_ID=family_id, RELATION=relation)
                     # If guardian record does not exist...
                     else:
                         # ... and new value is not blank...
@@ -252,7 +756,7 @@ class StudentDatabase:
                             # ...create new guardian record
                             family_id = family_id if not pd.isna(family_id) else self.guardian['FAMILY_ID'].max(skipna=True)+1
                             self.student.loc[student_idx,'FAMILY_ID'] = family_id
-                            guardian_record = {'GUARDIAN_ID' : self.guardian.shape[0]+1,
+                            guardian_record = {'GUARDIAN_ID' : next_id(self.guardian, 'GUARDIAN_ID'),
                                             'FAMILY_ID'    : family_id,
                                             'RELATION'     : relation,
                                             'FNAME'        : new_student_info[f'{relation}NAME'],
@@ -260,9 +764,18 @@ class StudentDatabase:
                                             'CREA_TMS'     : datetime.now(),
                                             'UPDT_TMS'     : datetime.now()}
                             self.guardian.loc[len(self.guardian)] = guardian_record
+                            self.log_change('student', STUDENT_ID=student_id)
+                            self.log_change('guardian', FAMILY_ID=family_id, RELATION=relation)
                 # Otherwise edit 'student' table
                 else:
+                    schema.add_category(self.student, field, new_student_info[field])
                     self.student.loc[student_idx, field] = new_student_info[field] 
+                    self.log_change('student', STUDENT_ID=student_id)
+
+            # Keep the name indexes up to date with the new name
+            for index in (self.name_index, self.fuzzy_index):
+                if ('FNAME' in entry_boxes or 'LNAME' in entry_boxes) and index is not None:
+                    index.set(student_idx, self.student.at[student_idx, 'FNAME'], self.student.at[student_idx, 'LNAME'])
         
 
         ## Step 2: Update student info in original database (DBF file)
@@ -273,61 +786,65 @@ class StudentDatabase:
         else:
             table_to_update = self.student_prev_year_dbf
 
-        with table_to_update:
-            studentno_idx = table_to_update.create_index(lambda rec: rec.studentno)
-            # get a list of all matching records
-            match = studentno_idx.search(match=studentno)
-            # should only be one student with that studentno
-            record = match[0]
-            # Focus on this student's record
-            with record:
-                # Loop through each field
-                for field in new_student_info.keys():
-                    # Get info about this field in the dbf file
-                    field_info = table_to_update.field_info(field)
-                    # Convert date fields to proper format
-                    if str(field_info.py_type) == "<class 'datetime.date'>":
-                        if new_student_info[field] is not None:
-                            new_student_info[field] = datetime.strptime(new_student_info[field], "%m/%d/%Y")
-                    # Special case: there may be fields which have no restrictions in the new program,
-                    # but still must be truncated to fit in the old program.
-                    elif len(str(new_student_info[field])) > field_info.length:
-                        new_student_info[field] = str(new_student_info[field])[:field_info.length]
+        def write_dbf():
+            with table_to_update:
+                # should only be one student with that studentno
+                record = table_to_update.record(studentno)
+                # Focus on this student's record
+                with record:
+                    # Loop through each field
+                    for field in new_student_info.keys():
+                        # Special case: there may be fields which have no restrictions in the new program,
+                        # but still must be truncated to fit in the old program (dates are already datetime, see above)
+                        new_student_info[field] = table_to_update.truncate(field, new_student_info[field])
                         
-                    # Special case: for payment dates, if the payment value is blank or zero, delete date
-                    if 'DATE' in field and 'ENROLL' not in field:
-                        prefix = field[:-4]
-                        pay_field = prefix + 'PAY' if prefix!='REGFEE' else 'REGFEE'
-                        pay = new_student_info[pay_field]
-                        record[field] = new_student_info[field] if pay not in (None,'',0,'0.00') else None
-                    # For this record, if the dbase field does not match the user-entered field,
-                    # update that field in the dbf file (if the field is unchanged, ignore)
-                    elif record[field] != new_student_info[field]:
-                        record[field] = new_student_info[field]
+                        # Special case: for payment dates, if the payment value is blank or zero, delete date
+                        if 'DATE' in field and 'ENROLL' not in field:
+                            prefix = field[:-4]
+                            pay_field = prefix + 'PAY' if prefix!='REGFEE' else 'REGFEE'
+                            pay = new_student_info[pay_field]
+                            record[field] = new_student_info[field] if pay not in (None,'',0,'0.00') else None
+                        # For this record, if the dbase field does not match the user-entered field,
+                        # update that field in the dbf file (if the field is unchanged, ignore)
+                        elif record[field] != new_student_info[field]:
+                            record[field] = new_student_info[field]
+        self.queue_dbf_write(write_dbf)
 
     # Toggle 'ACTIVE' value for selected student between True/False
+    @journaled
     def activate_student(self, student_id):
         # Step 1: Pandas DataFrame
-        student_record = self.student[self.student['STUDENT_ID'] == student_id]
-        self.student.loc[student_record.index, 'ACTIVE'] = not student_record['ACTIVE'].values[0]
+        student_idx = self.row_index('student', student_id)
+        self.student.loc[student_idx, 'ACTIVE'] = not self.student.at[student_idx, 'ACTIVE']
+        self.log_change('student', STUDENT_ID=student_id)
         
 
     # Create/delete a `bill` record for the selected student, month, year
+    @journaled
     def bill_student(self, student_id, month_num, year):
         month = calendar.month_abbr[month_num].upper() if month_num < 13 else 'REG'
         # Step 1: Pandas DataFrame
-        bill_record = self.bill.loc[((self.bill['STUDENT_ID'] == student_id)
-                                     & (self.bill['MONTH'] == month_num)
-                                     & (self.bill['YEAR'] == year))]
+        bill_record = self.rows('bill', STUDENT_ID=student_id, MONTH=month_num, YEAR=year)
+        pay_record = self.rows('payment', STUDENT_ID=student_id, MONTH=month_num, YEAR=year)
+        # If this month has already been paid, the bill is only marked on the payment record
+        # (same as when the tables are created from the DBF files, see `fn.build_payment_bill`)
+        if not pay_record.empty:
+            billed = (pay_record['BILL'] == '*').any()
+            self.payment.loc[pay_record.index, 'BILL'] = None if billed else '*'
+            self.log_change('payment', STUDENT_ID=student_id, MONTH=month_num, YEAR=year)
         # If this bill does not exist, create record
-        if bill_record.empty:
+        elif bill_record.empty:
+            billed = False
             self.bill.loc[len(self.bill)] = {'STUDENT_ID' : student_id,
                                              'MONTH'      : month_num,
                                              'YEAR'       : year}
+            self.log_change('bill', STUDENT_ID=student_id, MONTH=month_num, YEAR=year)
         # If this month/year appears in 'bill' for this student (meaning they owed),
         # delete that bill record to indicate that the payment has been made
-        if not bill_record.empty:
+        else:
+            billed = True
             self.bill = self.bill.drop(bill_record.index).reset_index(drop=True)
+            self.log_change('bill', STUDENT_ID=student_id, MONTH=month_num, YEAR=year)
 
         ## Step 2: Update student info in original database (DBF file)
         if year == CURRENT_SESSION.year:
@@ -335,53 +852,56 @@ class StudentDatabase:
         else:
             table_to_update = self.student_prev_year_dbf
 
-        studentno = self.student.loc[self.student['STUDENT_ID'] == student_id, 'STUDENTNO'].squeeze()
-        with table_to_update:
-            studentno_idx = table_to_update.create_index(lambda rec: rec.studentno)
-            # get a list of all matching records
-            match = studentno_idx.search(match=studentno)
-            # should only be one student with that studentno
-            record = match[0]
-            # Focus on this student's record
-            with record:
-                bill_txt = '*' if bill_record.empty else ''
-                record[f'{month}BILL'] = bill_txt
+        studentno = self.row('student', student_id)['STUDENTNO']
+        bill_txt = '' if billed else '*'
+        def write_dbf():
+            with table_to_update:
+                # should only be one student with that studentno
+                record = table_to_update.record(studentno)
+                # Focus on this student's record
+                with record:
+                    record[f'{month}BILL'] = bill_txt
+        self.queue_dbf_write(write_dbf)
 
     # Create/delete/modify payments for a given student in the `payment` table
+    @journaled
     def update_payment_info(self, student_id, new_info, year):
         for field in new_info.index:
             # For now, reg. fee is stored in `student`
             if 'REG' in field:
-                self.student.loc[self.student['STUDENT_ID']==student_id,field] = new_info[field]
+                self.student.loc[self.row_index('student', student_id), field] = new_info[field]
+                self.log_change('student', STUDENT_ID=student_id)
                 continue
     
             # Integer corresponding to the month this payment applies to
             month_num = list(calendar.month_abbr).index(field[:3].title())
             # Get existing record for this payment/bill (if exists)
-            pay_record = self.payment[(self.payment['STUDENT_ID'] == student_id)
-                                    & (self.payment['MONTH'] == month_num)
-                                    & (self.payment['YEAR'] == year)]
-            bill_record = self.bill[(self.bill['STUDENT_ID'] == student_id)
-                                & (self.bill['MONTH'] == month_num)
-                                & (self.bill['YEAR'] == year)]
+            pay_record = self.rows('payment', STUDENT_ID=student_id, MONTH=month_num, YEAR=year)
+            bill_record = self.rows('bill', STUDENT_ID=student_id, MONTH=month_num, YEAR=year)
             
             if pay_record.empty:
                 # If payment record does not exist, and payment is non-zero, create new payment record
                 if 'PAY' in field and new_info[field] not in (None, 0.0, '0.00'):
+                    # The bill stays marked in the DBF file, so it is kept on the payment record
+                    # (same as when the tables are created from the DBF files, see `fn.build_payment_bill`)
                     self.payment.loc[len(self.payment)] = {'STUDENT_ID' : student_id,
                                                            'MONTH'      : month_num,
                                                            'PAY'        : new_info[field],
+                                                           'BILL'       : None if bill_record.empty else '*',
                                                            'YEAR'       : year}
+                    self.log_change('payment', STUDENT_ID=student_id, MONTH=month_num, YEAR=year)
                     # If this month/year appears in 'bill' for this student (meaning they owed),
                     # delete that bill record to indicate that the payment has been made
                     if not bill_record.empty:
                         self.bill = self.bill.drop(bill_record.index).reset_index(drop=True)
+                        self.log_change('bill', STUDENT_ID=student_id, MONTH=month_num, YEAR=year)
 
                     # If payment record has been created for CURRENT MONTH, place student in class roll
                     # and make sure they are marked as active
                     if month_num == CURRENT_SESSION.month:
-                        self.student.loc[self.student['STUDENT_ID']==student_id,'ACTIVE'] = True
-                        for class_id in self.class_student.loc[self.class_student['STUDENT_ID']==student_id,'CLASS_ID'].values:
+                        self.student.loc[self.row_index('student', student_id), 'ACTIVE'] = True
+                        self.log_change('student', STUDENT_ID=student_id)
+                        for class_id in self.rows('class_student', STUDENT_ID=student_id)['CLASS_ID'].tolist():
                             self.enroll_student(student_id, class_id)
 
             # If record already exists, but the new amount entered is zero, delete the record
@@ -389,18 +909,27 @@ class StudentDatabase:
             elif 'PAY' in field and new_info[field] in (None, 0.0, '0.00'):
                 # Drop the record from the table by using its index
                 self.payment = self.payment.drop(pay_record.index).reset_index(drop=True)
+                self.log_change('payment', STUDENT_ID=student_id, MONTH=month_num, YEAR=year)
+                # If the month was billed, the student owes for it again
+                if (pay_record['BILL'] == '*').any():
+                    self.bill.loc[len(self.bill)] = {'STUDENT_ID' : student_id,
+                                                     'MONTH'      : month_num,
+                                                     'YEAR'       : year}
+                    self.log_change('bill', STUDENT_ID=student_id, MONTH=month_num, YEAR=year)
 
                 # If a payment record has been deleted for CURRENT MONTH, remove student from class roll
                 if month_num == CURRENT_SESSION.month:
-                    for class_id in self.class_student.loc[self.class_student['STUDENT_ID']==student_id,'CLASS_ID'].values:
+                    for class_id in self.rows('class_student', STUDENT_ID=student_id)['CLASS_ID'].tolist():
                         self.unenroll_student(student_id, class_id,)
             # Otherwise, record already exists + new amount entered is NON-ZERO, so we edit the existing record
             else:
                 self.payment.loc[pay_record.index, field[3:]] = new_info[field]
+                self.log_change('payment', STUDENT_ID=student_id, MONTH=month_num, YEAR=year)
 
     # Create/delete/modify notes for a given student/class in the `note` table
     # The type of note we are dealing with is provided by edit_type (either 'NOTE_STUDENT' or 'NOTE_CLASS')
     # and the relevant ID field (STUDENT_ID or CLASS_ID) is given by 'id'
+    @journaled
     def update_note_info(self, id, edit_type, note_textbox):
         # Get all text from the textbox
         note_txt = note_textbox.get('1.0', 'end-1c')
@@ -421,15 +950,14 @@ class StudentDatabase:
                 self.note = self.note.drop(note_record.index).reset_index(drop=True)
         # Otherwise, create new note record using the user entry
         else:
-            self.note.loc[len(self.note)] = {'NOTE_ID' : len(self.note),
+            self.note.loc[len(self.note)] = {'NOTE_ID' : next_id(self.note, 'NOTE_ID'),
                                              id_field : id,
                                              'NOTE_TXT' : note_txt,
                                              'CREA_TMS' : datetime.now(),
                                              'UPDT_TMS' : datetime.now()
                                              }
 
-        # Save out to csv file
-        self.note.to_csv(self.csv_paths['note'], index=False)
+        self.log_change('note', **{id_field : id})
             
         ## Step 2: Update DBF file
         if 'STUDENT' in edit_type:
@@ -437,7 +965,7 @@ class StudentDatabase:
             # 'STUD00' has 3 columns for notes
             note_cols = [f'NOTE{i}' for i in range(1,4)]
             field = 'STUDENTNO'
-            record_no = self.student.loc[self.student['STUDENT_ID'] == id, field].squeeze()
+            record_no = self.row('student', id)[field]
         else:
             table_to_update = self.classes_dbf
             # 'clsbymon.dbf' has 4 columns for notes
@@ -449,24 +977,25 @@ class StudentDatabase:
         # Get rid of any newline characters (causes issues in old program)
         note_txt = note_txt.replace('\n', ' ')
 
-        with table_to_update:
-            idx = table_to_update.create_index(lambda rec: rec[field])
-            # get a list of all matching records
-            match = idx.search(match=record_no)
-            # should only be one student with that studentno
-            record = match[0]
-
-            with record:
-                # Loop through every note column
-                for col in note_cols:
-                    # Determine max byte size of this field in the DBF file
-                    max_length = table_to_update.field_info(col).length
-                    # Store up to `max_length` characters in column
-                    record[col] = note_txt[:max_length].strip()
-                    # Delete first `max_length` characters and continue
-                    note_txt = note_txt[max_length:].strip()
+        def write_dbf():
+            remaining_txt = note_txt
+            with table_to_update:
+                # should only be one student with that studentno
+                record = table_to_update.record(record_no)
+
+                with record:
+                    # Loop through every note column
+                    for col in note_cols:
+                        # Determine max byte size of this field in the DBF file
+                        max_length = table_to_update.fields[col].length
+                        # Store up to `max_length` characters in column
+                        record[col] = remaining_txt[:max_length].strip()
+                        # Delete first `max_length` characters and continue
+                        remaining_txt = remaining_txt[max_length:].strip()
+        self.queue_dbf_write(write_dbf)
                         
 
+    @journaled
     def update_class_info(self, class_id, entry_boxes, edit_type, wait_var=None):
         # Change wait variable value to exit edit mode
         if wait_var:
@@ -483,6 +1012,8 @@ class StudentDatabase:
                 new_info[field] = float(new_info[field])
             elif entry_boxes[field].dtype == 'int':
                 new_info[field] = int(float(new_info[field]))
+            elif entry_boxes[field].dtype == 'datetime.date':
+                new_info[field] = fn.parse_date(new_info[field])
             else:
                 new_info[field] = new_info[field].upper()
 
@@ -499,39 +1030,31 @@ class StudentDatabase:
 
 
         ## Step 2: Update student info in original database (DBF file)
-        with self.classes_dbf:
-            class_id_idx = self.classes_dbf.create_index(lambda rec: rec.class_id)
-            # get a list of all matching records
-            match = class_id_idx.search(match=class_id)
-            # should only be one student with that studentno
-            record = match[0]
-            # Focus on this student's record
-            with record:
-                # Loop through each field
-                for field in new_info.keys():
-                    try:
-                        # Get info about this field in the dbf file
-                        field_info = self.classes_dbf.field_info(field)
-
-                        # Convert date fields to proper format
-                        if str(field_info.py_type) == "<class 'datetime.date'>":
-                            if new_info[field] is not None and len(new_info[field]) > 0:
-                                new_info[field] = datetime.strptime(new_info[field], "%m/%d/%Y")
+        def write_dbf():
+            with self.classes_dbf:
+                # should only be one class with that class_id
+                record = self.classes_dbf.record(class_id)
+                # Focus on this student's record
+                with record:
+                    # Loop through each field
+                    for field in new_info.keys():
+                        # If field does not exist in DBF file, ignore this data and move to the next field
+                        if field not in self.classes_dbf.fields:
+                            print(f'{field} not found in DBF')
+                            continue
+
                         # Special case: there may be fields which have no restrictions in the new program,
-                        # but still must be truncated to fit in the old program.
-                        elif len(str(new_info[field])) > field_info.length:
-                            new_info[field] = str(new_info[field])[:field_info.length]
+                        # but still must be truncated to fit in the old program (dates are already datetime, see above)
+                        new_info[field] = self.classes_dbf.truncate(field, new_info[field])
                         # For this record, if the dbase field does not match the user-entered field,
                         # update that field in the dbf file (if the field is unchanged, ignore)
                         if record[field] != new_info[field]:
                             record[field] = new_info[field]
-                    # If field does not exist in DBF file, ignore this data and move to the next field
-                    except dbf.exceptions.FieldMissingError as err:
-                        print(err.args[0])
-                        continue
+        self.queue_dbf_write(write_dbf)
 
 
 
+    @journaled
     def update_wait_info(self, class_id, new_info):
         # `wait_counter` tracks how many waitlists have been entered as we loop through
         # all 4 placeholder fields. This is done so that if a gap exists in the 
@@ -557,7 +1080,7 @@ class StudentDatabase:
                     # Create new record in waitlist.
                     # Note: in the special case that a single waitlist is being added, we don't need to track
                     # anything, so we use the true `wait_no` when creating the record
-                    self.wait.loc[len(self.wait)] = {'WAIT_ID'  : self.wait.shape[0]+1,
+                    self.wait.loc[len(self.wait)] = {'WAIT_ID'  : next_id(self.wait, 'WAIT_ID'),
                                                      'CLASS_ID' : class_id,
                                                      'WAIT_NO'  : wait_counter if len(wait_columns) > 1 else wait_no,
                                                      'NAME'     : new_wait_name,
@@ -577,8 +1100,10 @@ class StudentDatabase:
                     self.wait.loc[wait_record.index, 'WAIT_NO'] = wait_counter
                     self.wait.loc[wait_record.index, 'UPDT_TMS'] = datetime.now()
                     wait_counter += 1
+        self.log_change('wait', CLASS_ID=class_id)
 
 
+    @journaled
     def update_trial_info(self, class_id, new_info):
         # `trial_counter` tracks how many trials have been entered as we loop through
         # all 8 placeholder fields. This is done so that if a gap exists in the 
@@ -600,14 +1125,14 @@ class StudentDatabase:
             # If trial entry doesn't exist...
             if trial_record.empty:
                 # If new data is all blank, do nothing
-                if all([(info is None or info.strip()=='') for info in [new_trial_name,new_trial_phone,new_trial_date]]):
+                if all([(info is None or str(info).strip()=='') for info in [new_trial_name,new_trial_phone,new_trial_date]]):
                     continue
                 # Otherwise, create record
                 else:
                     # Create new trial.
                     # Note: in the special case that a single trial is being added, we don't need to track
                     # anything, so we use the true `trial_no` when creating the record
-                    self.trial.loc[len(self.trial)] = {'TRIAL_ID'  : self.trial.shape[0]+1,
+                    self.trial.loc[len(self.trial)] = {'TRIAL_ID'  : next_id(self.trial, 'TRIAL_ID'),
                                                      'CLASS_ID' : class_id,
                                                      'TRIAL_NO' : trial_counter if len(trial_columns) > 1 else trial_no,
                                                      'NAME'     : new_trial_name,
@@ -619,7 +1144,7 @@ class StudentDatabase:
             # If record already exists...
             else:
                 # If new data is all blank, drop existing record
-                if all([(info is None or info.strip()=='') for info in [new_trial_name,new_trial_phone,new_trial_date]]):
+                if all([(info is None or str(info).strip()=='') for info in [new_trial_name,new_trial_phone,new_trial_date]]):
                     self.trial = self.trial.drop(trial_record.index).reset_index(drop=True)
                 # Otherwise, modify existing record
                 else:
@@ -629,8 +1154,10 @@ class StudentDatabase:
                     self.trial.loc[trial_record.index, 'TRIAL_NO'] = trial_counter
                     self.trial.loc[trial_record.index, 'UPDT_TMS'] = datetime.now()
                     trial_counter += 1
+        self.log_change('trial', CLASS_ID=class_id)
 
 
+    @journaled
     def update_makeup_info(self, class_id, new_info):
         # `makeup_counter` tracks how many makeups have been entered as we loop through
         # all 4 placeholder fields. This is done so that if a gap exists in the 
@@ -651,14 +1178,14 @@ class StudentDatabase:
             # If makeup entry doesn't exist...
             if makeup_record.empty:
                 # If new data is all blank, do nothing
-                if all([(info is None or info.strip()=='') for info in [new_makeup_name,new_makeup_date]]):
+                if all([(info is None or str(info).strip()=='') for info in [new_makeup_name,new_makeup_date]]):
                     continue
                 # Otherwise, create record
                 else:
                     # Create new makeup.
                     # Note: in the special case that a single makeup is being added, we don't need to track
                     # anything, so we use the true `trial_no` when creating the record
-                    self.makeup.loc[len(self.makeup)] = {'MAKEUP_ID'  : self.makeup.shape[0]+1,
+                    self.makeup.loc[len(self.makeup)] = {'MAKEUP_ID'  : next_id(self.makeup, 'MAKEUP_ID'),
                                                      'CLASS_ID' : class_id,
                                                      'MAKEUP_NO' : makeup_counter if len(makeup_columns) > 1 else makeup_no,
                                                      'NAME'     : new_makeup_name,
@@ -669,7 +1196,7 @@ class StudentDatabase:
             # If record already exists...
             else:
                 # If new data is all blank, drop existing record
-                if all([(info is None or info.strip()=='') for info in [new_makeup_name,new_makeup_date]]):
+                if all([(info is None or str(info).strip()=='') for info in [new_makeup_name,new_makeup_date]]):
                     self.makeup = self.makeup.drop(makeup_record.index).reset_index(drop=True)
                 # Otherwise, modify existing record
                 else:
@@ -678,6 +1205,7 @@ class StudentDatabase:
                     self.makeup.loc[makeup_record.index, 'MAKEUP_NO'] = makeup_counter
                     self.makeup.loc[makeup_record.index, 'UPDT_TMS'] = datetime.now()
                     makeup_counter += 1
+        self.log_change('makeup', CLASS_ID=class_id)
 
 
     # The dataframe is sorted chronologically by default. This function will sort the dataframe alphabetically,
@@ -705,10 +1233,9 @@ class StudentDatabase:
         # Force all uppercase
         for key in query.keys(): query[key] = query[key].upper()
         
-        # Perform search using name fields
-        matches = self.student[self.student['LNAME'].str.upper().str.startswith(query['Last Name'], na=False)
-                            ].sort_values(by='LNAME', key=lambda x: x.str.upper()
-                            ).sort_values(by='FAMILY_ID'
+        # Perform search using last name (the name index returns the matches already sorted by last name)
+        matches = self.student.loc[self.student_names().search(last=query['Last Name'])
+                            ].sort_values(by='FAMILY_ID', kind='stable'
                             ).loc[:, ['FAMILY_ID','LNAME']
                             ].reset_index(drop=True)
         
@@ -722,8 +1249,9 @@ class StudentDatabase:
     # Move student from one class to another based on the user's selected options.
     # This function is called by the `MoveStudentDialog` widget, so that we can retrieve 
     # the user-selected options here before the pop-up window closes.
+    @journaled
     def move_student(self, student_id, current_class_id, new_class_id):
-        current_record = self.class_student[((self.class_student['STUDENT_ID'] == student_id) & (self.class_student['CLASS_ID'] == current_class_id))]
+        current_record = self.rows('class_student', STUDENT_ID=student_id, CLASS_ID=current_class_id)
         # Remove student from 'current class' (for new enrollments, current_record will be empty, and we do nothing)
         if not current_record.empty:
             self.unenroll_student(student_id, current_class_id, class_roll_only=False)
@@ -736,166 +1264,162 @@ class StudentDatabase:
     # This function appends the relevant record to `class_student` before modifying the DBF files
     # to 1) add student to `clsbymon.dbf` if they are paid for the current month,
     # and 2) add instructor/daytime information to the student's record in `STUD00.dbf`
+    @journaled
     def enroll_student(self, student_id, class_id):
         ## STEP 1: Update in Pandas dataframe
         # Create a new record in `class_student` using the new class_id (if it does not exist)
-        record = self.class_student[((self.class_student['STUDENT_ID'] == student_id) & (self.class_student['CLASS_ID'] == class_id))]
+        record = self.rows('class_student', STUDENT_ID=student_id, CLASS_ID=class_id)
         if record.empty:
             self.class_student.loc[len(self.class_student)] = {'CLASS_ID' : class_id,
                                                             'STUDENT_ID' : student_id,}
             # Fill a spot in the 'new' class by subtracting 1 from the 'AVAILABLE' column
-            self.classes.loc[self.classes['CLASS_ID'] == class_id, 'AVAILABLE'] -= 1
+            self.classes.loc[self.row_index('classes', class_id), 'AVAILABLE'] -= 1
+            self.log_change('class_student', CLASS_ID=class_id, STUDENT_ID=student_id)
+            self.log_change('classes', CLASS_ID=class_id)
 
         ## STEP 2: Update original database (DBF file)
         # Get 'STUDENTNO' and name corresponding to the selected 'student_id'
-        student_info = self.student[self.student['STUDENT_ID'] == student_id].squeeze()
+        student_info = self.row('student', student_id)
         studentno = int(student_info['STUDENTNO'])
         student_name = student_info['FNAME'] + ' ' + student_info['LNAME']
-        # STUDENTNO columns (NUMB1, NUMB2, ...)
-        studentno_cols = [col for col in self.classes_dbf.field_names if 'NUMB' in col]
         # Get class info for new class
-        new_class_info = self.classes[self.classes['CLASS_ID']==class_id].squeeze()
+        new_class_info = self.row('classes', class_id)
         teach_cols, daytime_cols = ['INSTRUCTOR', 'INST2', 'INST3'], ['DAYTIME','DAYTIME2','DAYTIME3']
         # Store student's payment for the current month/year, if it exists
-        pay_record = self.payment[(self.payment['STUDENT_ID'] == student_id)
-                                & (self.payment['MONTH'] == CURRENT_SESSION.month)
-                                & (self.payment['YEAR'] == CURRENT_SESSION.year)]
+        pay_record = self.rows('payment', STUDENT_ID=student_id, MONTH=CURRENT_SESSION.month, YEAR=CURRENT_SESSION.year)
 
-        # Open 'clsbymon.dbf'
-        with self.classes_dbf:
-            class_id_idx = self.classes_dbf.create_index(lambda rec: rec.class_id)
-
-            # Get DBF record corresponding to new class
-            # We should only enroll the student in the new class (place them in `clsbymon`) if they are paid for the current month.
-            # If they haven't paid yet, do not modify the DBF file.
-            if not pay_record.empty:
+        def write_dbf():
+            # Open 'clsbymon.dbf'
+            with self.classes_dbf:
+                # STUDENTNO columns (NUMB1, NUMB2, ...)
+                studentno_cols = [col for col in self.classes_dbf.field_names if 'NUMB' in col]
                 # Get DBF record corresponding to new class
-                record = class_id_idx.search(match=class_id)[0]
-                with record:
-                    # Loop through each student column
-                    for field in studentno_cols:
-                        # If student is already present, end function (this prevents enrolling the student in the same class twice)
-                        if record[field] == studentno:
-                            break
-                        # Put student into the first blank spot
-                        elif record[field] == 0:
-                            record[field] = studentno
-                            record[f'STUDENT{field[4:]}'] = student_name
-                            # Fill a spot by subtracting 1 from 'AVAILABLE' column
-                            record['AVAILABLE'] -= 1
-                            break
+                # We should only enroll the student in the new class (place them in `clsbymon`) if they are paid for the current month.
+                # If they haven't paid yet, do not modify the DBF file.
+                if not pay_record.empty:
+                    # Get DBF record corresponding to new class
+                    record = self.classes_dbf.record(class_id)
+                    with record:
+                        # Loop through each student column
+                        for field in studentno_cols:
+                            # If student is already present, end function (this prevents enrolling the student in the same class twice)
+                            if record[field] == studentno:
+                                break
+                            # Put student into the first blank spot
+                            elif record[field] == 0:
+                                record[field] = studentno
+                                record[f'STUDENT{field[4:]}'] = student_name
+                                # Fill a spot by subtracting 1 from 'AVAILABLE' column
+                                record['AVAILABLE'] -= 1
+                                break
+
+            # Next, we need to modify STUD00.dbf, as the instructor/daytime which are displayed in a student's record
+            # are stored here in the old program. For this step, we do not care if the student has paid or not,
+            # whether they are active or not, etc. This allows the user to move students from one class to another,
+            # or enroll them in a new class, regardless of their active or payment status. The student will
+            # get populated into relevant class rolls later whenever they are marked active and a payment is entered for current month.
 
-        # Next, we need to modify STUD00.dbf, as the instructor/daytime which are displayed in a student's record
-        # are stored here in the old program. For this step, we do not care if the student has paid or not,
-        # whether they are active or not, etc. This allows the user to move students from one class to another,
-        # or enroll them in a new class, regardless of their active or payment status. The student will
-        # get populated into relevant class rolls later whenever they are marked active and a payment is entered for current month.
+            # Open `STUD00.dbf`
+            with self.student_dbf:
+                # Get DBF record corresponding to student
+                record = self.student_dbf.record(studentno)
 
-        # Open `STUD00.dbf`
-        with self.student_dbf:
-            studentno_idx = self.student_dbf.create_index(lambda rec: rec.studentno)
-            # Get DBF record corresponding to student
-            record = studentno_idx.search(match=studentno)[0]
-
-            # Add new instructor/daytime to student's record
-            with record:
-                # Track duplicate classtimes
-                student_enrolled = False
-                # Loop through each instructor/daytime pair in STUD00
-                for teach_col, daytime_col in list(zip(teach_cols, daytime_cols)):
-                    # Check if instructor/daytime is already present
-                    if record[teach_col].strip() == new_class_info['TEACH'] and record[daytime_col].strip() == new_class_info['CLASSTIME']:
-                        # If this is a DUPLICATE classtime for the student, make sure we reset it to blank
-                        if student_enrolled:
-                            record[teach_col] = ''
-                            record[daytime_col] = ''
-                        else:
+                # Add new instructor/daytime to student's record
+                with record:
+                    # Track duplicate classtimes
+                    student_enrolled = False
+                    # Loop through each instructor/daytime pair in STUD00
+                    for teach_col, daytime_col in list(zip(teach_cols, daytime_cols)):
+                        # Check if instructor/daytime is already present
+                        if record[teach_col].strip() == new_class_info['TEACH'] and record[daytime_col].strip() == new_class_info['CLASSTIME']:
+                            # If this is a DUPLICATE classtime for the student, make sure we reset it to blank
+                            if student_enrolled:
+                                record[teach_col] = ''
+                                record[daytime_col] = ''
+                            else:
+                                student_enrolled = True
+                        # Put instructor/daytime into first blank spot (if not already enrolled)
+                        elif record[teach_col].strip() == '' and not student_enrolled:
+                            record[teach_col] = new_class_info['TEACH']
+                            record[daytime_col] = new_class_info['CLASSTIME']
                             student_enrolled = True
-                    # Put instructor/daytime into first blank spot (if not already enrolled)
-                    elif record[teach_col].strip() == '' and not student_enrolled:
-                        record[teach_col] = new_class_info['TEACH']
-                        record[daytime_col] = new_class_info['CLASSTIME']
-                        student_enrolled = True
+        self.queue_dbf_write(write_dbf)
     
 
     # Remove student from class associated with `class_id`
     # This function deletes the relevant record to `class_student` before modifying the DBF files
     # to 1) remove student from `clsbymon.dbf` if they are present,
     # and 2) remove instructor/daytime information from the student's record in `STUD00.dbf`
+    @journaled
     def unenroll_student(self, student_id, class_id, wait_var=None,class_roll_only=True):
         ## Step 1: Remove student from class in `class_student`
-        record = self.class_student[((self.class_student['STUDENT_ID'] == student_id) & (self.class_student['CLASS_ID'] == class_id))]
+        record = self.rows('class_student', STUDENT_ID=student_id, CLASS_ID=class_id)
         if not class_roll_only:
             # Remove student from class (function arguments are already validated, so student_id / class_id are a valid pair)
             self.class_student = self.class_student.drop(record.index).reset_index(drop=True)
             # Open up a spot in the current class by adding 1 to the 'AVAILABLE' column
-            self.classes.loc[self.classes['CLASS_ID'] == class_id, 'AVAILABLE'] += 1
+            self.classes.loc[self.row_index('classes', class_id), 'AVAILABLE'] += 1
+            self.log_change('class_student', CLASS_ID=class_id, STUDENT_ID=student_id)
+            self.log_change('classes', CLASS_ID=class_id)
 
         ## STEP 2: Remove student from class roll in DBF file
-        studentno = self.student.loc[self.student['STUDENT_ID']==student_id,'STUDENTNO'].values[0]
-        studentno_cols = [col for col in self.classes_dbf.field_names if 'NUMB' in col]
+        studentno = self.row('student', student_id)['STUDENTNO']
+        class_info = self.row('classes', class_id)
+
+        def write_dbf():
+            # Open 'clsbymon.dbf'
+            with self.classes_dbf:
+                studentno_cols = [col for col in self.classes_dbf.field_names if 'NUMB' in col]
+                # Get DBF record corresponding to current (old) class
+                record = self.classes_dbf.record(class_id)
+                with record:
+                    # Loop through each student column
+                    for field in studentno_cols:
+                        # Check if this is the student we wish to remove
+                        if record[field] == studentno:
+                            # If so, delete this studentno and student name from the class
+                            record[field] = 0
+                            record[f'STUDENT{field[4:]}'] = None
+                            # Open up a spot by adding 1 to 'AVAILABLE' column
+                            record['AVAILABLE'] += 1
+                            break
 
-        # Open 'clsbymon.dbf'
-        with self.classes_dbf:
-            class_id_idx = self.classes_dbf.create_index(lambda rec: rec.class_id)
-
-            # Get DBF record corresponding to current (old) class
-            record = class_id_idx.search(match=class_id)[0]
-            with record:
-                # Loop through each student column
-                for field in studentno_cols:
-                    # Check if this is the student we wish to remove
-                    if record[field] == studentno:
-                        # If so, delete this studentno and student name from the class
-                        record[field] = 0
-                        record[f'STUDENT{field[4:]}'] = None
-                        # Open up a spot by adding 1 to 'AVAILABLE' column
-                        record['AVAILABLE'] += 1
-                        break
-
-        # If class_roll_only == True, we are just removing the student from the class roll,
-        # but want to leave the class information in their student record.
-        if not class_roll_only:
-            class_info = self.classes[self.classes['CLASS_ID']==class_id].squeeze()
-            teach_cols, daytime_cols = ['INSTRUCTOR', 'INST2', 'INST3'], ['DAYTIME','DAYTIME2','DAYTIME3']
+            # If class_roll_only == True, we are just removing the student from the class roll,
+            # but want to leave the class information in their student record.
+            if not class_roll_only:
+                teach_cols, daytime_cols = ['INSTRUCTOR', 'INST2', 'INST3'], ['DAYTIME','DAYTIME2','DAYTIME3']
 
-            # Open `STUD00.dbf`
-            with self.student_dbf:
-                studentno_idx = self.student_dbf.create_index(lambda rec: rec.studentno)
-                # Get DBF record corresponding to student
-                record = studentno_idx.search(match=studentno)[0]
+                # Open `STUD00.dbf`
+                with self.student_dbf:
+                    # Get DBF record corresponding to student
+                    record = self.student_dbf.record(studentno)
 
-                # Remove instructor/daytime from student's record
-                with record:
-                    # Loop through each instructor/daytime pair in STUD00
-                    for teach_col, daytime_col in list(zip(teach_cols, daytime_cols)):
-                        # Check if this is the class we wish to remove
-                        if record[teach_col].strip() == class_info['TEACH'] and record[daytime_col].strip() == class_info['CLASSTIME']:
-                            # If so, delete this instructor and daytime from the student's record
-                            record[teach_col] = ''
-                            record[daytime_col] = ''
-
-                    # Loop through each instructor/daytime pair AGAIN to make sure the classes get shifted up (if needed)
-                    previous_class_info = {'TEACH_placeholder' : 'teach', 'CLASSTIME_placeholder' : 'classtime'}
-                    for teach_col, daytime_col in list(zip(teach_cols, daytime_cols)):
-                        # If the previous classtime values are blank...
-                        if not any([val.strip() for val in previous_class_info.values()]):
-                            # And the current classtime values are NOT blank, shift them to the previous pair of fields
-                            if record[teach_col].strip() != '':
-                                for field in previous_class_info.keys():
-                                    record[field] = record[teach_col] if 'INS' in field else record[daytime_col]
-                                    
+                    # Remove instructor/daytime from student's record
+                    with record:
+                        # Loop through each instructor/daytime pair in STUD00
+                        for teach_col, daytime_col in list(zip(teach_cols, daytime_cols)):
+                            # Check if this is the class we wish to remove
+                            if record[teach_col].strip() == class_info['TEACH'] and record[daytime_col].strip() == class_info['CLASSTIME']:
+                                # If so, delete this instructor and daytime from the student's record
                                 record[teach_col] = ''
                                 record[daytime_col] = ''
-                        # Set the current classtime values to 'previous' and continue
-                        previous_class_info = {teach_col : record[teach_col], daytime_col : record[daytime_col]}
-
 
+                        # Loop through each instructor/daytime pair AGAIN to make sure the classes get shifted up (if needed)
+                        previous_class_info = {'TEACH_placeholder' : 'teach', 'CLASSTIME_placeholder' : 'classtime'}
+                        for teach_col, daytime_col in list(zip(teach_cols, daytime_cols)):
+                            # If the previous classtime values are blank...
+                            if not any([val.strip() for val in previous_class_info.values()]):
+                                # And the current classtime values are NOT blank, shift them to the previous pair of fields
+                                if record[teach_col].strip() != '':
+                                    for field in previous_class_info.keys():
+                                        record[field] = record[teach_col] if 'INS' in field else record[daytime_col]
+                                    
+                                    record[teach_col] = ''
+                                    record[daytime_col] = ''
+                            # Set the current classtime values to 'previous' and continue
+                            previous_class_info = {teach_col : record[teach_col], daytime_col : record[daytime_col]}
+        self.queue_dbf_write(write_dbf)
 
-                            
-                            
-
-    
         # Change wait variable value to exit edit mode
         if wait_var:
             wait_var.set('done')
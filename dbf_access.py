@@ -0,0 +1,313 @@
+# `dbf_access.py`
+#
+# Access to the records of the original DBF files (STUD00, STUD99, clsbymon) by their key field
+# (STUDENTNO or CLASS_ID), for the functions in `StudentDatabase` which edit one record at a time.
+#
+# Instead of building a new index (`create_index`, a full scan of the file) for every edit, each `DBFTable`
+# keeps a dictionary of key -> record number for the whole session, so finding a record is a single lookup.
+# The dictionary is built the first time a record is looked up, and is updated when this program appends a record.
+# It is rebuilt when the number of records in the file changes some other way (the old program added or packed
+# records), or when the record found no longer has the key that was looked up (the old program changed the key).
+#
+# The file itself is still opened (reading just the header) and closed around each edit, so that every change
+# is on disk straight away and records changed by the old program in the meantime are read again.
+#
+# Between `begin` and `flush`, the table is opened only once, and changes to the fields of records returned by
+# `record` are collected instead of being written straight away (reading a field gives the pending value, if
+# there is one). Writing the same field more than once only keeps the last value, and `flush` writes all of the
+# changed records in one pass. `StudentDatabase` does this for each call which changes the tables (see `journaled`),
+# so i.e. moving a student to a new class opens/writes each file once, rather than once for every step.
+#
+# All of the reading/writing of the DBF files happens on a single background thread (`DBFWriter`), so the screen
+# doesn't wait for the files (which may be large, or on a slow network drive). The changes from each call are
+# written in the order the calls were made. If writing fails, the writer stops (so later changes to the same
+# records are not written out of order) until the error is dealt with (see `STMNU.check_dbf_writer`).
+#
+# The type/length of every field is read from the file header once (`DBFTable.fields`), along with a function
+# for each field which checks a value entered by the user (`validators`) and one which cuts a value down to fit
+# in the field (`truncators`), so checking/preparing an edit doesn't need to ask the `dbf.Table` for each field.
+
+# Libraries
+import dbf
+import queue
+import threading
+import traceback
+from collections import namedtuple
+import functions as fn
+
+# Information about a field in a DBF file: `type` is the dBase field type ('C' = text, 'N' = number, 'D' = date, 'L' = logical)
+FieldSpec = namedtuple('FieldSpec', ['name', 'type', 'length', 'decimals'])
+
+
+class DBFTable:
+    def __init__(self, path, key_field):
+        self.table = dbf.Table(path)
+        self.key_field = key_field
+        # Record number for each key, and the number of records in the file when it was built
+        self.record_numbers = None
+        self.record_count = None
+        # Changes waiting to be written (dictionary of key -> {field : value}), or None if changes are written straight away
+        self.pending = None
+        # Whether the table has been left open until `flush`
+        self.held_open = False
+        # Values of the records written/appended since `take_written` was last called (dictionary of key -> `values`)
+        self.written = {}
+        # Information about each field (see `fields`), and the functions built from it
+        self.field_specs = None
+        self.validators = None
+        self.truncators = None
+
+    # Open the table (same as `with dbf.Table:`). Between `begin` and `flush`, the table stays open until `flush`.
+    def __enter__(self):
+        self.table.__enter__()
+        if self.pending is not None and not self.held_open:
+            self.table.__enter__()
+            self.held_open = True
+        return self
+
+    def __exit__(self, *exc_info):
+        return self.table.__exit__(*exc_info)
+
+    def __iter__(self):
+        return iter(self.table)
+
+    # Everything else (`field_names`, `field_info`, `add_fields`, ...) comes from the `dbf.Table`
+    def __getattr__(self, name):
+        return getattr(self.table, name)
+
+    # Dictionary of field name -> `FieldSpec`, read from the file the first time it is needed
+    @property
+    def fields(self):
+        if self.field_specs is None:
+            self.load_fields()
+        return self.field_specs
+
+    def load_fields(self):
+        field_specs = {}
+        for name in self.table.field_names:
+            info = self.table.field_info(name)
+            field_specs[name.upper()] = FieldSpec(name.upper(), chr(info.field_type), info.length, info.decimal)
+        self.validators = {name : validator(spec) for name, spec in field_specs.items()}
+        self.truncators = {name : truncator(spec) for name, spec in field_specs.items()}
+        self.field_specs = field_specs
+
+    # Add fields to the file (same as `dbf.Table.add_fields`), then read the field information again
+    def add_fields(self, field_specs):
+        self.table.add_fields(field_specs)
+        self.field_specs = None
+
+    # Check the value entered by the user for `field` (`dtype` is the type of the entry box, i.e. 'string', 'float').
+    # Returns the error message to show, or None if the value is valid.
+    def validate(self, field, value, dtype):
+        if self.field_specs is None:
+            self.load_fields()
+        if field not in self.validators:
+            # Fields which are not in the file are only checked against the type of the entry box
+            print(f'{field} not found in DBF')
+            return validator(FieldSpec(field, 'D', 8, 0))(value, dtype)
+        return self.validators[field](value, dtype)
+
+    # Cut `value` down to fit in `field` (if it is too long for the field)
+    def truncate(self, field, value):
+        if self.field_specs is None:
+            self.load_fields()
+        return self.truncators[field](value)
+
+    # Get the record whose key field is `key` (the table must be open). Between `begin` and `flush`,
+    # changes to the record are collected rather than written (see `PendingRecord`).
+    def record(self, key):
+        if self.pending is not None:
+            return PendingRecord(self.find(key), self.pending.setdefault(key, {}))
+        return self.find(key)
+
+    # Start collecting changes to records (see `record`)
+    def begin(self):
+        if self.pending is None:
+            self.pending = {}
+
+    # Write all of the changes collected since `begin`, one record at a time, and close the table
+    def flush(self):
+        pending = {key : fields for key, fields in (self.pending or {}).items() if fields}
+        try:
+            if pending:
+                with self.table:
+                    for key, fields in pending.items():
+                        dbf.write(self.find(key), **fields)
+                    for key in pending:
+                        self.written[key] = self.values(key)
+        finally:
+            self.discard()
+
+    # Throw away the changes collected since `begin` (i.e. if something went wrong), and close the table
+    def discard(self):
+        self.pending = None
+        if self.held_open:
+            self.held_open = False
+            self.table.__exit__(None, None, None)
+
+    # Find the record whose key field is `key` (the table must be open)
+    def find(self, key):
+        if self.record_numbers is None or len(self.table) != self.record_count:
+            self.build_index()
+        record_number = self.record_numbers.get(key)
+        if record_number is None or self.table[record_number][self.key_field] != key:
+            self.build_index()
+            record_number = self.record_numbers[key]
+        return self.table[record_number]
+
+    # Values of the record whose key field is `key` (the table must be open), as a dictionary of field -> value.
+    # Text is given without the padding at the end, the same as when the file is read with `dbfread` (see `fn.dbf_to_dataframe`).
+    def values(self, key):
+        record = self.find(key)
+        values = {}
+        for name in self.fields:
+            value = record[name]
+            values[name] = value.rstrip('\0 ') if isinstance(value, str) else value
+        return values
+
+    # Values of the records written/appended since the last call, read while the table was still open
+    # (see `StudentDatabase.update_record_hashes`)
+    def take_written(self):
+        written, self.written = self.written, {}
+        return written
+
+    # Add a record (`values` is a dictionary of field -> value) to the end of the table
+    def append(self, values):
+        self.table.append(values)
+        if self.record_numbers is not None and self.record_count == len(self.table) - 1:
+            record = self.table[-1]
+            self.record_numbers.setdefault(record[self.key_field], dbf.recno(record))
+            self.record_count = len(self.table)
+        key = self.table[-1][self.key_field]
+        self.written[key] = self.values(key)
+
+    # Physically remove the deleted records (this changes the record numbers, so the index is rebuilt next time)
+    def pack(self):
+        self.table.pack()
+        self.record_numbers = None
+
+    # Build the key -> record number dictionary (if a key appears more than once, the first record is used)
+    def build_index(self):
+        self.record_numbers = {}
+        for record in self.table:
+            self.record_numbers.setdefault(record[self.key_field], dbf.recno(record))
+        self.record_count = len(self.table)
+
+
+# Record returned by `DBFTable.record` between `begin` and `flush`. Reading a field gives the new value (if it was changed),
+# and changing a field only stores the new value in `fields` (used like a normal record, including `with record:`).
+class PendingRecord:
+    def __init__(self, record, fields):
+        self.record = record
+        self.fields = fields
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __getitem__(self, field):
+        return self.fields[field] if field in self.fields else self.record[field]
+
+    def __setitem__(self, field, value):
+        self.fields[field] = value
+
+
+# Build the function which checks a value entered by the user for the field `spec` (see `DBFTable.validate`)
+def validator(spec):
+    date_error = f'Error: {spec.name} must be entered in standard date format (MM/DD/YYYY).'
+    float_error = f'Error: {spec.name} must be a number between 0 and 999.99'
+    length_error = f'Error: {spec.name} cannot be longer than {spec.length} characters.'
+
+    def validate(value, dtype):
+        if dtype == 'datetime.date':
+            return None if fn.validate_date(value) else date_error
+        elif dtype == 'float':
+            return None if len(value) > 0 and float(value) <= 999.99 else float_error
+        elif dtype in ('string', 'int'):
+            return None if len(value) <= spec.length else length_error
+        return None
+    return validate
+
+
+# Build the function which cuts a value down to fit in the field `spec` (dates are left as they are)
+def truncator(spec):
+    if spec.type == 'D':
+        return lambda value: value
+    return lambda value: str(value)[:spec.length] if len(str(value)) > spec.length else value
+
+
+# Background thread which writes changes to the DBF files, one task at a time in the order they were submitted.
+# Each task is a list of functions which read/write the `tables` (see `DBFTable`); the changes made by one task are
+# collected and written together (see `DBFTable.begin`).
+class DBFWriter:
+    def __init__(self, tables):
+        self.tables = tables
+        self.tasks = queue.Queue()
+        # If a task failed: (name of the task, error message). The writer waits until `retry` or `skip` is called.
+        self.error = None
+        self.resume = threading.Event()
+        self.retry_task = False
+        threading.Thread(target=self.run, daemon=True).start()
+
+    # Add a task to the end of the queue. `name` describes the task (used in error messages), `jobs` is the list of
+    # functions to run, and `on_done` (if given) is called once the changes have been written (or skipped).
+    def submit(self, name, jobs, on_done=None):
+        self.tasks.put((name, jobs, on_done))
+
+    def run(self):
+        while True:
+            name, jobs, on_done = self.tasks.get()
+            while True:
+                try:
+                    self.write(jobs)
+                    break
+                except Exception:
+                    print(f'Error writing {name} to DBF files:')
+                    print(traceback.format_exc())
+                    self.error = (name, traceback.format_exc(limit=0).strip())
+                    self.resume.wait()
+                    self.resume.clear()
+                    if not self.retry_task:
+                        break
+            # (Also called if the task was skipped, since the changes were still made to the tables)
+            try:
+                if on_done is not None:
+                    on_done()
+            except Exception:
+                print(traceback.format_exc())
+            self.tasks.task_done()
+
+    # Run the functions in `jobs`, then write all of their changes
+    def write(self, jobs):
+        for table in self.tables:
+            table.begin()
+        try:
+            for job in jobs:
+                job()
+        except Exception:
+            for table in self.tables:
+                table.discard()
+            raise
+        for table in self.tables:
+            table.flush()
+
+    # Try the failed task again
+    def retry(self):
+        self.error = None
+        self.retry_task = True
+        self.resume.set()
+
+    # Give up on the failed task and continue with the next one
+    def skip(self):
+        self.error = None
+        self.retry_task = False
+        self.resume.set()
+
+    # Wait until every task has been written. Returns False if the writer stopped because a task failed.
+    def wait(self):
+        with self.tasks.all_tasks_done:
+            while self.tasks.unfinished_tasks and self.error is None:
+                self.tasks.all_tasks_done.wait(0.1)
+        return self.error is None
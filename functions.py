@@ -7,6 +7,7 @@ import customtkinter as ctk
 from dbfread import DBF
 import dbf
 import re
+from storage import CSVStorage
 from dotenv import load_dotenv
 
 import functions as fn
@@ -44,78 +45,345 @@ def dbf_to_csv(filename, save_to_path='C:\\STMNU2\\data\\dbf_format'):
     except UnicodeDecodeError:
         print(f'Could not convert {filename}')
 
+# Function to decode a given .dbf file straight into a dataframe, skipping the .csv file
+# written by `dbf_to_csv`. Each field is converted into a typed column using its DBF field type,
+# and blank values are stored as missing so the result matches what `pd.read_csv` would
+# give us after a round-trip through `dbf_to_csv`.
+def dbf_to_dataframe(dbf_path):
+    # Read records as plain lists of values (no dictionary per record), then build the columns in one go
+    records = DBF(dbf_path, recfactory=lambda items: [value for _, value in items])
+    df = pd.DataFrame(list(records), columns=records.field_names)
+    return format_dbf_columns(df, {field.name : field.type for field in records.fields})
+
+# Convert the columns of `df` (raw values read from a DBF file) by their dBase field type
+# (`field_types` is a dictionary of field name -> type, i.e. 'C', 'N', 'D')
+def format_dbf_columns(df, field_types):
+    for name, field_type in field_types.items():
+        column = df[name]
+        # Dates: blank dates are already None, so convert straight to datetime64
+        if field_type == 'D':
+            df[name] = pd.to_datetime(column, errors='coerce')
+        # Numbers: whole numbers stay integers unless there are blanks (same as `pd.read_csv`)
+        elif field_type in ('N', 'F'):
+            df[name] = pd.to_numeric(column, errors='coerce')
+        # Character fields: blank strings become missing values
+        elif field_type == 'C':
+            df[name] = column.replace('', np.nan)
+
+    return df
+
+# Columns which identify each record in the DBF files (used to detect which records changed between runs)
+DBF_KEYS = {'STUD00' : 'STUDENTNO', 'STUD99' : 'STUDENTNO', 'clsbymon' : 'CLASS_ID'}
+
+# Drop the records in STUD00/STUD99 where the name is completely missing, then number
+# the remaining records (the record number becomes 'STUDENT_ID' in the new structure)
+def prepare_stud(STUD):
+    STUD = STUD.dropna(subset=['FNAME','LNAME']).reset_index(drop=True)
+    STUD.insert(0, 'STUDENT_ID', STUD.index + 1)
+    return STUD
+
+# Identify unique families in STUD00 (see GUARDIAN in `transform_to_rdb`)
+def build_families(STUD00):
+    # Since we only have first names, and a lot of the data is inconsistent
+    # (i.e. address in two records for the same student/parents has 'Street' and 'St'),
+    # I think the best way to identify unique guardians is by looking at mom/dad pairings
+    # and dropping the duplicates (including last name). Each family has a unique 'FAMILY_ID'.
+    families = STUD00.dropna(subset=['MOMNAME', 'DADNAME'], how='all'
+                    ).drop_duplicates(subset=['MOMNAME', 'DADNAME', 'LNAME']
+                    ).sort_values(by=['LNAME','MOMNAME','DADNAME']
+                    ).fillna('')
+    # Create a 'FAMILY_ID' by grouping by Last Name, Mom Name, and Dad Name
+    # Note: this isn't foolproof as sometimes two siblings might have slightly different
+    # names entered for the mom/dad due to user error, but this should capture most families
+    families['FAMILY_ID'] = families.groupby(['LNAME','MOMNAME','DADNAME']).ngroup() + 1
+    return families
+
+# Create `guardian` table from the families found by `build_families`
+def build_guardian(families):
+    # Extract mom/dad info and create new column to represent relationship to student
+    moms = families[families['MOMNAME'] != ''][['FAMILY_ID', 'MOMNAME', 'LNAME', 'PHONE', 'EMAIL']].rename(columns={'MOMNAME':'FNAME'})
+    moms.insert(1,'RELATION','MOM')
+    dads = families[families['DADNAME'] != ''][['FAMILY_ID', 'DADNAME', 'LNAME', 'PHONE', 'EMAIL']].rename(columns={'DADNAME':'FNAME'})
+    dads.insert(1,'RELATION','DAD')
+
+    # Combine moms/dads into new table 'guardian', which holds guardian contact info.
+    # The guardian will be connected to their children via the 'FAMILY_ID' key.
+    guardian = pd.concat([moms, dads]).sort_values(by=['LNAME','FNAME'])
+    guardian.insert(0, 'GUARDIAN_ID', list(range(1,guardian.shape[0]+1)))
+    guardian = guardian.sort_values(by=['FAMILY_ID','GUARDIAN_ID'])
+    # `families` has blanks filled in with '' (for grouping), so put back missing phone numbers/emails
+    # (same as when the table is read back from a .csv file)
+    guardian[['PHONE','EMAIL']] = guardian[['PHONE','EMAIL']].replace('', np.nan)
+
+    # Create/update timestamps (placeholder)
+    guardian.insert(len(guardian.columns),'CREA_TMS',[datetime.now()]*guardian.shape[0])
+    guardian.insert(len(guardian.columns),'UPDT_TMS',[datetime.now()]*guardian.shape[0])
+    return guardian
+
+# Create `student` table (without FAMILY_ID/ACTIVE) from STUD00. This table is very similar
+# to 'STUD00', just with parent and payment info extracted
+def build_student(STUD00):
+    return pd.DataFrame({'STUDENT_ID' : STUD00['STUDENT_ID'],
+                         'CLASS'      : STUD00['CLASS'],
+                         'STUDENTNO'  : STUD00['STUDENTNO'],
+                         'FNAME'      : STUD00['FNAME'],
+                         'LNAME'      : STUD00['LNAME'],
+                         'BIRTHDAY'   : STUD00['BIRTHDAY'],
+                         'ENROLLDATE' : STUD00['ENROLLDATE'],
+                         'REGFEE'     : STUD00['REGFEE'],
+                         'REGFEEDATE' : STUD00['REGFEEDATE'],
+                         'REGBILL'    : STUD00['REGBILL'],
+                         'MONTHLYFEE' : STUD00['MONTHLYFEE'],
+                         'BALANCE'    : STUD00['BALANCE'],
+                         'PHONE'      : STUD00['PHONE'],
+                         'EMAIL'      : STUD00['EMAIL'],
+                         'ADDRESS'    : STUD00['ADDRESS'],
+                         'CITY'       : STUD00['CITY'],
+                         'STATE'      : STUD00['STATE'],
+                         'ZIP'        : STUD00['ZIP'],
+                         'CREA_TMS'   : [datetime.now()]*STUD00.shape[0],
+                         'UPDT_TMS'   : [datetime.now()]*STUD00.shape[0],})
+
+# Year that the payments in a STUD table belong to (the most common year among the payment dates).
+# Dates are strings when read from .csv, and datetimes when decoded in memory.
+def payment_year(STUD):
+    dates = pd.concat([pd.to_datetime(STUD[month.upper() + 'DATE']) for month in calendar.month_abbr[1:]])
+    return int(dates.dt.year.mode()[0])
+
+# Create payment/bill records for the students in `STUD` (STUD00 or STUD99). The records are
+# identified by STUDENTNO (STUDENT_ID is joined on afterwards from `student`).
+# `year` is the year of the monthly payments, and `regfee_year` is the year assigned to REGFEE bills.
+def build_payment_bill(STUD, year, regfee_year):
+    months = [month.upper() for month in calendar.month_abbr[1:]]
+    # Sort students by STUDENTNO, so the records come out in the same order as they always have
+    STUD = STUD.iloc[np.argsort(STUD['STUDENTNO'].to_numpy(), kind='stable')]
+    # The {MON}PAY/{MON}DATE/{MON}BILL columns form a fixed (students x 12 months) block for each of PAY, DATE and BILL.
+    # Flattening each block gives one row per student per month, in order (student 1 JAN, student 1 FEB, ...)
+    pay_block  = STUD[[month + 'PAY'  for month in months]].to_numpy(dtype='float64', na_value=np.nan)
+    date_block = STUD[[month + 'DATE' for month in months]].to_numpy()
+    bill_block = STUD[[month + 'BILL' for month in months]].to_numpy(dtype=object)
+
+    pay = pay_block.ravel()
+    bill_flag = bill_block.ravel()
+    df = pd.DataFrame({'STUDENTNO' : np.repeat(STUD['STUDENTNO'].to_numpy(), 12),
+                       'MONTH'     : np.tile(np.arange(1, 13), STUD.shape[0]),
+                       'PAY'       : pay,
+                       'DATE'      : date_block.ravel(),
+                       'BILL'      : bill_flag,
+                       'YEAR'      : year})
+
+    # When payment is 0 and BILL = '*', this indicates a payment is owed.
+    # Create records in a new table 'bill' to represent owed payments
+    bill = df.loc[((pay == 0) | np.isnan(pay)) & (bill_flag == '*'), ['STUDENTNO', 'MONTH', 'YEAR']].reset_index(drop=True)
+    # Also add REGFEE bills from STUD tables to `bill`
+    regfee_bills = STUD.loc[STUD['REGBILL'] == '*', ['STUDENTNO']].assign(MONTH=13, YEAR=regfee_year)
+    bill = pd.concat([bill, regfee_bills], ignore_index=True)
+
+    # All remaining records with non-zero payments are saved to 'payment'
+    payment = df[(pay != 0) & ~np.isnan(pay)].reset_index(drop=True)
+    return payment, bill
+
+# Create `classes` table from clsbymon
+def build_classes(clsbymon):
+    # Keep the first 11 columns from 'clsbymon', and FINAL column (CLASS_ID)
+    classes = clsbymon.iloc[:,list(range(11)) + [clsbymon.shape[1]-1]].copy()
+    # Timestamp columns (placeholder)
+    classes.insert(len(classes.columns),'CREA_TMS',[datetime.now()]*classes.shape[0])
+    classes.insert(len(classes.columns),'UPDT_TMS',[datetime.now()]*classes.shape[0])
+    return classes
+
+# Create `class_student` table (connects students with classes) from STUD00 and clsbymon
+def build_class_student(STUD00, clsbymon):
+    class_student = pd.DataFrame()
+
+    # Go through each instructor/daytime combination, then join with 'clsbymon' to get corresponding CLASS_ID
+    # (if the instructor/daytime does not exist in clsbymon, then no record is created in 'class_student')
+    for teach_col, daytime_col in list(zip(['INSTRUCTOR', 'INST2', 'INST3'], ['DAYTIME','DAYTIME2','DAYTIME3'])):
+        # Get students who have instructor
+        students_with_class = STUD00.loc[~pd.isna(STUD00[teach_col])
+                                ].loc[:, ['STUDENT_ID', teach_col, daytime_col]
+                                ].rename(columns={teach_col : 'TEACH', daytime_col : 'CLASSTIME'})
+        # Join to get CLASS_ID, then append
+        class_student = pd.concat([class_student, students_with_class.merge(clsbymon[['CLASS_ID','TEACH','CLASSTIME']],
+                                                                            how='inner', on=['TEACH','CLASSTIME']
+                                                ).loc[:, ['CLASS_ID','STUDENT_ID']]], ignore_index=True)
+
+    # Sort values
+    return class_student.sort_values(by=['CLASS_ID', 'STUDENT_ID'])
+
+# Create `wait` table (waitlist) from clsbymon
+def build_wait(clsbymon):
+    columns = ['CLASS_ID'] + [col for i in range(1, 5) for col in (f'WAIT{i}', f'W{i}PHONE')]
+    wait_df = clsbymon[columns]
+
+    # Step 1: Reshape the DataFrame using melt
+    df_long = wait_df.melt(id_vars=['CLASS_ID'], var_name='variable', value_name='value')
+
+    # Add ranking column to ensure rows are sorted properly within each class
+    col_name_to_rank = {**{f'WAIT{i}'   : (2*(i-1)+1) for i in range(1,5)},
+                        **{f'W{i}PHONE' : (2*i)       for i in range(1,5)}}
+    df_long['COL_RANK'] = df_long['variable'].map(col_name_to_rank)
+    df_long = df_long.sort_values(by=['CLASS_ID', 'COL_RANK'])
+
+    # Add column to remember which waitlist each row corresponds to
+    # (this is necessary for compatibility with DBF files)
+    df_long['WAIT_NO'] = df_long['variable'].str.extract('(\\d+)')
+
+    # Step 2: Extract TYPE from the column names
+    df_long['TYPE'] = np.where(df_long['variable'].str.contains('WAIT'), 'NAME', 'PHONE')
+
+    # Step 3: Group data by CLASS_ID and column type for alignment
+    df_long['row'] = df_long.groupby(['CLASS_ID','TYPE']).cumcount()
+
+    # Step 4: Pivot the table to align DATE, NAME, and PHONE
+    df_pivot = df_long.pivot(index=['CLASS_ID', 'WAIT_NO', 'row'], columns='TYPE', values='value')
+    df_pivot.columns.name = None
+    df_pivot = df_pivot.reset_index()
+
+    # Step 5: Drop the helper index, reorder columns, and create 'TRIAL_ID'
+    wait = df_pivot[['CLASS_ID', 'WAIT_NO', 'NAME', 'PHONE']]
+
+    # Finally, keep only the rows which have some data
+    wait = wait.dropna(how='all', subset=['NAME','PHONE']).reset_index(drop=True)
+    wait.insert(0, 'WAIT_ID', wait.index + 1)
+    # Timestamp columns (placeholder)
+    wait.insert(len(wait.columns),'CREA_TMS',[datetime.now()]*wait.shape[0])
+    wait.insert(len(wait.columns),'UPDT_TMS',[datetime.now()]*wait.shape[0])
+    return wait
+
+# Create `trial` table from clsbymon
+def build_trial(clsbymon):
+    columns = ['CLASS_ID'] + [col for i in range(1, 9) for col in (f'TRIAL{i}', f'T{i}PHONE', f'T{i}DATE')]
+    trial_df = clsbymon[columns]
+
+    # Step 1: Reshape the DataFrame using melt
+    df_long = trial_df.melt(id_vars=['CLASS_ID'], var_name='variable', value_name='value')
+
+    # Add ranking column to ensure rows are sorted properly within each class
+    col_name_to_rank = {**{f'TRIAL{i}'  : (i + (2*i - 2)) for i in range(1,9)},
+                        **{f'T{i}PHONE' : (i + (2*i - 1)) for i in range(1,9)},
+                        **{f'T{i}DATE'  : (i + (2*i - 0)) for i in range(1,9)}}
+    df_long['COL_RANK'] = df_long['variable'].map(col_name_to_rank)
+    df_long = df_long.sort_values(by=['CLASS_ID', 'COL_RANK'])
+
+    # Add column to remember which trial each row corresponds to
+    # (this is necessary for compatibility with DBF files, where the trials
+    # do not necessarily need to be edited in order, i.e. it is common for trials 7/8
+    # to have data while all the other trials are blank, and we need to preserve this ordering)
+    df_long['TRIAL_NO'] = df_long['variable'].str.extract('(\\d+)')
+
+    # Step 2: Extract TYPE from the column names
+    df_long['TYPE'] = np.where(df_long['variable'].str.contains('TRIAL'), 'NAME', np.where(
+                            df_long['variable'].str.contains('PHONE'), 'PHONE', 'DATE'
+                            ))
+
+    # Step 3: Group data by CLASS_ID and column type for alignment
+    df_long['row'] = df_long.groupby(['CLASS_ID','TYPE']).cumcount()
+
+    # Step 4: Pivot the table to align DATE, NAME, and PHONE
+    df_pivot = df_long.pivot(index=['CLASS_ID', 'TRIAL_NO', 'row'], columns='TYPE', values='value')
+    df_pivot.columns.name = None
+    df_pivot = df_pivot.reset_index()
+
+    # Step 5: Drop the helper index, reorder columns, and create 'TRIAL_ID'
+    trial = df_pivot[['CLASS_ID', 'TRIAL_NO', 'NAME', 'PHONE', 'DATE']]
+
+    # Finally, keep only the rows which have some data
+    trial = trial.dropna(how='all', subset=['NAME','PHONE','DATE']).reset_index(drop=True)
+    trial.insert(0, 'TRIAL_ID', trial.index + 1)
+    # Timestamp columns (placeholder)
+    trial.insert(len(trial.columns),'CREA_TMS',[datetime.now()]*trial.shape[0])
+    trial.insert(len(trial.columns),'UPDT_TMS',[datetime.now()]*trial.shape[0])
+    return trial
+
+# Create `note` table (student notes and class notes) from STUD00 and clsbymon
+def build_note(STUD00, clsbymon):
+    # Column names for student notes (3 placeholder columns)
+    note_cols = [f'NOTE{i}' for i in range(1,4)]
+    # Extract student notes, dropping rows where all three note columns are blank
+    student_note = STUD00[['STUDENT_ID'] + note_cols].dropna(subset=note_cols, how='all')
+    # Combine all the non-blank notes into a single column, separating each note
+    # with a newline so they will display the same as the old program
+    student_note['NOTE_TXT'] = student_note[note_cols].apply(
+        lambda x: '\n'.join(x.dropna().astype(str)), axis=1
+    )
+    # Drop the old columns
+    student_note = student_note.drop(columns=note_cols)
+
+    # Column names for class notes (3 placeholder columns)
+    note_cols = [f'NOTE{i}' for i in range(1,5)]
+    # Extract student notes, dropping rows where all four note columns are blank
+    class_note = clsbymon[['CLASS_ID'] + note_cols].dropna(subset=note_cols, how='all')
+    # Combine all the non-blank notes into a single column, separating each note
+    # with a newline so they will display the same as the old program
+    class_note['NOTE_TXT'] = class_note[note_cols].apply(
+        lambda x: '\n'.join(x.dropna().astype(str)), axis=1
+    )
+    # Drop the old columns
+    class_note = class_note.drop(columns=note_cols)
+
+    # Add blank CLASS_ID to 'stud_note' and blank STUDENT_ID to 'class_note' so we can combine them
+    student_note.insert(0, 'CLASS_ID', [pd.NA]*student_note.shape[0])
+    class_note.insert(0, 'STUDENT_ID', [pd.NA]*class_note.shape[0])
+
+    # Create final table `note` which contains both student and class notes
+    note = pd.concat([student_note, class_note], axis=0).sort_values(by=['STUDENT_ID', 'CLASS_ID'])
+    note.insert(0, 'NOTE_ID', list(range(1, note.shape[0]+1)))
+    # Timestamp columns (placeholder)
+    note.insert(len(note.columns),'CREA_TMS',[datetime.now()]*note.shape[0])
+    note.insert(len(note.columns),'UPDT_TMS',[datetime.now()]*note.shape[0])
+    return note
+
 # Function to transform old data structure to a new relational database structure
 # Note: for this function to work, the following files must be saved to 'C:\STMNU2\Data\':
 #       - STUD00.csv
 #       - STUD99.csv
 #       - clsbymon.csv
-def transform_to_rdb(data_path, save_to_path, do_not_load=[], update_active=False, write_to_csv=False):
+# Alternatively, `dbf_tables` can be a dictionary holding the 'STUD00', 'STUD99' and 'clsbymon'
+# dataframes (see `dbf_to_dataframe`), in which case no .csv files are read at all.
+# The new tables are returned as a dictionary, and are only saved to storage if `write_to_csv` is True.
+# If `executor` is given (i.e. a `ProcessPoolExecutor`), the payments for each year are reshaped in
+# separate worker processes while the rest of the tables are created.
+def transform_to_rdb(data_path, save_to_path, do_not_load=[], update_active=False, write_to_csv=False, dbf_tables=None,
+                     executor=None, storage=None):
+    # Tables from the last run are read from (and the new tables are written to) the csv files in
+    # `save_to_path`, unless a different `storage` is given (see `storage.py`)
+    storage = storage or CSVStorage(save_to_path)
     try:
-        # If necessary files are not found, throw error
-        if not os.path.isfile(data_path + '\\dbf_format\\STUD00.csv'): raise FileNotFoundError('STUD00.csv')
-        if not os.path.isfile(data_path + '\\dbf_format\\clsbymon.csv'): raise FileNotFoundError('clsbymon.csv')
+        if dbf_tables is None:
+            # If necessary files are not found, throw error
+            if not os.path.isfile(data_path + '\\dbf_format\\STUD00.csv'): raise FileNotFoundError('STUD00.csv')
+            if not os.path.isfile(data_path + '\\dbf_format\\clsbymon.csv'): raise FileNotFoundError('clsbymon.csv')
+
+            # Load .dbf files for students and classes
+            dbf_tables = {'STUD00'   : pd.read_csv('C:\\STMNU2\\data\\dbf_format\\STUD00.csv'),
+                          'STUD99'   : pd.read_csv('C:\\STMNU2\\data\\dbf_format\\STUD99.csv'),
+                          'clsbymon' : pd.read_csv('C:\\STMNU2\\data\\dbf_format\\clsbymon.csv')}
 
-        # Load .dbf files for students and classes
-        STUD00 = pd.read_csv('C:\\STMNU2\\data\\dbf_format\\STUD00.csv').dropna(subset=['FNAME','LNAME']).reset_index(drop=True)
-        STUD00.insert(0, 'STUDENT_ID', STUD00.index + 1)
-        STUD99 = pd.read_csv('C:\\STMNU2\\data\\dbf_format\\STUD99.csv').dropna(subset=['FNAME','LNAME']).reset_index(drop=True)
-        STUD99.insert(0, 'STUDENT_ID', STUD99.index + 1)
+        STUD00 = prepare_stud(dbf_tables['STUD00'])
+        STUD99 = prepare_stud(dbf_tables['STUD99'])
 
-        clsbymon = pd.read_csv('C:\\STMNU2\\data\\dbf_format\\clsbymon.csv')
+        clsbymon = dbf_tables['clsbymon']
+
+        ### PAYMENT and BILL ###
+        # Pivot payments for previous year and current year (done first, so that with an `executor`
+        # the reshape runs in the background while the other tables are created)
+        payment_bill = []
+        year = CURRENT_SESSION.year - 1
+        for STUD in [STUD99, STUD00]:
+            if executor is None:
+                payment_bill.append(build_payment_bill(STUD, payment_year(STUD), year))
+            else:
+                payment_bill.append(executor.submit(build_payment_bill, STUD, payment_year(STUD), year))
+            # move to current year before next loop
+            year += 1
 
         ### GUARDIAN ###
-        # Since we only have first names, and a lot of the data is inconsistent
-        # (i.e. address in two records for the same student/parents has 'Street' and 'St'),
-        # I think the best way to identify unique guardians is by looking at mom/dad pairings
-        # and dropping the duplicates (including last name). Each family has a unique 'FAMILY_ID'.
-        families = STUD00.dropna(subset=['MOMNAME', 'DADNAME'], how='all'
-                        ).drop_duplicates(subset=['MOMNAME', 'DADNAME', 'LNAME']
-                        ).sort_values(by=['LNAME','MOMNAME','DADNAME']
-                        ).fillna('')
-        # Create a 'FAMILY_ID' by grouping by Last Name, Mom Name, and Dad Name
-        # Note: this isn't foolproof as sometimes two siblings might have slightly different
-        # names entered for the mom/dad due to user error, but this should capture most families
-        families['FAMILY_ID'] = families.groupby(['LNAME','MOMNAME','DADNAME']).ngroup() + 1
-
-        # Extract mom/dad info and create new column to represent relationship to student
-        moms = families[families['MOMNAME'] != ''][['FAMILY_ID', 'MOMNAME', 'LNAME', 'PHONE', 'EMAIL']].rename(columns={'MOMNAME':'FNAME'})
-        moms.insert(1,'RELATION','MOM')
-        dads = families[families['DADNAME'] != ''][['FAMILY_ID', 'DADNAME', 'LNAME', 'PHONE', 'EMAIL']].rename(columns={'DADNAME':'FNAME'})
-        dads.insert(1,'RELATION','DAD')
-
-        # Combine moms/dads into new table 'guardian', which holds guardian contact info.
-        # The guardian will be connected to their children via the 'FAMILY_ID' key.
-        guardian = pd.concat([moms, dads]).sort_values(by=['LNAME','FNAME'])
-        guardian.insert(0, 'GUARDIAN_ID', list(range(1,guardian.shape[0]+1)))
-        guardian = guardian.sort_values(by=['FAMILY_ID','GUARDIAN_ID'])
-        
-        # Create/update timestamps (placeholder)
-        guardian.insert(len(guardian.columns),'CREA_TMS',[datetime.now()]*guardian.shape[0])
-        guardian.insert(len(guardian.columns),'UPDT_TMS',[datetime.now()]*guardian.shape[0])
+        families = build_families(STUD00)
+        guardian = build_guardian(families)
 
         ### STUDENT ###
-        # New table 'student' which is very similar to 'STUD00', just with
-        # parent and payment info extracted
-        student = pd.DataFrame({'STUDENT_ID' : STUD00['STUDENT_ID'],
-                                'CLASS'      : STUD00['CLASS'],
-                                'STUDENTNO'  : STUD00['STUDENTNO'],
-                                'FNAME'      : STUD00['FNAME'],
-                                'LNAME'      : STUD00['LNAME'],
-                                'BIRTHDAY'   : STUD00['BIRTHDAY'],
-                                'ENROLLDATE' : STUD00['ENROLLDATE'],
-                                'REGFEE'     : STUD00['REGFEE'],
-                                'REGFEEDATE' : STUD00['REGFEEDATE'],
-                                'REGBILL'    : STUD00['REGBILL'],
-                                'MONTHLYFEE' : STUD00['MONTHLYFEE'],
-                                'BALANCE'    : STUD00['BALANCE'],
-                                'PHONE'      : STUD00['PHONE'],
-                                'EMAIL'      : STUD00['EMAIL'],
-                                'ADDRESS'    : STUD00['ADDRESS'],
-                                'CITY'       : STUD00['CITY'],
-                                'STATE'      : STUD00['STATE'],
-                                'ZIP'        : STUD00['ZIP'],
-                                'CREA_TMS'   : [datetime.now()]*STUD00.shape[0],
-                                'UPDT_TMS'   : [datetime.now()]*STUD00.shape[0],})
+        student = build_student(STUD00)
 
         # Insert FAMILY_ID into student
         student = student.merge(STUD00[['STUDENTNO','MOMNAME','DADNAME']].fillna(''), how='left', on='STUDENTNO'
@@ -127,40 +395,36 @@ def transform_to_rdb(data_path, save_to_path, do_not_load=[], update_active=Fals
         family_id = student.pop('FAMILY_ID')
         student.insert(1, 'FAMILY_ID', family_id)
 
-        ### PAYMENT and BILL ###
-        payment = pd.DataFrame()
-        bill = pd.DataFrame()
-        payment_cols = ['STUDENTNO'] + [month.upper() + suffix for month in list(calendar.month_abbr[1:]) for suffix in ['PAY','DATE','BILL']]
-        # Pivot payments for previous year and current year to create 'payment' table
-        year = CURRENT_SESSION.year - 1
-        for STUD in [STUD99, STUD00]:
-            payment_df = STUD[payment_cols]
-            # 'Melt' dataframe so that all month column names are put into one column called 'COLUMN'
-            df_long = payment_df.melt(id_vars=['STUDENTNO'], var_name='COLUMN', value_name='VALUE')
-            df_long['MONTH'] = df_long['COLUMN'].str[:3].map({calendar.month_abbr[i].upper() : i for i in range(1,13)})
-            df_long['TYPE'] = df_long['COLUMN'].str[3:]  # Remaining characters for the type
-            df_long['row'] = df_long.groupby(['STUDENTNO', 'MONTH', 'TYPE']).cumcount()
-            # Pivot payment columns so that the new table has columns: [PAYMENT_ID, STUDENT_ID, MONTH, 'PAY', 'DATE']
-            df_pivot = df_long.pivot(index=['STUDENTNO','MONTH', 'row'], columns='TYPE', values='VALUE').rename_axis(columns=None).reset_index()
-            df_pivot = df_pivot[['STUDENTNO', 'MONTH', 'PAY', 'DATE', 'BILL']]
-            # Add year column
-            df_pivot['YEAR'] = int(df_pivot['DATE'].str[:4].mode()[0])
-
-            # When payment is 0 and BILL = '*', this indicates a payment is owed.
-            # Create records in a new table 'bill' to represent owed payments
-            bill_df = df_pivot.loc[((df_pivot['PAY'] == 0) | (pd.isna(df_pivot['PAY']))) & (df_pivot['BILL'] == '*')
-                             ].loc[:,['STUDENTNO', 'MONTH', 'YEAR']
-                             ].reset_index(drop=True)
-            bill = pd.concat([bill, bill_df], ignore_index=True)
-            # Also add REGFEE bills from STUD tables to `bill`
-            regfee_bills = STUD.loc[STUD['REGBILL'] == '*', ['STUDENTNO']].assign(MONTH=13, YEAR=year)
-            bill = pd.concat([bill, regfee_bills], ignore_index=True)
-            # move to current year before next loop
-            year += 1
+        ### CLASSES ###
+        classes = build_classes(clsbymon)
+
+        ### CLASS_STUDENT ###
+        class_student = build_class_student(STUD00, clsbymon)
+
+        ### WAITLIST ###
+        if 'wait' in do_not_load:
+            wait = storage.load('wait')
+        else:
+            wait = build_wait(clsbymon)
+
+        ### TRIAL ###
+        if 'trial' in do_not_load:
+            trial = storage.load('trial')
+        else:
+            trial = build_trial(clsbymon)
+
+        ### NOTES ###
+        if 'note' in do_not_load:
+            note = storage.load('note')
+        else:
+            note = build_note(STUD00, clsbymon)
 
-            # All remaining records with non-zero payments are saved to 'payment'
-            payment = pd.concat([payment, df_pivot[((df_pivot['PAY'] != 0) & (~pd.isna(df_pivot['PAY'])))
-                       ].reset_index(drop=True)], ignore_index=True)
+        ### PAYMENT and BILL ###
+        # Combine payments/bills for both years (waiting for the worker processes to finish, if necessary)
+        if executor is not None:
+            payment_bill = [task.result() for task in payment_bill]
+        payment = pd.concat([payment_df for payment_df, _ in payment_bill], ignore_index=True)
+        bill = pd.concat([bill_df for _, bill_df in payment_bill], ignore_index=True)
 
         # Get STUDENT_ID from 'student'
         payment = student[['STUDENT_ID','STUDENTNO']].merge(payment, how='right', on='STUDENTNO')
@@ -180,7 +444,7 @@ def transform_to_rdb(data_path, save_to_path, do_not_load=[], update_active=Fals
             inactive_students = student.loc[(~student['STUDENT_ID'].isin(paid_students)) & (~student['STUDENT_ID'].isin(billed_students)),'STUDENT_ID'].drop_duplicates()
         # Otherwise, get active student status from current version of `student.csv`
         else:
-            inactive_students = pd.read_csv(os.path.join(save_to_path,'student.csv'))
+            inactive_students = storage.load('student')
             inactive_students = inactive_students.loc[~inactive_students['ACTIVE'],'STUDENT_ID'].drop_duplicates()
 
         # Declare 'ACTIVE' students as those who are NOT present in the `inactive_students` list.
@@ -195,163 +459,7 @@ def transform_to_rdb(data_path, save_to_path, do_not_load=[], update_active=Fals
         #                         how='left', on='STUDENT_ID')
         # student['ACTIVE'] = np.where(student['PAY']>0,True,student['ACTIVE'])
         # student = student.drop(columns=['PAY'])
-        
-        ### CLASSES ###
-        # Keep the first 11 columns from 'clsbymon', and FINAL column (CLASS_ID)
-        classes = clsbymon.iloc[:,list(range(11)) + [clsbymon.shape[1]-1]].copy()
-        # Timestamp columns (placeholder)
-        classes.insert(len(classes.columns),'CREA_TMS',[datetime.now()]*classes.shape[0])
-        classes.insert(len(classes.columns),'UPDT_TMS',[datetime.now()]*classes.shape[0])
-
-
-        ### CLASS_STUDENT ###
-        # Table to connect student with classes
-        class_student = pd.DataFrame()
-        
-        # Go through each instructor/daytime combination, then join with 'clsbymon' to get corresponding CLASS_ID
-        # (if the instructor/daytime does not exist in clsbymon, then no record is created in 'class_student')
-        for teach_col, daytime_col in list(zip(['INSTRUCTOR', 'INST2', 'INST3'], ['DAYTIME','DAYTIME2','DAYTIME3'])):
-            # Get students who have instructor
-            students_with_class = STUD00.loc[~pd.isna(STUD00[teach_col])
-                                    ].loc[:, ['STUDENT_ID', teach_col, daytime_col]
-                                    ].rename(columns={teach_col : 'TEACH', daytime_col : 'CLASSTIME'})
-            # Join to get CLASS_ID, then append
-            class_student = pd.concat([class_student, students_with_class.merge(clsbymon[['CLASS_ID','TEACH','CLASSTIME']],
-                                                                                how='inner', on=['TEACH','CLASSTIME']
-                                                    ).loc[:, ['CLASS_ID','STUDENT_ID']]], ignore_index=True)
-
-        # Sort values
-        class_student = class_student.sort_values(by=['CLASS_ID', 'STUDENT_ID'])
-
 
-        ### WAITLIST ###
-        # Extract waitlist 
-        columns = ['CLASS_ID'] + [col for i in range(1, 5) for col in (f'WAIT{i}', f'W{i}PHONE')]
-        wait_df = clsbymon[columns]
-
-        # Step 1: Reshape the DataFrame using melt
-        df_long = wait_df.melt(id_vars=['CLASS_ID'], var_name='variable', value_name='value')
-
-        # Add ranking column to ensure rows are sorted properly within each class
-        col_name_to_rank = {**{f'WAIT{i}'   : (2*(i-1)+1) for i in range(1,5)},
-                            **{f'W{i}PHONE' : (2*i)       for i in range(1,5)}}
-        df_long['COL_RANK'] = df_long['variable'].map(col_name_to_rank)
-        df_long = df_long.sort_values(by=['CLASS_ID', 'COL_RANK'])
-
-        # Add column to remember which waitlist each row corresponds to
-        # (this is necessary for compatibility with DBF files)
-        df_long['WAIT_NO'] = df_long['variable'].str.extract('(\\d+)')
-
-        # Step 2: Extract TYPE from the column names
-        df_long['TYPE'] = np.where(df_long['variable'].str.contains('WAIT'), 'NAME', 'PHONE')
-
-        # Step 3: Group data by CLASS_ID and column type for alignment
-        df_long['row'] = df_long.groupby(['CLASS_ID','TYPE']).cumcount()
-
-        # Step 4: Pivot the table to align DATE, NAME, and PHONE
-        df_pivot = df_long.pivot(index=['CLASS_ID', 'WAIT_NO', 'row'], columns='TYPE', values='value')
-        df_pivot.columns.name = None
-        df_pivot = df_pivot.reset_index()
-
-        # Step 5: Drop the helper index, reorder columns, and create 'TRIAL_ID'
-        wait = df_pivot[['CLASS_ID', 'WAIT_NO', 'NAME', 'PHONE']]
-
-        # Finally, keep only the rows which have some data
-        wait = wait.dropna(how='all', subset=['NAME','PHONE']).reset_index(drop=True)
-        wait.insert(0, 'WAIT_ID', wait.index + 1)
-        # Timestamp columns (placeholder)
-        wait.insert(len(wait.columns),'CREA_TMS',[datetime.now()]*wait.shape[0])
-        wait.insert(len(wait.columns),'UPDT_TMS',[datetime.now()]*wait.shape[0])
-
-
-        ### TRIAL ###
-        trial = pd.DataFrame()
-        if 'trial' in do_not_load:
-            trial = pd.read_csv(os.path.join(save_to_path,'trial.csv'))
-        else:
-            columns = ['CLASS_ID'] + [col for i in range(1, 9) for col in (f'TRIAL{i}', f'T{i}PHONE', f'T{i}DATE')]
-            trial_df = clsbymon[columns]
-
-            # Step 1: Reshape the DataFrame using melt
-            df_long = trial_df.melt(id_vars=['CLASS_ID'], var_name='variable', value_name='value')
-
-            # Add ranking column to ensure rows are sorted properly within each class
-            col_name_to_rank = {**{f'TRIAL{i}'  : (i + (2*i - 2)) for i in range(1,9)},
-                                **{f'T{i}PHONE' : (i + (2*i - 1)) for i in range(1,9)},
-                                **{f'T{i}DATE'  : (i + (2*i - 0)) for i in range(1,9)}}
-            df_long['COL_RANK'] = df_long['variable'].map(col_name_to_rank)
-            df_long = df_long.sort_values(by=['CLASS_ID', 'COL_RANK'])
-
-            # Add column to remember which trial each row corresponds to
-            # (this is necessary for compatibility with DBF files, where the trials
-            # do not necessarily need to be edited in order, i.e. it is common for trials 7/8
-            # to have data while all the other trials are blank, and we need to preserve this ordering)
-            df_long['TRIAL_NO'] = df_long['variable'].str.extract('(\\d+)')
-
-            # Step 2: Extract TYPE from the column names
-            df_long['TYPE'] = np.where(df_long['variable'].str.contains('TRIAL'), 'NAME', np.where(
-                                    df_long['variable'].str.contains('PHONE'), 'PHONE', 'DATE'
-                                    ))
-
-            # Step 3: Group data by CLASS_ID and column type for alignment
-            df_long['row'] = df_long.groupby(['CLASS_ID','TYPE']).cumcount()
-
-            # Step 4: Pivot the table to align DATE, NAME, and PHONE
-            df_pivot = df_long.pivot(index=['CLASS_ID', 'TRIAL_NO', 'row'], columns='TYPE', values='value')
-            df_pivot.columns.name = None
-            df_pivot = df_pivot.reset_index()
-
-            # Step 5: Drop the helper index, reorder columns, and create 'TRIAL_ID'
-            trial = df_pivot[['CLASS_ID', 'TRIAL_NO', 'NAME', 'PHONE', 'DATE']]
-
-            # Finally, keep only the rows which have some data
-            trial = trial.dropna(how='all', subset=['NAME','PHONE','DATE']).reset_index(drop=True)
-            trial.insert(0, 'TRIAL_ID', trial.index + 1)
-            # Timestamp columns (placeholder)
-            trial.insert(len(trial.columns),'CREA_TMS',[datetime.now()]*trial.shape[0])
-            trial.insert(len(trial.columns),'UPDT_TMS',[datetime.now()]*trial.shape[0])
-
-
-        ### NOTES ###
-        note = pd.DataFrame()
-        if 'note' in do_not_load:
-            note = pd.read_csv(os.path.join(save_to_path,'note.csv'))
-        else:
-            # Column names for student notes (3 placeholder columns)
-            note_cols = [f'NOTE{i}' for i in range(1,4)]
-            # Extract student notes, dropping rows where all three note columns are blank
-            student_note = STUD00[['STUDENT_ID'] + note_cols].dropna(subset=note_cols, how='all')
-            # Combine all the non-blank notes into a single column, separating each note
-            # with a newline so they will display the same as the old program
-            student_note['NOTE_TXT'] = student_note[note_cols].apply(
-                lambda x: '\n'.join(x.dropna().astype(str)), axis=1
-            )
-            # Drop the old columns
-            student_note = student_note.drop(columns=note_cols)
-
-            # Column names for class notes (3 placeholder columns)
-            note_cols = [f'NOTE{i}' for i in range(1,5)]
-            # Extract student notes, dropping rows where all four note columns are blank
-            class_note = clsbymon[['CLASS_ID'] + note_cols].dropna(subset=note_cols, how='all')
-            # Combine all the non-blank notes into a single column, separating each note
-            # with a newline so they will display the same as the old program
-            class_note['NOTE_TXT'] = class_note[note_cols].apply(
-                lambda x: '\n'.join(x.dropna().astype(str)), axis=1
-            )
-            # Drop the old columns
-            class_note = class_note.drop(columns=note_cols)
-
-            # Add blank CLASS_ID to 'stud_note' and blank STUDENT_ID to 'class_note' so we can combine them
-            student_note.insert(0, 'CLASS_ID', [pd.NA]*student_note.shape[0])
-            class_note.insert(0, 'STUDENT_ID', [pd.NA]*class_note.shape[0])
-
-            # Create final table `note` which contains both student and class notes
-            note = pd.concat([student_note, class_note], axis=0).sort_values(by=['STUDENT_ID', 'CLASS_ID'])
-            note.insert(0, 'NOTE_ID', list(range(1, note.shape[0]+1)))
-            # Timestamp columns (placeholder)
-            note.insert(len(note.columns),'CREA_TMS',[datetime.now()]*note.shape[0])
-            note.insert(len(note.columns),'UPDT_TMS',[datetime.now()]*note.shape[0])
-        
         # Write to csv files if option chosen
         if write_to_csv:
             for df, csv_name in zip([guardian, student, payment, bill, classes, class_student, wait, trial, note],
@@ -360,11 +468,188 @@ def transform_to_rdb(data_path, save_to_path, do_not_load=[], update_active=Fals
                 if csv_name.split('.')[0] in do_not_load:
                     continue
                 else:
-                    df.to_csv(save_to_path + '\\' + csv_name, index=False)
+                    storage.save(csv_name.split('.')[0], df)
+
+        return {'guardian'      : guardian,
+                'student'       : student,
+                'payment'       : payment,
+                'bill'          : bill,
+                'classes'       : classes,
+                'class_student' : class_student,
+                'wait'          : wait,
+                'trial'         : trial,
+                'note'          : note}
 
     except FileNotFoundError as err:
         print(f"File '{err.args[0]}' not found at {data_path}.")
 
+# Hash every record of the DBF files in `dbf_tables`, so that the next time the program starts we can tell
+# exactly which records were changed by the old program. Returns a dictionary of DBF name -> Series
+# of hashes (one per record), indexed by the key column in `DBF_KEYS`.
+def record_hashes(dbf_tables):
+    return {name : hash_records(name, dbf_tables[name]) for name in DBF_KEYS.keys()}
+
+# Hash the records in `df` from the DBF file `name` (i.e. 'STUD00'), as a Series indexed by the key column
+def hash_records(name, df):
+    # Use the same records as `transform_to_rdb` (records without names are ignored).
+    # ACTIVE is maintained by this program (not the old one), so it is left out of the hash
+    if name in ('STUD00', 'STUD99'):
+        df = prepare_stud(df).drop(columns=['STUDENT_ID', 'ACTIVE'], errors='ignore')
+    # A numeric column switches between integers and floats when a blank is added/removed,
+    # so hash all numbers as floats (otherwise every record in the file would look changed)
+    df = df.astype({col : 'float64' for col in df.select_dtypes('number').columns})
+    return pd.Series(pd.util.hash_pandas_object(df, index=False).values, index=df[DBF_KEYS[name]].values)
+
+# Update the tables produced by a previous run of `transform_to_rdb` (i.e. loaded from the snapshot) to match
+# the current DBF files, only re-creating the rows for the DBF records whose hashes changed since `old_hashes`
+# were taken. `payment_years` holds the year of the payments in STUD00/STUD99 (see `payment_year`), which
+# must be the same as when the tables were built.
+# Returns None if the changes can't be patched in (records deleted/reordered, new families, renamed classes, etc.)
+# in which case the tables must be rebuilt from scratch with `transform_to_rdb`.
+def patch_rdb(tables, dbf_tables, old_hashes, new_hashes, payment_years, do_not_load=[]):
+    STUD00 = prepare_stud(dbf_tables['STUD00'])
+    STUD99 = prepare_stud(dbf_tables['STUD99'])
+    clsbymon = dbf_tables['clsbymon']
+
+    # Payments for both years must be told apart by YEAR
+    if payment_years['STUD00'] == payment_years['STUD99']:
+        return None
+
+    # Compare record hashes to find changed, added and removed records
+    changed, added, removed = {}, {}, {}
+    for name in DBF_KEYS.keys():
+        old, new = old_hashes.get(name), new_hashes[name]
+        if old is None or new.index.hasnans or new.index.has_duplicates:
+            return None
+        common = new.index.intersection(old.index)
+        changed[name] = common[new[common].values != old[common].values]
+        added[name] = new.index.difference(old.index)
+        removed[name] = old.index.difference(new.index)
+
+    # Removing or reordering students changes every STUDENT_ID after that point,
+    # and adding/removing classes changes which students are enrolled in which class
+    old_keys, new_keys = old_hashes['STUD00'].index, new_hashes['STUD00'].index
+    if len(removed['STUD00']) > 0 or not new_keys[:len(old_keys)].equals(old_keys):
+        return None
+    if len(added['clsbymon']) > 0 or len(removed['clsbymon']) > 0:
+        return None
+    # If most of the records changed, it is faster to start over
+    if len(changed['STUD00']) + len(added['STUD00']) > STUD00.shape[0] / 2:
+        return None
+
+    student = tables['student']
+    guardian = tables['guardian']
+    classes = tables['classes']
+
+    ## Students
+    student_rows = STUD00[STUD00['STUDENTNO'].isin(changed['STUD00'].union(added['STUD00']))]
+    # Map (MOMNAME, DADNAME, LNAME) -> FAMILY_ID for the existing families
+    parents = guardian.groupby(['FAMILY_ID', 'RELATION'])['FNAME'].first().unstack().reindex(columns=['MOM','DAD'])
+    last_names = guardian.groupby('FAMILY_ID')['LNAME'].first()
+    family_lookup = {(mom, dad, last_names[family_id]) : family_id
+                     for family_id, mom, dad in zip(parents.index, parents['MOM'].fillna(''), parents['DAD'].fillna(''))}
+    old_family_ids = dict(zip(student['STUDENTNO'], student['FAMILY_ID']))
+
+    new_family_ids = []
+    for studentno, mom, dad, lname in zip(student_rows['STUDENTNO'], student_rows['MOMNAME'].fillna(''),
+                                          student_rows['DADNAME'].fillna(''), student_rows['LNAME']):
+        # Students with no parent names do not belong to a family
+        family_id = family_lookup.get((mom, dad, lname)) if (mom or dad) else np.nan
+        # New family (would change the FAMILY_ID of other families)
+        if family_id is None:
+            return None
+        # Student moved to another family
+        if studentno in old_family_ids:
+            old_family_id = old_family_ids[studentno]
+            if pd.isna(family_id) != pd.isna(old_family_id) or (not pd.isna(family_id) and family_id != old_family_id):
+                return None
+        new_family_ids.append(family_id)
+
+    # Classes where the instructor/class time changed affect `class_student` for every student in the class
+    class_rows = clsbymon[clsbymon['CLASS_ID'].isin(changed['clsbymon'])]
+    old_classes = classes.set_index('CLASS_ID').loc[class_rows['CLASS_ID'], ['TEACH','CLASSTIME']]
+    if not (old_classes.fillna('').values == class_rows[['TEACH','CLASSTIME']].fillna('').values).all():
+        return None
+
+    # Re-create changed/added student records, keeping ACTIVE status for existing students
+    # (new students are active, same as in `transform_to_rdb`)
+    new_student = build_student(student_rows)
+    new_student.insert(1, 'FAMILY_ID', new_family_ids)
+    old_active = dict(zip(student['STUDENTNO'], student['ACTIVE']))
+    new_student['ACTIVE'] = [bool(old_active.get(studentno, True)) for studentno in new_student['STUDENTNO']]
+    student = pd.concat([student[~student['STUDENTNO'].isin(student_rows['STUDENTNO'])], new_student]
+                        ).sort_values(by='STUDENT_ID').reset_index(drop=True)
+
+    # Guardian contact info comes from the first student record of each family
+    families = build_families(STUD00)
+    family_keys = pd.MultiIndex.from_frame(families[['MOMNAME','DADNAME','LNAME']])
+    affected_family_ids = set(new_family_ids)
+    affected_keys = [key for key, family_id in family_lookup.items() if family_id in affected_family_ids]
+    for _, family in families[family_keys.isin(affected_keys)].iterrows():
+        family_id = family_lookup[(family['MOMNAME'], family['DADNAME'], family['LNAME'])]
+        guardian.loc[guardian['FAMILY_ID'] == family_id, ['PHONE','EMAIL']] = [family['PHONE'] or np.nan, family['EMAIL'] or np.nan]
+
+    ## Payments and bills
+    payment, bill = tables['payment'], tables['bill']
+    student_ids = student[['STUDENT_ID','STUDENTNO']]
+    for name, STUD, regfee_year in [('STUD99', STUD99, CURRENT_SESSION.year - 1), ('STUD00', STUD00, CURRENT_SESSION.year)]:
+        keys = changed[name].union(added[name]).union(removed[name])
+        if len(keys) == 0:
+            continue
+        year = payment_years[name]
+        ids = student_ids.loc[student_ids['STUDENTNO'].isin(keys), 'STUDENT_ID']
+        # Drop the old records for these students, then re-create them from the DBF file
+        payment = payment[~(payment['STUDENT_ID'].isin(ids) & (payment['YEAR'] == year))]
+        bill = bill[~(bill['STUDENT_ID'].isin(ids) & (((bill['YEAR'] == year) & (bill['MONTH'] <= 12))
+                                                    | ((bill['YEAR'] == regfee_year) & (bill['MONTH'] == 13))))]
+        payment_df, bill_df = build_payment_bill(STUD[STUD['STUDENTNO'].isin(keys)], year, regfee_year)
+        payment = pd.concat([payment, student_ids.merge(payment_df, how='right', on='STUDENTNO').drop(columns='STUDENTNO')], ignore_index=True)
+        bill = pd.concat([bill, student_ids.merge(bill_df, how='right', on='STUDENTNO').drop(columns='STUDENTNO')], ignore_index=True)
+
+    # Waitlist/trial/note records for changed classes (and students) are re-created and given new IDs
+    def replace_rows(df, new_rows, id_col, mask):
+        next_id = int(df[id_col].max()) + 1 if df.shape[0] else 1
+        new_rows[id_col] = range(next_id, next_id + new_rows.shape[0])
+        return pd.concat([df[~mask], new_rows]).reset_index(drop=True)
+
+    class_student, wait, trial, note = tables['class_student'], tables['wait'], tables['trial'], tables['note']
+
+    ## Class enrollment
+    if student_rows.shape[0] > 0:
+        class_student = pd.concat([class_student[~class_student['STUDENT_ID'].isin(student_rows['STUDENT_ID'])],
+                                   build_class_student(student_rows, clsbymon)]
+                                  ).sort_values(by=['CLASS_ID', 'STUDENT_ID']).reset_index(drop=True)
+
+    ## Classes, waitlists and trials
+    if class_rows.shape[0] > 0:
+        class_order = {class_id : i for i, class_id in enumerate(clsbymon['CLASS_ID'])}
+        classes = pd.concat([classes[~classes['CLASS_ID'].isin(class_rows['CLASS_ID'])], build_classes(class_rows)]
+                            ).sort_values(by='CLASS_ID', key=lambda x: x.map(class_order)).reset_index(drop=True)
+
+        if 'wait' not in do_not_load:
+            wait = replace_rows(wait, build_wait(class_rows), 'WAIT_ID', wait['CLASS_ID'].isin(class_rows['CLASS_ID'])
+                                ).sort_values(by='CLASS_ID', kind='stable').reset_index(drop=True)
+
+        if 'trial' not in do_not_load:
+            trial = replace_rows(trial, build_trial(class_rows), 'TRIAL_ID', trial['CLASS_ID'].isin(class_rows['CLASS_ID'])
+                                 ).sort_values(by='CLASS_ID', kind='stable').reset_index(drop=True)
+
+    ## Notes
+    if 'note' not in do_not_load and (student_rows.shape[0] > 0 or class_rows.shape[0] > 0):
+        note = replace_rows(note, build_note(student_rows, class_rows), 'NOTE_ID',
+                            note['STUDENT_ID'].isin(student_rows['STUDENT_ID']) | note['CLASS_ID'].isin(class_rows['CLASS_ID']))
+
+    return {**tables,
+            'guardian'      : guardian,
+            'student'       : student,
+            'payment'       : payment,
+            'bill'          : bill,
+            'classes'       : classes,
+            'class_student' : class_student,
+            'wait'          : wait,
+            'trial'         : trial,
+            'note'          : note}
+
 # Validate if the user entry is a number (used for numeric fields)
 # This will run every time a key is pressed, so that if the user tries to enter
 # a letter or other invalid character, nothing happens
@@ -383,6 +668,14 @@ def validate_float(action, value_if_allowed, prior_value, text):
     else:
         return True
 
+# Dates are stored as datetime64 in the tables, and are only converted to/from text in the format "MM/DD/YYYY"
+# when they are shown to the user (labels, entry boxes) or entered by the user.
+def format_date(value):
+    return '' if pd.isna(value) else value.strftime('%m/%d/%Y')
+
+def parse_date(date_text):
+    return None if date_text is None or len(date_text) == 0 else datetime.strptime(date_text, '%m/%d/%Y')
+
 # Validate that a date field is entered in the correct format "MM/DD/YYYY"
 def validate_date(date_text):
     try:
@@ -432,12 +725,6 @@ def validate_entryboxes(dbf_table, confirm_button, entry_boxes, error_frame, wai
             if field in cols_to_ignore:
                 continue
 
-            try:
-                field_info = dbf_table.field_info(field)
-            except dbf.exceptions.FieldMissingError:
-                print(f'{field} not found in DBF')
-                field_info = dbf_table.field_info('T1DATE')
-
             # Get user-entered value, ignoring whitespace at start and end
             proposed_value = entry.get().strip()
             dtype = entry.dtype
@@ -454,20 +741,10 @@ def validate_entryboxes(dbf_table, confirm_button, entry_boxes, error_frame, wai
             
             ## Data Validation ##
 
-            # If length of user entry is beyond max limit in dbf file, display error
-            if ((dtype == 'datetime.date' and not fn.validate_date(proposed_value))
-                or (dtype == 'float' and (len(str(proposed_value)) == 0 or float(proposed_value) > 999.99))
-                or ((dtype in ('string', 'int')) and (len(str(proposed_value)) > field_info.length))):
-
-                # Set error message for date fields
-                if dtype == 'datetime.date':
-                    error_txt = f'Error: {field} must be entered in standard date format (MM/DD/YYYY).'
-                elif dtype == 'float':
-                    error_txt = f'Error: {field} must be a number between 0 and 999.99'
-                # Set error message for string fields
-                else:
-                    error_txt = f'Error: {field} cannot be longer than {field_info.length} characters.'
-
+            # Check the user entry against the type/length of this field in the dbf file (see `DBFTable.validate`),
+            # and display an error if it is not valid
+            error_txt = dbf_table.validate(field, proposed_value, dtype)
+            if error_txt is not None:
                 error_labels.append(ctk.CTkLabel(error_frame,
                                                     text=error_txt,
                                                     text_color='red',
@@ -815,7 +1092,7 @@ def edit_info(edit_frame, labels, edit_type, year=CURRENT_SESSION.year):
     # Finally, if we have made changes to payments or class info, we should update the information displaying in the class info frame
     # (This step ensures that selected student is added/removed from their class if user added/deleted a payment for current month)
     if 'PAYMENT' in edit_type or 'CLASS' in edit_type:
-        info_frame.window.screens['Classes'].search_results_frame.update_labels(select_first_result=False)
+        info_frame.window.refresh_class_search()
 
 # Move to next entry box
 def jump_to_entry(event, direction):
@@ -1,5 +1,10 @@
 import customtkinter as ctk
 import functions as fn
+import threading
+import queue
+import traceback
+from tkinter import messagebox
+from database import STUDENT_SCREEN_TABLES, CLASS_SCREEN_TABLES
 
 # Widgets
 from widgets.class_info_frame import ClassInfoFrame
@@ -29,26 +34,100 @@ class STMNU(ctk.CTk):
         # Loading screen
         self.load_screen = ctk.CTkFrame(self)
         self.load_screen.columnconfigure(0,weight=1)
-        self.load_screen.rowconfigure((0,1),weight=1)
+        self.load_screen.rowconfigure((0,1,2),weight=1)
         self.load_screen.grid(row=0, column=0, sticky='nsew')
         title_label = ctk.CTkLabel(self.load_screen, text='Gymtek Student Menu',
                                    font = ctk.CTkFont('Britannic', 28, 'bold'))
-        loading_label = ctk.CTkLabel(self.load_screen, text='Loading...')
+        self.loading_label = ctk.CTkLabel(self.load_screen, text='Loading...')
+        self.progress_bar = ctk.CTkProgressBar(self.load_screen, width=300)
+        self.progress_bar.set(0)
         title_label.grid(row=0, column=0, sticky='s')
-        loading_label.grid(row=1, column=0, sticky='n')
+        self.loading_label.grid(row=1, column=0, sticky='s')
+        self.progress_bar.grid(row=2, column=0, sticky='n', pady=10)
 
-        # Force loading screen to render
-        self.update()
-        # Load data and create widgets while loading screen is displayed
-        self.create_main_window()
+        # Load data on a background thread so that the window stays responsive while loading.
+        # The screens are created (on the main thread) as soon as the tables they need are ready.
+        self.screens = {}
+        self.loading = True
+        self.load_queue = queue.Queue()
+        threading.Thread(target=self.load_database, daemon=True).start()
+        self.after(50, self.check_loading)
 
         # Exit protocol
         self.protocol("WM_DELETE_WINDOW", self.exit_program)
 
-    def create_main_window(self):
-        # Load data
-        self.database.load_data()
+    # Load the database (runs on a background thread). Widgets can only be used from the main thread,
+    # so progress and results are passed back through `load_queue` (see `check_loading`)
+    def load_database(self):
+        try:
+            # Reading/transforming the data is the first 60% of the progress bar
+            self.database.load_data(progress=lambda text, fraction: self.load_queue.put(('progress', text, 0.6*fraction)))
+            # Load the tables for each screen, then tell the main thread to create that screen
+            tables = STUDENT_SCREEN_TABLES + CLASS_SCREEN_TABLES
+            for screen, screen_tables in [('Students', STUDENT_SCREEN_TABLES), ('Classes', CLASS_SCREEN_TABLES)]:
+                for table in screen_tables:
+                    self.load_queue.put(('progress', f'Loading {table}...', 0.6 + 0.4*tables.index(table)/len(tables)))
+                    getattr(self.database, table)
+                self.load_queue.put(('screen', screen))
+        except Exception:
+            self.load_queue.put(('error', traceback.format_exc()))
+
+    # Check for messages from `load_database`, and update the window accordingly
+    def check_loading(self):
+        while not self.load_queue.empty():
+            message = self.load_queue.get()
+            if message[0] == 'progress':
+                # (Loading screen is destroyed once the Students screen is created)
+                if 'Students' not in self.screens:
+                    self.loading_label.configure(text=message[1])
+                    self.progress_bar.set(message[2])
+            elif message[0] == 'screen':
+                if message[1] == 'Students':
+                    self.create_main_window()
+                    # Changes can be made as soon as the Students screen exists (even if the class
+                    # tables fail to load), so start saving checkpoints and checking the DBF writer now
+                    self.schedule_checkpoint()
+                    self.check_dbf_writer()
+                else:
+                    self.create_class_screen()
+                    self.loading = False
+            elif message[0] == 'error':
+                print(message[1])
+                if 'Students' not in self.screens:
+                    self.loading_label.configure(text='Error loading data.')
+                self.loading = False
+
+        if self.loading:
+            self.after(50, self.check_loading)
+
+    # Save the changed tables in the background every `database.checkpoint_minutes` minutes (see `StudentDatabase.checkpoint`)
+    def schedule_checkpoint(self):
+        if self.database.checkpoint_minutes:
+            self.after(int(self.database.checkpoint_minutes*60*1000), self.run_checkpoint)
+
+    def run_checkpoint(self):
+        self.database.checkpoint()
+        self.schedule_checkpoint()
+
+    # Check whether the DBF writer has stopped because writing a change to the DBF files failed
+    # (i.e. the file is locked by the old program), and ask the user whether to try again or skip that change
+    def check_dbf_writer(self):
+        if self.database.dbf_writer.error is not None:
+            self.ask_dbf_retry()
+        self.after(500, self.check_dbf_writer)
+
+    def ask_dbf_retry(self):
+        name, error = self.database.dbf_writer.error
+        retry = messagebox.askretrycancel(title='Error Saving to DBF Files',
+                                          message=f'Could not save the changes from {name} to the DBF files:\n\n{error}\n\n'
+                                                  'Click Retry to try again, or Cancel to skip these changes '
+                                                  '(the changes are still saved in the new program).')
+        if retry:
+            self.database.dbf_writer.retry()
+        else:
+            self.database.dbf_writer.skip()
 
+    def create_main_window(self):
         self.columnconfigure(0, weight=1)
         self.rowconfigure(0, weight=1)
         self.rowconfigure(1, weight=10)
@@ -61,13 +140,8 @@ class STMNU(ctk.CTk):
         self.create_screens() 
 
     # Create the different screens that the user will navigate amongst
+    # (the Classes screen is added later by `create_class_screen`, once the class tables are loaded)
     def create_screens(self):
-        self.screens = {}
-        # Class Info (like the class menu from dBASE program)
-        self.screens['Classes'] = ClassInfoFrame(window=self,
-                                                 master=self.main_frame,
-                                                 database=self.database)
-        self.screens['Classes'].grid(row=0,column=0, sticky='nsew')
         # Student Info (like the screen you see in dBASE after searching for a student)
         self.screens['Students'] = StudentInfoFrame(window=self,
                                                     master=self.main_frame,
@@ -110,6 +184,27 @@ class STMNU(ctk.CTk):
         # Place menu button and main container into grid
         self.tabs.grid(row=0,column=0,sticky='nsew')
         self.main_frame.grid(row=1,column=0, sticky='nsew')
+        # Start program maximized
+        self.state('zoomed')
+
+    # Create the Class Info screen (like the class menu from dBASE program)
+    def create_class_screen(self):
+        class_screen = ClassInfoFrame(window=self,
+                                      master=self.main_frame,
+                                      database=self.database)
+        class_screen.grid(row=0,column=0, sticky='nsew')
+        # Keep the current screen in view
+        class_screen.lower()
+        # Classes screen is the first tab
+        self.screens = {'Classes' : class_screen, **self.screens}
+        self.tabs.configure(values=list(self.screens.keys()))
+        self.tabs.set(self.active_screen)
+
+    # Refresh the class search results after a change to a student. If the Classes screen
+    # is still loading, there is nothing to refresh (it will be created with the latest data)
+    def refresh_class_search(self):
+        if 'Classes' in self.screens:
+            self.screens['Classes'].search_results_frame.update_labels(select_first_result=False)
 
     # Change the current view to `new_screen`
     def change_view(self, new_screen):
@@ -190,8 +285,13 @@ class STMNU(ctk.CTk):
         # self.wait_variable(wait_var)
         # backup_dialog.update()
         # backup = True if wait_var.get() == 'backup' else False
-        # Export database tables to csv files (in new RDB format)
-        self.database.save_data(backup=False)
+        # Export database tables to csv files (in new RDB format).
+        # If the program is closed before any screen was opened, nothing could have been changed
+        if 'Students' in self.screens:
+            # Wait for the remaining changes to be written to the DBF files
+            while not self.database.dbf_writer.wait():
+                self.ask_dbf_retry()
+            self.database.save_data(backup=False)
 
         # Destroy window/program
         self.destroy()
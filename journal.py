@@ -0,0 +1,120 @@
+# `journal.py`
+#
+# Append-only journal of the changes made to the relational tables while the program is running.
+# The tables themselves are only written out every few minutes and on exit (see `StudentDatabase.checkpoint`),
+# so without the journal a crash or power cut would lose the changes made since the last checkpoint,
+# even though the same changes were already written to the DBF files.
+#
+# Each call to one of the `StudentDatabase` functions which modify the tables (`bill_student`,
+# `update_payment_info`, `enroll_student`, etc.) appends one line to the journal. The line lists every
+# group of rows that the call changed, identified by a key (i.e. the payment for STUDENT_ID/MONTH/YEAR, or
+# the waitlist for CLASS_ID), along with the new values of those rows (no rows means they were deleted).
+# Because the records hold the new values rather than the edits themselves, replaying them is safe even
+# if some of the changes are already present in the tables that were loaded.
+#
+# Every change this program makes to the DBF files is also in the journal, so if the DBF files have not been
+# touched since the last record was written, the saved snapshot plus the journal gives back the exact tables
+# from the end of the last session (see `StudentDatabase.load_data`).
+#
+# When a checkpoint of the tables is taken (see `StudentDatabase.checkpoint`), the journal is moved aside
+# (`rotate`) so that changes made while the checkpoint is being written go into a new journal. The old
+# journal is deleted once the checkpoint has been written (`clear_rotated`).
+
+# Libraries
+import os
+import json
+import pandas as pd
+import schema
+
+# Name of the journal file (stored in the 'rdb_format' folder)
+JOURNAL_NAME = 'journal.jsonl'
+# Added to the name of the journal while a checkpoint of its changes is being written (see `rotate`)
+ROTATED_SUFFIX = '.old'
+
+
+# Create the record for the rows of `table` which match `key` (dictionary of column -> value). `rows` is the
+# dataframe of those rows (found by the caller through the table's indexes, see `StudentDatabase.rows`).
+def change(table, rows, key):
+    return {'table' : table,
+            'key'   : key,
+            'rows'  : json.loads(rows.to_json(orient='records', date_format='iso', date_unit='us'))}
+
+
+# Size and modification time of each of the DBF files in `dbf_paths`
+def dbf_state(dbf_paths):
+    return {name : [os.stat(path).st_size, os.stat(path).st_mtime_ns] for name, path in dbf_paths.items()}
+
+
+# Append the changes made by one call (`name` is the name of the function) to the journal at `path`, along with
+# the state of the DBF files after the call (`dbf_state`). The file is flushed to disk before returning, so the record survives a crash.
+def append(path, name, changes, dbf_state):
+    line = json.dumps({'call' : name, 'changes' : changes, 'dbf' : dbf_state},
+                      default=lambda value: value.item() if hasattr(value, 'item') else str(value))
+    with open(path, 'a') as file:
+        file.write(line + '\n')
+        file.flush()
+        os.fsync(file.fileno())
+
+
+# Read all of the records in the journal at `path` (including the rotated journal, if a checkpoint was never
+# finished). A record which was only partially written (i.e. the power went out while writing it) is ignored,
+# along with anything after it in the same file.
+def read(path):
+    records = []
+    for file_path in (path + ROTATED_SUFFIX, path):
+        if not os.path.isfile(file_path):
+            continue
+        with open(file_path) as file:
+            for line in file:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break
+    return records
+
+
+# Move the journal at `path` aside before a checkpoint is taken, so that new records are written to a new journal.
+# If the last checkpoint was never finished, its journal is still there, so the records are added to the end of it.
+def rotate(path):
+    if not os.path.isfile(path):
+        return
+    rotated_path = path + ROTATED_SUFFIX
+    if os.path.isfile(rotated_path):
+        with open(path) as file, open(rotated_path, 'a') as rotated_file:
+            rotated_file.write(file.read())
+            rotated_file.flush()
+            os.fsync(rotated_file.fileno())
+        os.remove(path)
+    else:
+        os.replace(path, rotated_path)
+
+
+# Delete the rotated journal (after all of the changes in it have been saved)
+def clear_rotated(path):
+    if os.path.isfile(path + ROTATED_SUFFIX):
+        os.remove(path + ROTATED_SUFFIX)
+
+
+# Apply one change (see `change`) to the dataframe `df` and return the new dataframe.
+# If the number of rows is the same, the rows are updated in place; otherwise the old rows are
+# removed and the new rows are added to the end of the table.
+def apply(df, change):
+    rows = schema.apply(pd.DataFrame(change['rows'], columns=[col for col in df.columns if change['rows'] and col in change['rows'][0]]),
+                        change['table'])
+    matched = match(df, change['key'])
+    index = df.index[matched]
+    if len(index) == len(rows):
+        for col in rows.columns:
+            for value in rows[col].unique():
+                schema.add_category(df, col, value)
+            df.loc[index, col] = rows[col].tolist()
+        return df
+    return pd.concat([df.loc[~matched], rows], ignore_index=True)
+
+
+# Boolean mask for the rows of `df` where every column in `key` has the given value
+def match(df, key):
+    mask = pd.Series(True, index=df.index)
+    for col, value in key.items():
+        mask &= (df[col].isna() if value is None else (df[col] == value).fillna(False))
+    return mask
@@ -7,12 +7,14 @@ def main():
                               student_prev_year_dbf_path='C:\\dbase\\gymtek\\STUD99.dbf',
                               clsbymon_dbf_path='C:\\dbase\\gymtek\\clsbymon.dbf',
                               do_not_load=['note','trial','wait'],
-                              update_active=False)
-   # Initialize instance of program
+                              update_active=False,
+                              in_memory=True,
+                              use_snapshot=True,
+                              parallel=True,
+                              checkpoint_minutes=5)
+   # Initialize instance of program (the window is maximized once the data is loaded)
    root = gui.STMNU(database)
 
-   # Start program maximized
-   root.state('zoomed')
    # Start program loop
    root.mainloop()
 
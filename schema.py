@@ -0,0 +1,172 @@
+# `schema.py`
+#
+# Column names and data types for every table in the relational database structure.
+# The same definitions are used when reading the tables (from csv, from the snapshot, or straight
+# from `transform_to_rdb`) and when writing them back to csv, so that every column is parsed in a
+# single pass with a known type instead of letting pandas guess (`convert_dtypes`, `format='mixed'`).
+#
+# Compact types are used where possible to keep memory use down:
+#   - IDs are 32-bit integers ('Int32' allows missing values, i.e. a student without a family)
+#   - Columns with only a handful of distinct values (TEACH, STATE, CITY, RELATION) are categories
+#   - Money is stored as 32-bit floats
+#   - Dates are stored as datetime64
+
+# Libraries
+import os
+import pandas as pd
+
+# Type used for date/timestamp columns
+DATE = 'datetime64[ns]'
+
+SCHEMA = {
+    'guardian'      : {'GUARDIAN_ID' : 'Int32',
+                       'FAMILY_ID'   : 'Int32',
+                       'RELATION'    : 'category',
+                       'FNAME'       : 'string',
+                       'LNAME'       : 'string',
+                       'PHONE'       : 'string',
+                       'EMAIL'       : 'string',
+                       'CREA_TMS'    : DATE,
+                       'UPDT_TMS'    : DATE},
+    'student'       : {'STUDENT_ID'  : 'Int32',
+                       'FAMILY_ID'   : 'Int32',
+                       'CLASS'       : 'string',
+                       'STUDENTNO'   : 'Int32',
+                       'FNAME'       : 'string',
+                       'LNAME'       : 'string',
+                       'BIRTHDAY'    : DATE,
+                       'ENROLLDATE'  : DATE,
+                       'REGFEE'      : 'float32',
+                       'REGFEEDATE'  : DATE,
+                       'REGBILL'     : 'string',
+                       'MONTHLYFEE'  : 'float32',
+                       'BALANCE'     : 'float32',
+                       'PHONE'       : 'string',
+                       'EMAIL'       : 'string',
+                       'ADDRESS'     : 'string',
+                       'CITY'        : 'category',
+                       'STATE'       : 'category',
+                       'ZIP'         : 'Int32',
+                       'CREA_TMS'    : DATE,
+                       'UPDT_TMS'    : DATE,
+                       'ACTIVE'      : 'bool'},
+    'payment'       : {'STUDENT_ID'  : 'Int32',
+                       'MONTH'       : 'Int8',
+                       'PAY'         : 'float32',
+                       'DATE'        : DATE,
+                       'BILL'        : 'string',
+                       'YEAR'        : 'Int16'},
+    'bill'          : {'STUDENT_ID'  : 'Int32',
+                       'MONTH'       : 'Int8',
+                       'YEAR'        : 'Int16'},
+    'classes'       : {'CODE'        : 'string',
+                       'TEACH'       : 'category',
+                       'CLASSTIME'   : 'string',
+                       'CLASSNAME'   : 'string',
+                       'DAYOFWEEK'   : 'Int8',
+                       'TIMEOFDAY'   : 'Int16',
+                       'MAX'         : 'Int16',
+                       'AVAILABLE'   : 'Int16',
+                       'LEVEL'       : 'string',
+                       'ROOM'        : 'string',
+                       'FEE'         : 'float32',
+                       'CLASS_ID'    : 'Int32',
+                       'CREA_TMS'    : DATE,
+                       'UPDT_TMS'    : DATE},
+    'class_student' : {'CLASS_ID'    : 'Int32',
+                       'STUDENT_ID'  : 'Int32'},
+    'wait'          : {'WAIT_ID'     : 'Int32',
+                       'CLASS_ID'    : 'Int32',
+                       'WAIT_NO'     : 'Int8',
+                       'NAME'        : 'string',
+                       'PHONE'       : 'string',
+                       'CREA_TMS'    : DATE,
+                       'UPDT_TMS'    : DATE},
+    'trial'         : {'TRIAL_ID'    : 'Int32',
+                       'CLASS_ID'    : 'Int32',
+                       'TRIAL_NO'    : 'Int8',
+                       'NAME'        : 'string',
+                       'PHONE'       : 'string',
+                       'DATE'        : DATE,
+                       'CREA_TMS'    : DATE,
+                       'UPDT_TMS'    : DATE},
+    'note'          : {'NOTE_ID'     : 'Int32',
+                       'CLASS_ID'    : 'Int32',
+                       'STUDENT_ID'  : 'Int32',
+                       'NOTE_TXT'    : 'string',
+                       'CREA_TMS'    : DATE,
+                       'UPDT_TMS'    : DATE},
+    'makeup'        : {'MAKEUP_ID'   : 'Int32',
+                       'CLASS_ID'    : 'Int32',
+                       'MAKEUP_NO'   : 'Int8',
+                       'NAME'        : 'string',
+                       'DATE'        : DATE,
+                       'CREA_TMS'    : DATE,
+                       'UPDT_TMS'    : DATE},
+}
+
+
+# Names of the date columns in `table`
+def date_columns(table):
+    return [col for col, dtype in SCHEMA[table].items() if dtype == DATE]
+
+
+# Read `table` from the csv file at `path`. Every column is parsed directly into its type from `SCHEMA`
+# (dates are written in ISO format by `write_csv`, so they are parsed with a fixed format).
+def read_csv(table, path):
+    header = pd.read_csv(path, nrows=0).columns
+    dtypes = {col : dtype for col, dtype in SCHEMA[table].items() if col in header and dtype not in (DATE, 'bool')}
+    df = pd.read_csv(path, dtype=dtypes, parse_dates=[col for col in date_columns(table) if col in header], date_format='ISO8601')
+    # Convert anything which didn't parse cleanly (i.e. files written before dates were saved in ISO format)
+    return apply(df, table)
+
+
+# Write `table` to the csv file at `path`, with dates in ISO format. The file is written under a temporary
+# name and then renamed, so an interrupted write leaves the previous version of the file in place.
+def write_csv(df, table, path):
+    to_storage(df, table).to_csv(path + '.tmp', index=False)
+    os.replace(path + '.tmp', path)
+
+
+# Copy of `df` to be saved to disk (csv or snapshot), with every column converted back to its type
+# in `SCHEMA` (rows added while the program is running can change the type of a column)
+def to_storage(df, table):
+    return apply(df.copy(), table)
+
+
+# Convert the columns of `df` to the types listed for `table` in `SCHEMA`. Columns which already
+# have the right type are left alone, so this is cheap for tables read by `read_csv` or from the snapshot.
+def apply(df, table):
+    for col, dtype in SCHEMA[table].items():
+        if col not in df.columns or df[col].dtype == dtype:
+            continue
+        if dtype == DATE:
+            df[col] = parse_dates(df[col]).astype(DATE)
+        elif dtype == 'bool':
+            df[col] = df[col].fillna(False).astype(bool)
+        elif dtype.startswith('Int') or dtype.startswith('float'):
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(dtype)
+        elif dtype == 'category':
+            df[col] = df[col].astype('string').astype('category')
+        else:
+            df[col] = df[col].astype(dtype)
+    return df
+
+
+# Convert `column` to datetime64. Values are parsed with the fixed `format` first; only values
+# which are in some other format fall back to the (much slower) flexible parser.
+def parse_dates(column, format='ISO8601'):
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return column
+    dates = pd.to_datetime(column, errors='coerce', format=format)
+    failed = dates.isna() & column.notna()
+    if failed.any():
+        dates[failed] = pd.to_datetime(column[failed], errors='coerce', format='mixed')
+    return dates
+
+
+# Categorical columns only accept values which are already one of the categories,
+# so add `value` as a category of `df[col]` before it is assigned (if needed)
+def add_category(df, col, value):
+    if isinstance(df[col].dtype, pd.CategoricalDtype) and not pd.isna(value) and value not in df[col].cat.categories:
+        df[col] = df[col].cat.add_categories([value])
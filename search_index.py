@@ -0,0 +1,220 @@
+# `search_index.py`
+#
+# Index of the student names, for the searches on the Students screen (see `StudentDatabase.search_student`
+# and `search_family`), so that a search doesn't have to check (and then sort) every student in the table.
+#
+# The names are kept (in uppercase) in two sorted lists: one ordered by last name then first name, and one ordered
+# by first name then last name. All of the names starting with a given prefix are next to each other in the sorted
+# list, so they are found with a binary search (`bisect`) for where the prefix starts and ends, and come out already
+# in the order they are shown in. Each entry also holds the index label of the student's row in `student`.
+#
+# For names which may be misspelled (in the search, or in the old program), `FuzzyIndex` finds students whose names
+# are close to the search rather than starting with it. Each distinct name is split into trigrams (groups of three
+# letters, i.e. 'SMITH' -> ' SM', 'SMI', 'MIT', 'ITH', 'TH '), and given a Soundex code (which is the same for names
+# that sound alike, i.e. 'SMITH' and 'SMYTHE'). Names are looked up by their trigrams and Soundex code (inverted index),
+# so only the names which share something with the search are scored, instead of every name in the table.
+# The names of the students' guardians are included as well, since their first names are often what is remembered.
+
+# Libraries
+import bisect
+from collections import defaultdict
+
+# Sorts after any character that appears in a name (a string starting with `prefix` is always less than `prefix + END`)
+END = '\uffff'
+
+
+class NameIndex:
+    # Build the index for the `student` table
+    def __init__(self, student):
+        # (FNAME, LNAME) for each index label
+        self.names = {}
+        for label, fname, lname in zip(student.index.tolist(), student['FNAME'].tolist(), student['LNAME'].tolist()):
+            self.names[label] = (upper(fname), upper(lname))
+        # Sorted lists of (LNAME, FNAME, label) and (FNAME, LNAME, label)
+        self.by_last = sorted((lname, fname, label) for label, (fname, lname) in self.names.items())
+        self.by_first = sorted((fname, lname, label) for label, (fname, lname) in self.names.items())
+
+    # Number of students in the index
+    def __len__(self):
+        return len(self.names)
+
+    # Index labels of the students whose last name starts with `last` and first name starts with `first`
+    # (either can be blank), ordered by last name then first name
+    def search(self, last='', first=''):
+        last, first = last.upper(), first.upper()
+        if last or not first:
+            return [label for _, fname, label in prefix_range(self.by_last, last) if fname.startswith(first)]
+        # Only a first name was entered, so the matches have to be put back in last name order
+        return [label for _, _, label in sorted((lname, fname, label) for fname, lname, label in prefix_range(self.by_first, first))]
+
+    # Add the student with index label `label`, or change their name if they are already in the index
+    def set(self, label, fname, lname):
+        if label in self.names:
+            old_fname, old_lname = self.names[label]
+            remove(self.by_last, (old_lname, old_fname, label))
+            remove(self.by_first, (old_fname, old_lname, label))
+        fname, lname = upper(fname), upper(lname)
+        self.names[label] = (fname, lname)
+        bisect.insort(self.by_last, (lname, fname, label))
+        bisect.insort(self.by_first, (fname, lname, label))
+
+
+# Lowest score for a name to count as a match (see `NgramIndex.match`)
+MIN_SCORE = 0.3
+# Names of guardians count for a little less than the student's own names
+GUARDIAN_WEIGHT = 0.9
+# Bonus for a name which sounds the same as the search (same Soundex code)
+SOUNDEX_BONUS = 0.3
+
+
+class FuzzyIndex:
+    # Build the index for the `student` table and the guardians in `guardian` (matched to students by FAMILY_ID)
+    def __init__(self, student, guardian):
+        self.first_names = NgramIndex()
+        self.last_names = NgramIndex()
+        # (FNAME, LNAME) for each index label of `student`
+        self.names = {}
+        for label, fname, lname in zip(student.index.tolist(), student['FNAME'].tolist(), student['LNAME'].tolist()):
+            self.set(label, fname, lname)
+
+        # Index labels of the students in each family
+        families = defaultdict(list)
+        family_ids = student['FAMILY_ID'].dropna()
+        for label, family_id in zip(family_ids.index.tolist(), family_ids.tolist()):
+            families[family_id].append(label)
+        for family_id, fname, lname in zip(guardian['FAMILY_ID'].tolist(), guardian['FNAME'].tolist(), guardian['LNAME'].tolist()):
+            for label in families.get(family_id, []):
+                self.first_names.add(upper(fname), label, GUARDIAN_WEIGHT)
+                self.last_names.add(upper(lname), label, GUARDIAN_WEIGHT)
+
+    # Number of students in the index
+    def __len__(self):
+        return len(self.names)
+
+    # Add the student with index label `label`, or change their name if they are already in the index
+    def set(self, label, fname, lname):
+        if label in self.names:
+            old_fname, old_lname = self.names[label]
+            self.first_names.remove(old_fname, label)
+            self.last_names.remove(old_lname, label)
+        self.names[label] = (upper(fname), upper(lname))
+        self.first_names.add(upper(fname), label)
+        self.last_names.add(upper(lname), label)
+
+    # Index labels of the students whose names are closest to `last`/`first` (either can be blank), best match first.
+    # A student's score is the score of their closest first name plus the score of their closest last name.
+    def search(self, last='', first='', limit=None):
+        scores = defaultdict(float)
+        for index, query in ((self.last_names, last), (self.first_names, first)):
+            if not query.strip():
+                continue
+            best = {}
+            for label, score in index.match(upper(query).strip()).items():
+                best[label] = max(score, best.get(label, 0))
+            for label, score in best.items():
+                scores[label] += score
+        # (Ties are shown in alphabetical order, like the normal search)
+        ranked = sorted(scores, key=lambda label: (-scores[label], self.names[label][1], self.names[label][0], label))
+        return ranked[:limit] if limit else ranked
+
+
+# Inverted index of names (see `FuzzyIndex`): the trigrams and Soundex code of each distinct name,
+# and the students (index labels) who have that name, with the weight of the name for each student
+class NgramIndex:
+    def __init__(self):
+        self.students = defaultdict(dict)
+        self.trigram_names = defaultdict(set)
+        self.soundex_names = defaultdict(set)
+        # Number of trigrams and Soundex code of each name
+        self.trigram_counts = {}
+        self.soundex_codes = {}
+
+    def add(self, name, label, weight=1.0):
+        if not name:
+            return
+        if name not in self.students:
+            name_trigrams = trigrams(name)
+            for trigram in name_trigrams:
+                self.trigram_names[trigram].add(name)
+            self.trigram_counts[name] = len(name_trigrams)
+            self.soundex_codes[name] = soundex(name)
+            self.soundex_names[self.soundex_codes[name]].add(name)
+        self.students[name][label] = max(weight, self.students[name].get(label, 0))
+
+    def remove(self, name, label):
+        self.students.get(name, {}).pop(label, None)
+
+    # Score each student with a name similar to `query` (dictionary of index label -> score). The score of a name is
+    # the share of trigrams it has in common with the query (Dice coefficient, 1.0 for the same name), plus
+    # SOUNDEX_BONUS if it sounds the same. A name which starts with the query also counts as the same name,
+    # so that a partly typed name still finds the whole name.
+    def match(self, query):
+        query_trigrams = trigrams(query)
+        query_soundex = soundex(query)
+        shared = defaultdict(int)
+        for trigram in query_trigrams:
+            for name in self.trigram_names.get(trigram, ()):
+                shared[name] += 1
+        for name in self.soundex_names.get(query_soundex, ()):
+            shared.setdefault(name, 0)
+
+        scores = {}
+        for name, count in shared.items():
+            if name.startswith(query):
+                score = 1.0
+            else:
+                score = 2*count / (len(query_trigrams) + self.trigram_counts[name])
+            if self.soundex_codes[name] == query_soundex:
+                score += SOUNDEX_BONUS
+            if score < MIN_SCORE:
+                continue
+            for label, weight in self.students[name].items():
+                scores[label] = max(score*weight, scores.get(label, 0))
+        return scores
+
+
+# Set of trigrams in `name` (with a space added at the start/end, so that the first/last letters count for more)
+def trigrams(name):
+    padded = f' {name} '
+    return {padded[i:i+3] for i in range(len(padded) - 2)}
+
+
+# Soundex code of `name`: the first letter, followed by the digits for the next three consonant sounds
+SOUNDEX_DIGITS = {letter : digit for letters, digit in [('BFPV', '1'), ('CGJKQSXZ', '2'), ('DT', '3'),
+                                                        ('L', '4'), ('MN', '5'), ('R', '6')] for letter in letters}
+
+def soundex(name):
+    letters = [letter for letter in name if letter.isalpha()]
+    if not letters:
+        return ''
+    code = letters[0]
+    previous = SOUNDEX_DIGITS.get(letters[0], '')
+    for letter in letters[1:]:
+        digit = SOUNDEX_DIGITS.get(letter, '')
+        if digit and digit != previous:
+            code += digit
+        # (H and W don't separate two letters with the same digit, but vowels do)
+        if letter not in 'HW':
+            previous = digit
+    return (code + '000')[:4]
+
+
+# Entries of the sorted list `entries` whose first value starts with `prefix`
+def prefix_range(entries, prefix):
+    if not prefix:
+        return entries
+    start = bisect.bisect_left(entries, (prefix,))
+    end = bisect.bisect_left(entries, (prefix + END,), lo=start)
+    return entries[start:end]
+
+
+# Remove `entry` from the sorted list `entries`
+def remove(entries, entry):
+    position = bisect.bisect_left(entries, entry)
+    if position < len(entries) and entries[position] == entry:
+        del entries[position]
+
+
+# Name in uppercase (missing names are treated as blank)
+def upper(name):
+    return name.upper() if isinstance(name, str) else ''
@@ -0,0 +1,156 @@
+# `snapshot.py`
+#
+# Binary cache of the relational tables (guardian, student, payment, etc.) saved in the Feather
+# columnar format. Each snapshot remembers the size, modification time and content hash of the
+# DBF files it was built from, so that on startup we can skip decoding/transforming the DBF files
+# entirely when nothing has changed since the last run (most mornings the old program is not used overnight).
+#
+# Feather files are read through `pyarrow`. If `pyarrow` is not installed, the cache is simply disabled.
+
+# Libraries
+import os
+import json
+import hashlib
+import pandas as pd
+
+try:
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+# Folder where the snapshot files are stored
+SNAPSHOT_PATH = 'C:\\STMNU2\\data\\snapshot'
+# File which records the DBF fingerprints for the snapshot currently saved in SNAPSHOT_PATH
+MANIFEST_NAME = 'manifest.json'
+
+
+# Check if the snapshot cache can be used on this machine
+def is_available():
+    return feather is not None
+
+
+# Compute a fingerprint (size, modification time, content hash) for the file at `path`.
+# If `previous` is a fingerprint for the same file whose size and modification time have not changed,
+# the content hash is reused instead of re-reading the whole file.
+def fingerprint(path, previous=None):
+    stat = os.stat(path)
+    info = {'size' : stat.st_size, 'mtime' : stat.st_mtime_ns}
+    if previous and previous['size'] == info['size'] and previous['mtime'] == info['mtime']:
+        info['sha256'] = previous['sha256']
+    else:
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024*1024), b''):
+                sha256.update(chunk)
+        info['sha256'] = sha256.hexdigest()
+    return info
+
+
+# Read the manifest for the saved snapshot (returns None if there is no complete snapshot)
+def read_manifest(snapshot_path=SNAPSHOT_PATH):
+    try:
+        with open(os.path.join(snapshot_path, MANIFEST_NAME)) as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+# Check whether the saved snapshot was built from the current versions of the DBF files in `dbf_paths`
+# (dictionary of 'STUD00', 'STUD99', 'clsbymon' -> file path).
+def is_valid(dbf_paths, snapshot_path=SNAPSHOT_PATH):
+    manifest = read_manifest(snapshot_path)
+    if not is_available() or manifest is None:
+        return False
+
+    for name, path in dbf_paths.items():
+        saved = manifest['fingerprints'].get(name)
+        if saved is None or not os.path.isfile(path):
+            return False
+        # Size must match; only hash the file if the modification time has changed
+        # (i.e. the file was opened and saved by the old program, but the data is identical)
+        stat = os.stat(path)
+        if stat.st_size != saved['size']:
+            return False
+        if stat.st_mtime_ns != saved['mtime'] and fingerprint(path)['sha256'] != saved['sha256']:
+            return False
+
+    # Make sure all of the table files are present
+    return all(os.path.isfile(os.path.join(snapshot_path, f'{table}.feather')) for table in manifest['tables'])
+
+
+# Load the tables from the saved snapshot. The files are memory-mapped, so only the pages
+# that are actually used get read from disk.
+def load(snapshot_path=SNAPSHOT_PATH):
+    manifest = read_manifest(snapshot_path)
+    return {table : load_table(table, snapshot_path) for table in manifest['tables']}
+
+
+# Load a single table from the saved snapshot. Some columns come back as read-only views of the
+# memory-mapped file, so the dataframe is copied so that its rows can be edited in place.
+def load_table(table, snapshot_path=SNAPSHOT_PATH):
+    return feather.read_table(os.path.join(snapshot_path, f'{table}.feather'), memory_map=True).to_pandas().copy()
+
+
+# Load the record hashes and payment years saved with the snapshot (see `fn.record_hashes`).
+# Returns (None, None) if the snapshot was saved without them.
+def load_hashes(snapshot_path=SNAPSHOT_PATH):
+    manifest = read_manifest(snapshot_path)
+    if manifest is None or not manifest.get('hashes'):
+        return None, None
+    hashes = {}
+    for name in manifest['hashes']:
+        df = feather.read_table(os.path.join(snapshot_path, f'{name}.hashes.feather')).to_pandas()
+        hashes[name] = pd.Series(df['HASH'].values, index=df['KEY'].values)
+    return hashes, manifest['payment_years']
+
+
+# Save `tables` (dictionary of table name -> dataframe) as the new snapshot, keyed on the current
+# versions of the DBF files in `dbf_paths`. Optionally, the per-record hashes of the DBF files that the tables
+# were built from (`record_hashes`) and the payment years of STUD00/STUD99 (`payment_years`) are saved as well,
+# so that the next run can patch in only the records which changed (see `fn.patch_rdb`).
+# The tables listed in `keep` have not changed, so the files already saved for them are kept as they are.
+def save(tables, dbf_paths, record_hashes=None, payment_years=None, keep=(), snapshot_path=SNAPSHOT_PATH):
+    if not is_available():
+        return
+    os.makedirs(snapshot_path, exist_ok=True)
+    previous = read_manifest(snapshot_path)
+    previous_fingerprints = previous['fingerprints'] if previous else {}
+
+    # Remove the manifest first, so that a snapshot which is only partially written is never considered valid
+    manifest_path = os.path.join(snapshot_path, MANIFEST_NAME)
+    if os.path.isfile(manifest_path):
+        os.remove(manifest_path)
+
+    for table, df in tables.items():
+        table_path = os.path.join(snapshot_path, f'{table}.feather')
+        feather.write_feather(arrow_safe(df), table_path + '.tmp')
+        os.replace(table_path + '.tmp', table_path)
+
+    for name, hashes in (record_hashes or {}).items():
+        feather.write_feather(pd.DataFrame({'KEY' : hashes.index, 'HASH' : hashes.values}),
+                              os.path.join(snapshot_path, f'{name}.hashes.feather'))
+
+    manifest = {'tables'        : list(tables.keys()) + list(keep),
+                'fingerprints'  : {name : fingerprint(path, previous_fingerprints.get(name)) for name, path in dbf_paths.items()},
+                'hashes'        : list(record_hashes.keys()) if record_hashes else [],
+                'payment_years' : payment_years}
+    with open(manifest_path + '.tmp', 'w') as file:
+        json.dump(manifest, file)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+
+# Feather requires every column to hold a single type. Columns edited during runtime can end up with
+# mixed values (i.e. timestamps appended to a column of date strings read from csv), so convert
+# any mixed columns to a single type before saving.
+def arrow_safe(df):
+    df = df.reset_index(drop=True)
+    for col in df.columns:
+        if df[col].dtype != 'object':
+            continue
+        inferred = pd.api.types.infer_dtype(df[col], skipna=True)
+        # (Columns with no values are saved as floats, the same as reading them from csv)
+        if inferred in ('integer', 'floating', 'mixed-integer-float', 'decimal', 'empty'):
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+        elif inferred not in ('string', 'boolean', 'datetime', 'datetime64', 'date'):
+            df[col] = df[col].map(lambda value: value if pd.isna(value) else str(value))
+    return df
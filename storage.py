@@ -0,0 +1,157 @@
+# `storage.py`
+#
+# Where the relational tables ('rdb_format') are stored between runs of the program.
+#
+#   - `CSVStorage` keeps each table in its own csv file (`<table>.csv`), and rewrites the whole file on every save.
+#   - `SQLiteStorage` keeps all of the tables in a single SQLite database file, with indexes on the key columns
+#     and ID columns that rows are looked up by. Saves only replace the rows which changed (all in one transaction),
+#     and each table is read on its own when it is first needed.
+#
+# Both have the same functions (`exists`, `load`, `save`, `files`), so `StudentDatabase` and `transform_to_rdb`
+# don't need to know which one is used (see `open_storage`).
+
+# Libraries
+import os
+import sqlite3
+from contextlib import closing, contextmanager
+import pandas as pd
+import schema
+
+# Columns which identify the rows of each table. These are indexed, but not declared as a primary key: the
+# same key can appear more than once (i.e. a STUDENTNO repeated in STUD00), and every row must still be kept.
+KEY_COLUMNS = {'guardian'      : ['GUARDIAN_ID'],
+               'student'       : ['STUDENT_ID'],
+               'payment'       : ['STUDENT_ID', 'YEAR', 'MONTH'],
+               'bill'          : ['STUDENT_ID', 'YEAR', 'MONTH'],
+               'classes'       : ['CLASS_ID'],
+               'class_student' : ['CLASS_ID', 'STUDENT_ID'],
+               'wait'          : ['WAIT_ID'],
+               'trial'         : ['TRIAL_ID'],
+               'note'          : ['NOTE_ID'],
+               'makeup'        : ['MAKEUP_ID']}
+# Columns which get their own index (unless they are already the first column of the key)
+INDEX_COLUMNS = ['STUDENT_ID', 'FAMILY_ID', 'CLASS_ID']
+# SQLite column type for each type in `schema.SCHEMA` (dates are stored as ISO format text, same as the csv files)
+SQL_TYPES = {'Int8' : 'INTEGER', 'Int16' : 'INTEGER', 'Int32' : 'INTEGER', 'bool' : 'INTEGER',
+             'float32' : 'REAL', 'string' : 'TEXT', 'category' : 'TEXT', schema.DATE : 'TEXT'}
+
+
+# Create the storage for the 'rdb_format' folder at `folder`. `kind` is either 'csv' or 'sqlite'.
+# Tables which are not in the SQLite database yet (i.e. the first time it is used) are read from the csv files.
+def open_storage(kind, folder):
+    if kind == 'sqlite':
+        return SQLiteStorage(os.path.join(folder, 'rdb.sqlite'), fallback=CSVStorage(folder))
+    return CSVStorage(folder)
+
+
+class CSVStorage:
+    def __init__(self, folder):
+        self.folder = folder
+
+    # Path of the csv file for `table`
+    def path(self, table):
+        return os.path.join(self.folder, f'{table}.csv')
+
+    def exists(self, table):
+        return os.path.isfile(self.path(table))
+
+    def load(self, table):
+        return schema.read_csv(table, self.path(table))
+
+    # Save `df` as `table`. The csv file is always rewritten as a whole, so `keys` is not used.
+    def save(self, table, df, keys=None):
+        schema.write_csv(df, table, self.path(table))
+
+    # Paths of the files which hold the tables (used for backups)
+    def files(self):
+        return [self.path(table) for table in schema.SCHEMA if self.exists(table)]
+
+
+class SQLiteStorage:
+    def __init__(self, path, fallback=None):
+        self.path = path
+        self.fallback = fallback
+        with self.connect() as connection:
+            for table, columns in schema.SCHEMA.items():
+                definitions = ', '.join(f'"{col}" {SQL_TYPES[dtype]}' for col, dtype in columns.items())
+                # Tables created with a primary key (which silently replaced rows with a repeated key) are copied into a new table without one
+                created = connection.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+                if created is not None and 'PRIMARY KEY' in created[0]:
+                    connection.execute(f'ALTER TABLE {table} RENAME TO {table}_old')
+                    connection.execute(f'CREATE TABLE {table} ({definitions})')
+                    connection.execute(f'INSERT INTO {table} SELECT * FROM {table}_old')
+                    connection.execute(f'DROP TABLE {table}_old')
+                connection.execute(f'CREATE TABLE IF NOT EXISTS {table} ({definitions})')
+                connection.execute(f'CREATE INDEX IF NOT EXISTS {table}_KEY ON {table} ({", ".join(KEY_COLUMNS[table])})')
+                for col in INDEX_COLUMNS:
+                    if col in columns and KEY_COLUMNS[table][0] != col:
+                        connection.execute(f'CREATE INDEX IF NOT EXISTS {table}_{col} ON {table} ("{col}")')
+            connection.execute('CREATE TABLE IF NOT EXISTS saved_tables (name TEXT PRIMARY KEY)')
+
+    # Open a connection to the database. Used as `with self.connect() as connection:`, which commits
+    # everything done inside the block as one transaction (or rolls it all back if there is an error).
+    # A new connection is opened each time, since saves can run on a background thread.
+    @contextmanager
+    def connect(self):
+        with closing(sqlite3.connect(self.path)) as connection, connection:
+            yield connection
+
+    # Check whether `table` has been saved to the database
+    def exists(self, table, connection=None):
+        if connection is None:
+            with self.connect() as connection:
+                return self.exists(table, connection)
+        return connection.execute('SELECT 1 FROM saved_tables WHERE name = ?', (table,)).fetchone() is not None
+
+    def load(self, table):
+        if not self.exists(table) and self.fallback is not None:
+            return self.fallback.load(table)
+        with self.connect() as connection:
+            df = pd.read_sql(f'SELECT * FROM {table}', connection)
+        return schema.apply(df, table)
+
+    # Save `df` as `table`. If `keys` is given (list of dictionaries of column -> value, see `StudentDatabase.log_change`),
+    # only the rows matching those keys are replaced (all of the rows matching any key are deleted, then the matching
+    # rows of `df` are inserted); otherwise the whole table is replaced.
+    def save(self, table, df, keys=None):
+        df = schema.to_storage(df, table)
+        columns = [col for col in schema.SCHEMA[table] if col in df.columns]
+        insert = f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})'
+        with self.connect() as connection:
+            if keys is None or not self.exists(table, connection):
+                connection.execute(f'DELETE FROM {table}')
+                connection.executemany(insert, rows(df, columns))
+            else:
+                # Keys with the same columns are handled together (one pass over `df` for each set of columns)
+                matched = [False] * len(df)
+                for key_columns, key_values in group_keys(keys).items():
+                    where = ' AND '.join(f'"{col}" IS ?' for col in key_columns)
+                    connection.executemany(f'DELETE FROM {table} WHERE {where}', key_values)
+                    matched = [row_matched or values in key_values for row_matched, values in zip(matched, rows(df, key_columns))]
+                connection.executemany(insert, rows(df[matched], columns))
+            connection.execute('INSERT OR IGNORE INTO saved_tables (name) VALUES (?)', (table,))
+
+    # The database file holds every table (used for backups)
+    def files(self):
+        return [self.path]
+
+
+# Group `keys` (list of dictionaries of column -> value) by their columns: dictionary of
+# (columns) -> set of (values), with the values as Python objects (missing values as None, same as `rows`)
+def group_keys(keys):
+    groups = {}
+    for key in keys:
+        values = tuple(None if pd.isna(value) else value.item() if hasattr(value, 'item') else value for value in key.values())
+        groups.setdefault(tuple(key), set()).add(values)
+    return groups
+
+
+# Values of `columns` in each row of `df` as Python objects (missing values as None, dates as ISO format text)
+def rows(df, columns):
+    values = []
+    for col in columns:
+        column = df[col]
+        if pd.api.types.is_datetime64_any_dtype(column):
+            column = column.astype('string')
+        values.append(column.astype(object).where(column.notna(), None).tolist())
+    return list(zip(*values))
@@ -424,39 +424,11 @@ class ClassInfoFrame(ctk.CTkFrame):
         # Currently selected class
         self.id = class_id
 
-        header_info = self.database.classes[self.database.classes['CLASS_ID'] == class_id].squeeze()
-
-        roll_info = self.database.class_student[(self.database.class_student['CLASS_ID'] == class_id)
-                            ].merge(self.database.student[self.database.student['ACTIVE']],
-                                    how='inner',
-                                    on='STUDENT_ID'
-                            ).merge(self.database.payment[((self.database.payment['MONTH'] == CURRENT_SESSION.month)
-                                                          & (self.database.payment['YEAR'] == CURRENT_SESSION.year))],
-                                    how='left',
-                                    on='STUDENT_ID'
-                            ).loc[:,['PAY','DATE','STUDENT_ID','FAMILY_ID','FNAME','LNAME','BIRTHDAY']]
-        # Create 'PAID' which is true if student has a non-zero payment for the current month/year
-        roll_info['PAID'] = roll_info['PAY'] > 0
-        # Get `bill_info` as all the bill records for students in `roll_info`
-        bill_info = self.database.bill.merge(roll_info, how='inner', on='STUDENT_ID'
-                                     ).loc[:,['STUDENT_ID','MONTH','YEAR']]
-        # Create 'BILLED' which is true if student has been billed for the current month/year
-        # (since they have a bill record, someone has confirmed that the student
-        # is attending and plans to pay; therefore they will take up a spot in the class)
-        roll_info['BILLED'] = roll_info['STUDENT_ID'].isin(bill_info.loc[((bill_info['MONTH']==CURRENT_SESSION.month)
-                                                                          &(bill_info['YEAR']==CURRENT_SESSION.year)),'STUDENT_ID'].values)
-        
-        # # Create 'BILL_COUNT' which is the number of payments owed by each student in `roll_info`
-        # # (this is simply determined by the number of records that student currently has in the `bill` table)
-        # roll_info = roll_info.merge(self.database.bill.groupby('STUDENT_ID').size().reset_index(name='BILL_COUNT'),
-        #                             how='left',
-        #                             on='STUDENT_ID'
-        #                     ).merge(self.database.bill[self.database.bill['MONTH']==13].groupby('STUDENT_ID').size().reset_index(name='REGFEE_COUNT'),
-        #                             how='left',
-        #                             on='STUDENT_ID'
-        #                     ).fillna(0)
-        roll_info = roll_info.sort_values(by=['PAID','BILLED','LNAME'], ascending=[False,False,True]
-                            ).reset_index(drop=True)
+        header_info = self.database.row('classes', class_id)
+
+        # Active students in the class, and the bills they owe (see `StudentDatabase.class_roll`)
+        roll = self.database.class_roll(class_id)
+        roll_info, bill_info = roll['students'], roll['bills']
         wait_info = self.database.wait[self.database.wait['CLASS_ID'] == class_id
                             ].reset_index(drop=True
                             ).fillna('')
@@ -545,11 +517,10 @@ class ClassInfoFrame(ctk.CTkFrame):
                     # Determine age of student and add to label
                     if self.switches['AGE'].get() == 'show':
                         birthday = roll_info.loc[row-1,'BIRTHDAY']
-                        if pd.isna(birthday) or len(birthday)==0:
+                        if pd.isna(birthday):
                             age_txt += 'N/A'
                         else:
                             today = datetime.today()
-                            birthday = datetime.strptime(birthday, "%m/%d/%Y")
                             age_txt += str(today.year - birthday.year - ((today.month, today.day) < (birthday.month, birthday.day)))
                             age_txt += ' yrs'
 
@@ -560,24 +531,23 @@ class ClassInfoFrame(ctk.CTkFrame):
                             pay_txt += 'BILLED'
                         # Display payment amount if student is paid for current month
                         elif roll_info.loc[row-1,'PAID']:
-                            pay_txt += f"${roll_info.loc[row-1,'PAY']:.2f} ({roll_info.loc[row-1,'DATE']})"
+                            pay_txt += f"${roll_info.loc[row-1,'PAY']:.2f} ({fn.format_date(roll_info.loc[row-1,'DATE'])})"
                         # Otherwise, leave pay label blank
                         else:
                             pass
                             
                     # Add dollar signs ($) after the student's bill label if they owe for previous months
                     # (i.e. if a student has 3 asterisks under 'BILL', 3 dollar signs should display here)
-                    if label.student_id in bill_info['STUDENT_ID'].values:
-                        student_bills = bill_info.loc[bill_info['STUDENT_ID']==label.student_id]
-                        bill_count = student_bills.loc[student_bills['MONTH']!=13].shape[0]
-                        regfee_count = student_bills.loc[student_bills['MONTH']==13].shape[0]
+                    if label.student_id in bill_info:
+                        student_bills = bill_info[label.student_id]
+                        bill_count = sum(1 for month, _ in student_bills if month != 13)
+                        regfee_count = len(student_bills) - bill_count
                         bill_txt += '$'*bill_count + 'R'*regfee_count
                         tooltip_txt = 'Payments owed:'
                         # Create tooltip showing which payments are owed
-                        for bill_idx in range(student_bills.shape[0]):
-                            bill = student_bills.iloc[bill_idx].squeeze()
-                            month = 'Reg Fee' if bill['MONTH']==13 else calendar.month_abbr[bill['MONTH']]
-                            tooltip_txt += f'\n{month} {bill['YEAR']}'
+                        for month, year in student_bills:
+                            month = 'Reg Fee' if month==13 else calendar.month_abbr[month]
+                            tooltip_txt += f'\n{month} {year}'
 
                         self.tooltips.append(ToolTip(bill_label, msg=tooltip_txt, font=ctk.CTkFont('Segoe UI',16)))
 
@@ -643,9 +613,9 @@ class ClassInfoFrame(ctk.CTkFrame):
 
                 trial_name_txt += trial_record['NAME']
                 trial_phone_txt += str(trial_record['PHONE'])
-                trial_date_txt += str(trial_record['DATE'])
+                trial_date_txt += fn.format_date(trial_record['DATE'])
                 # Flag date with red bg if date is either blank or in the past
-                if pd.isna(pd.to_datetime(trial_date_txt)) or (pd.to_datetime(trial_date_txt).date() < datetime.today().date()):
+                if pd.isna(trial_record['DATE']) or (trial_record['DATE'].date() < datetime.today().date()):
                     trial_date_label.cget('font').configure(weight='bold')
                     trial_date_label.configure(text_color='red')
 
@@ -670,7 +640,7 @@ class ClassInfoFrame(ctk.CTkFrame):
                 row_frame.grid()
                 row_color = 'grey65' if row_color=='grey75' else 'grey75'
                 makeup_name_txt += makeup_record['NAME']
-                makeup_date_txt += str(makeup_record['DATE'])
+                makeup_date_txt += fn.format_date(makeup_record['DATE'])
 
             # Update wait labels
             makeup_name_label.configure(text=makeup_name_txt)
@@ -701,7 +671,7 @@ class ClassInfoFrame(ctk.CTkFrame):
         student_search_frame = self.window.screens['Students'].search_results_frame
 
         # Populate student's first/last name into the search fields and perform search
-        student_info = self.database.student.loc[self.database.student['STUDENT_ID'] == student_id].squeeze()
+        student_info = self.database.row('student', student_id)
         student_search_frame.entry_boxes['First Name'].cget('textvariable').set(student_info['FNAME'])
         student_search_frame.entry_boxes['Last Name'].cget('textvariable').set(student_info['LNAME'])
         student_search_frame.search_button.invoke()
@@ -7,6 +7,9 @@ import functions as fn
 # Global variables
 from globals import CURRENT_SESSION
 
+# Time to wait after the user stops typing in a search box before searching (in milliseconds)
+SEARCH_DELAY = 250
+
 # Scrollable frame to display the results from a search 
 class SearchResultsFrame(ctk.CTkFrame):
     def __init__(self, master, type, max_row, **kwargs):
@@ -21,6 +24,12 @@ class SearchResultsFrame(ctk.CTkFrame):
         self.df = pd.DataFrame()
         # Index of currently active result
         self.selection_idx = None
+        # Search waiting to run while the user is typing (see `schedule_search`)
+        self.pending_search = None
+        # Query for the results in `self.df`, used to narrow down those results as the user keeps typing
+        self.last_search = None
+        # (ID, text of each column, flag of each column) for each row of labels currently on screen
+        self.displayed_rows = [None] * max_row
 
         # Configure grid
         self.columnconfigure(0, weight=1)
@@ -79,7 +88,7 @@ class SearchResultsFrame(ctk.CTkFrame):
             ctk.CTkLabel(self.query_frame, text='STUDENT SEARCH', font=ctk.CTkFont('Britannic',18,'bold')
                          ).grid(row=1,column=0,columnspan=2,sticky='nsew',padx=10)
             search_help_text = 'Search for students by first name, last name, or both. '\
-                               'Search results are sorted by last name then first name.'
+                               'Search results are sorted by last name then first name\n(or by closest match, if "Similar Spellings" is checked).'
             ctk.CTkLabel(self.query_frame, text=search_help_text, wraplength=self.query_frame.winfo_reqwidth()
                          ).grid(row=2,column=0,columnspan=2,sticky='nsew',)
 
@@ -94,6 +103,8 @@ class SearchResultsFrame(ctk.CTkFrame):
                 label.grid(row=row, column=0,sticky='e',pady=2)
                 self.entry_boxes[key] = (ctk.CTkEntry(self.query_frame, textvariable=ctk.StringVar()))
                 self.entry_boxes[key].grid(row=row, column=1, sticky='w',pady=2)
+                # Search as the user types
+                self.entry_boxes[key].cget('textvariable').trace_add('write', lambda *args: self.schedule_search())
 
             active_help_text = 'Only "active" students are shown by default.\nClick "Show Inactive" to search entire database.'
             ctk.CTkLabel(self.query_frame, text=active_help_text, wraplength=self.query_frame.winfo_reqwidth()
@@ -101,6 +112,9 @@ class SearchResultsFrame(ctk.CTkFrame):
             # Checkbox to show active students
             self.active_checkbox = ctk.CTkCheckBox(self.query_frame, text='Show Inactive Students', command=self.update_labels)
             self.active_checkbox.grid(row=self.query_frame.grid_size()[1], column=0, columnspan=2,)
+            # Checkbox to find names which are spelled differently (results are sorted by closest match instead)
+            self.fuzzy_checkbox = ctk.CTkCheckBox(self.query_frame, text='Similar Spellings', command=self.update_labels)
+            self.fuzzy_checkbox.grid(row=self.query_frame.grid_size()[1], column=0, columnspan=2,)
             # Button to perform search when clicked 
             self.search_button = ctk.CTkButton(self.query_frame, text='Search', command=self.update_labels)
             self.search_button.grid(row=self.query_frame.grid_size()[1], column=0, columnspan=2)
@@ -210,7 +224,21 @@ class SearchResultsFrame(ctk.CTkFrame):
             # Store row
             self.result_rows.append(row_labels)
 
-    def update_labels(self, select_first_result=True):
+    # Search once the user has stopped typing for `SEARCH_DELAY` milliseconds
+    # (each key press cancels the search waiting from the previous key press)
+    def schedule_search(self):
+        if self.pending_search is not None:
+            self.after_cancel(self.pending_search)
+        self.pending_search = self.after(SEARCH_DELAY, lambda: self.update_labels(refine=True))
+
+    # Update the search results. If `refine` is True (searching as the user types) and the query only adds letters
+    # to the last query, the new results are picked out of the last results instead of searching the whole table.
+    def update_labels(self, select_first_result=True, refine=False):
+        # Any search still waiting to run is out of date now
+        if self.pending_search is not None:
+            self.after_cancel(self.pending_search)
+            self.pending_search = None
+
         if self.type in ['student', 'family']:
             # Get user input
             query = dict.fromkeys(self.entry_boxes.keys())
@@ -222,7 +250,22 @@ class SearchResultsFrame(ctk.CTkFrame):
 
             # Search for matches
             if self.type == 'student':
-                self.df = self.database.search_student(query, show_inactive=self.active_checkbox.get())
+                # (The last results are out of date if the students were changed since, see `StudentDatabase.log_change`)
+                search = {'query'         : {key : value.upper() for key, value in query.items()},
+                          'show_inactive' : self.active_checkbox.get(),
+                          'fuzzy'         : self.fuzzy_checkbox.get(),
+                          'changes'       : self.database.changes['student']}
+                last = self.last_search
+                # (Fuzzy results can't be narrowed down this way, since a longer name can match names the shorter one didn't)
+                if (refine and last is not None and not search['fuzzy']
+                    and all(search[key] == last[key] for key in ('show_inactive', 'fuzzy', 'changes'))
+                    and all(search['query'][key].startswith(last['query'][key]) for key in query.keys())):
+                    self.df = self.df[self.df['FNAME'].str.upper().str.startswith(search['query']['First Name'])
+                                      & self.df['LNAME'].str.upper().str.startswith(search['query']['Last Name'])
+                                      ].reset_index(drop=True)
+                else:
+                    self.df = self.database.search_student(query, show_inactive=search['show_inactive'], fuzzy=search['fuzzy'])
+                self.last_search = search
             elif self.type == 'family':
                 self.df = self.database.search_family(query)
 
@@ -259,12 +302,10 @@ class SearchResultsFrame(ctk.CTkFrame):
             ## Add column for available spots in each class ##
             # Get student count for each class and add to results dataframe
             # (spots are taken by both PAID and BILLED students)
-            payment_info = self.database.payment.loc[(self.database.payment['MONTH'] == CURRENT_SESSION.month)
-                                                    & (self.database.payment['YEAR'] == CURRENT_SESSION.year)
-                                            ].loc[:, ['STUDENT_ID', 'PAY']]
-            bill_info = self.database.bill.loc[(self.database.bill['MONTH'] == CURRENT_SESSION.month)
-                                             & (self.database.bill['YEAR'] == CURRENT_SESSION.year)
-                                            ].assign(BILLED=True)
+            payment_info = self.database.rows('payment', YEAR=CURRENT_SESSION.year, MONTH=CURRENT_SESSION.month
+                                            ).loc[:, ['STUDENT_ID', 'PAY']]
+            bill_info = self.database.rows('bill', YEAR=CURRENT_SESSION.year, MONTH=CURRENT_SESSION.month
+                                            ).assign(BILLED=True)
             class_counts = self.df.merge(self.database.class_student, how='right'
                                  ).merge(payment_info, how='left'
                                  ).merge(bill_info, how='left'
@@ -302,17 +343,26 @@ class SearchResultsFrame(ctk.CTkFrame):
         # Update matches in search results frame
         self.display_search_results(select_first_result)
 
+    # Remove the labels in `row` of the search results from the screen
+    def clear_row(self, row):
+        for label in self.result_rows[row]:
+            # Reset label text and unbind highlight functions
+            label.configure(text='')
+            label.unbind("<Enter>")
+            label.unbind("<Leave>")
+            label.unbind("<Button-1>")
+            # Remove from grid but keep widget in memory (along with its location)
+            label.grid_remove()
+        self.displayed_rows[row] = None
+
     def display_search_results(self, select_first_result=True):
-        # Loop through search result labels
-        for row in self.result_rows:
-            for label in row:
-                # Reset label text and unbind highlight functions
-                label.configure(text='')
-                label.unbind("<Enter>")
-                label.unbind("<Leave>")
-                label.unbind("<Button-1>")
-                # Remove from grid but keep widget in memory (along with its location)
-                label.grid_remove()
+        # Display all rows unless it exceeds max_row
+        row_count = min(self.max_row, self.df.shape[0])
+
+        # Remove the rows past the end of the new results
+        for row in range(row_count, self.max_row):
+            if self.displayed_rows[row] is not None:
+                self.clear_row(row)
 
         # If search results are empty, print message stating no results found,
         # wipe labels in parent frame, and exit function
@@ -320,30 +370,44 @@ class SearchResultsFrame(ctk.CTkFrame):
             first_label = self.result_rows[0][0]
             first_label.configure(text='No matches found.', bg_color='transparent', cursor='arrow')
             first_label.grid()
+            self.displayed_rows[0] = 'No matches found.'
             self.master.update_labels(-1)
             return
 
-        # Display all rows unless it exceeds max_row
-        row_count = min(self.max_row, self.df.shape[0])
+        # Classes which have any past/blank trial dates (only needed for class search results)
+        if 'Trials' in self.headers:
+            # (rows added during this run may leave 'DATE' as objects instead of datetime64, hence `pd.to_datetime`)
+            trial = self.database.trial
+            flagged_trial_classes = set(trial.loc[~(pd.to_datetime(trial['DATE']) >= pd.Timestamp(datetime.now().date())), 'CLASS_ID'])
 
         # Populate search results into labels
+        ids = self.df.filter(like='_ID').iloc[:row_count, 0].tolist()
+        # (Note: we use `col+1` because the first column of `matches` is an ID column)
+        texts = self.df.iloc[:row_count, 1:len(self.headers)+1].values.tolist()
         for row in range(row_count):
             # Get relevant ID column (i.e. student ID, class ID)
-            id = self.df.filter(like='_ID').iloc[row].values[0]
+            id = ids[row]
+            # SPECIAL CASE: make 'trial count' cell RED if there are any past/blank trial dates
+            flags = [self.headers[col] == 'Trials' and id in flagged_trial_classes for col in range(len(self.headers))]
+
+            # If this row already shows the same result, only reset its colors (in case it was the selected row)
+            if self.displayed_rows[row] == (id, texts[row], flags):
+                for label in self.result_rows[row]:
+                    label.configure(bg_color='red' if label.flag else 'transparent',
+                                    text_color='white' if label.flag else 'black')
+                continue
+            if self.displayed_rows[row] is not None:
+                self.clear_row(row)
+            self.displayed_rows[row] = (id, texts[row], flags)
 
             for col in range(len(self.headers)):
                 # Get text from search results and place in label
-                # (Note: we use `col+1` because the first column of `matches` is an ID column)
-                label_txt = self.df.iloc[row,col+1]
+                label_txt = texts[row][col]
                 label = self.result_rows[row][col]
                 # Store relevant ID column as attribute in label
                 label.id = id
-                label.flag = False
-                # SPECIAL CASE: make 'trial count' cell RED if there are any past/blank trial dates
-                if self.headers[col] == 'Trials':
-                    if not (pd.to_datetime(self.database.trial.loc[self.database.trial['CLASS_ID']==id,'DATE']).dt.date.astype('object') >= datetime.now().date()).all():
-                        label.flag = True
-                label.configure(text=label_txt, bg_color='red' if label.flag else 'transparent',
+                label.flag = flags[col]
+                label.configure(text=label_txt, cursor='hand2', bg_color='red' if label.flag else 'transparent',
                                 text_color='white' if label.flag else 'black')
                 label.cget('font').configure(weight='bold' if label.flag else 'normal')
                 # Bind functions to highlight row when mouse hovers over it
@@ -420,19 +420,19 @@ class StudentInfoFrame(ctk.CTkFrame):
         # Update student id
         self.id = student_id
         # Series containing all info for a single student (capitalize all strings for visual appeal)
-        student_info = self.database.student[self.database.student['STUDENT_ID'] == student_id
-                                                 ].squeeze(
-                                                 ).astype('string'
+        student_info = self.database.row('student', student_id)
+        # Dates are shown as "MM/DD/YYYY"
+        for field in ['BIRTHDAY', 'ENROLLDATE', 'REGFEEDATE']:
+            student_info[field] = fn.format_date(student_info[field])
+        student_info = student_info.astype('string'
                                                  ).fillna(''
                                                  ).str.title()
         # Get family ID
         family_id = student_info['FAMILY_ID']
 
         # Dataframe containing payments (for selected year, could be current or previous year)
-        payment_info = self.database.payment[(self.database.payment['STUDENT_ID'] == student_id)
-                                             & (self.database.payment['YEAR'] == self.year)]
-        bill_info = self.database.bill[(self.database.bill['STUDENT_ID'] == student_id)
-                                       & (self.database.bill['YEAR'] == self.year)]
+        payment_info = self.database.rows('payment', STUDENT_ID=student_id, YEAR=self.year)
+        bill_info = self.database.rows('bill', STUDENT_ID=student_id, YEAR=self.year)
 
         # Dataframe containing info for student's guardians
         if family_id == '' or pd.isna(family_id):
@@ -441,8 +441,8 @@ class StudentInfoFrame(ctk.CTkFrame):
             guardian_info = self.database.guardian.loc[self.database.guardian['FAMILY_ID'] == int(family_id)]
 
         # Class info for each class_id
-        class_info = self.database.class_student.loc[self.database.class_student['STUDENT_ID'] == student_id
-                                               ].merge(self.database.classes, on='CLASS_ID', how='left'
+        class_info = self.database.rows('class_student', STUDENT_ID=student_id
+                                               ).merge(self.database.classes, on='CLASS_ID', how='left'
                                                ).sort_values(by='CLASS_ID'
                                                ).reset_index(drop=True
                                                ).loc[:,['CODE','TEACH','CLASSTIME','CLASS_ID']]
@@ -545,7 +545,7 @@ class StudentInfoFrame(ctk.CTkFrame):
                 bill = '*' if row in bill_info['MONTH'].values else ''
             else:
                 pay = f'{payment_info[payment_info['MONTH']==row]['PAY'].values[0]:.2f}'
-                date = payment_info[payment_info['MONTH']==row]['DATE'].values[0]
+                date = fn.format_date(payment_info.loc[payment_info['MONTH']==row, 'DATE'].iloc[0])
                 bill = '*' if row in bill_info['MONTH'].values else ''
 
             month = 'Reg Fee' if row==13 else calendar.month_abbr[row]
@@ -592,7 +592,7 @@ class StudentInfoFrame(ctk.CTkFrame):
         if not visual_only:
             self.database.activate_student(student_id=self.id)
             # Refresh class info frame 
-            self.window.screens['Classes'].search_results_frame.update_labels(select_first_result=False)
+            self.window.refresh_class_search()
 
     # Toggle bill status
     # In the payment_frame, under `bill` column, there will be an asterisk (*) if a payment
@@ -618,7 +618,7 @@ class StudentInfoFrame(ctk.CTkFrame):
         self.database.bill_student(student_id=self.id, month_num=month_num, year=self.year)
 
         # Refresh class info frame 
-        self.window.screens['Classes'].search_results_frame.update_labels(select_first_result=False)
+        self.window.refresh_class_search()
 
     
     # Toggle payment year between current/previous year
@@ -638,13 +638,16 @@ class StudentInfoFrame(ctk.CTkFrame):
         # If the tabs menu is currently disabled, the program is in edit mode, so do nothing
         if self.window.tabs._state == 'disabled':
             return
+        # The Classes screen may still be loading
+        if 'Classes' not in self.window.screens:
+            return
         # Get reference to class search results frame
         class_search_frame = self.window.screens['Classes'].search_results_frame
         # If the class we want to open is not displayed in class search results,
         # we need to modify the filters before we can select it
         if class_id not in class_search_frame.df['CLASS_ID'].values:
             # Populate class instructor / day of week filters
-            class_info = self.database.classes.loc[self.database.classes['CLASS_ID'] == class_id].squeeze()
+            class_info = self.database.row('classes', class_id)
             class_search_frame.filter_dropdowns['INSTRUCTOR'].set(class_info['TEACH'].title())
             class_search_frame.filter_dropdowns['DAY'].set(calendar.day_name[class_info['DAYOFWEEK']-1])
             # Activate/disable filters as necessary
@@ -673,7 +676,7 @@ class StudentInfoFrame(ctk.CTkFrame):
     def create_move_student_dialog(self):
         # In this case, there is only one student label (the currently selected student)
         # But we need to pass it in to MoveStudentDialog as a list containing one label
-        student_info = self.database.student.loc[self.database.student['STUDENT_ID'] == self.id].squeeze()
+        student_info = self.database.row('student', self.id)
         label = ctk.CTkLabel(self, text=f"1. {student_info['FNAME']} {student_info['LNAME']}")
         label.student_id = self.id
         student_labels = [label]
@@ -700,7 +703,7 @@ class StudentInfoFrame(ctk.CTkFrame):
         # If the a student has indeed been added to the database, open the new student's record
         if self.database.student.shape[0] != student_count:
             new_student_id = self.database.student['STUDENT_ID'].max()
-            new_student_record = self.database.student.loc[self.database.student['STUDENT_ID']==new_student_id].squeeze()
+            new_student_record = self.database.row('student', new_student_id)
             self.search_results_frame.entry_boxes['First Name'].cget('textvariable').set(new_student_record['FNAME'])
             self.search_results_frame.entry_boxes['Last Name'].cget('textvariable').set(new_student_record['LNAME'])
             self.search_results_frame.search_button.invoke()